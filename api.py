@@ -0,0 +1,359 @@
+# api.py
+# HTTP/JSON bulk API next to the Telegram front-end, for back-office systems.
+#
+# Runs inside the bot process on the embedded HTTP server and goes through the
+# same machinery as chat jobs: the scheduler's browser capacity, the shared
+# lookup cache, the crawler index, the portal circuit breaker and the job
+# registry. No chat round trips, rate limits or buttons.
+#
+#   POST   /api/jobs                  {"start": N, "end": M, "district": "Agra", "mode": "fetch"|"pipeline"}
+#   GET    /api/jobs                  this client's jobs
+#   GET    /api/jobs/<id>             status and counts
+#   GET    /api/jobs/<id>/results     NDJSON event stream (replayed from the start, then live)
+#   GET    /api/jobs/<id>/pdf/<tp>    a rendered PDF (Range requests supported)
+#   DELETE /api/jobs/<id>             cancel the job and delete its files (202 while it is still stopping)
+#
+# Every call needs "Authorization: Bearer <key>" with a key from API_KEYS.
+
+import asyncio
+import hmac
+import json
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+from typing import AsyncIterator, Dict, Optional
+
+from crawler import get_index
+from http_server import HTTPServer, Request, Response
+from jobs import jobs
+from metrics import Counter
+from portal import OPEN, breaker
+from scan_state import STATE_DIR
+from scheduler import scheduler
+from tracing import job_trace
+
+logger = logging.getLogger("up-mines-bot.api")
+
+API_LISTEN = os.getenv("API_LISTEN", "127.0.0.1")
+API_PORT = int(os.getenv("API_PORT", "0"))                       # 0 disables the API
+API_KEYS = {                                                      # "client:key,client2:key2"
+    key: client
+    for client, _, key in (item.partition(":") for item in os.getenv("API_KEYS", "").replace(" ", "").split(","))
+    if client and key
+}
+API_MAX_JOBS = int(os.getenv("API_MAX_JOBS_PER_CLIENT", "2"))    # concurrent jobs per client
+API_MAX_RANGE = int(os.getenv("API_MAX_RANGE", "100000"))        # numbers per job
+API_JOB_RETENTION = float(os.getenv("API_JOB_RETENTION", "3600"))  # finished jobs are kept this long
+API_DIR = os.path.join(STATE_DIR, "api")
+API_MODES = ("fetch", "pipeline")
+STREAM_CHUNK = 64 * 1024
+
+API_JOBS = Counter("upmines_api_jobs_total", "Bulk API jobs by mode and final state")
+
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+class ApiJob:
+    """One bulk job: its parameters, state and the on-disk NDJSON event log clients stream from."""
+
+    def __init__(self, client: str, start: int, end: int, district: str, mode: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.client = client
+        self.start = start
+        self.end = end
+        self.district = district
+        self.mode = mode
+        self.state = "queued"  # queued | running | done | failed | cancelled
+        self.error: Optional[str] = None
+        self.counts = {"entries": 0, "checked": 0, "eligible": 0, "pdfs": 0}
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.deleted = False  # DELETEd while still stopping; removed as soon as it has
+        self.dir = os.path.join(API_DIR, self.id)
+        self.pdf_dir = os.path.join(self.dir, "pdf")
+        self.events_path = os.path.join(self.dir, "events.ndjson")
+        os.makedirs(self.pdf_dir, exist_ok=True)
+        self._events = open(self.events_path, "a", encoding="utf-8")
+        self.changed = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    def emit(self, event: dict):
+        """Append one event to the log and wake the streams following it."""
+        if self._events.closed:
+            return
+        self._events.write(json.dumps(event, ensure_ascii=False) + "\n")
+        self._events.flush()
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def finish(self, state: str, error: str = None):
+        self.state = state
+        self.error = error
+        self.finished_at = time.time()
+        self.emit({"type": "end", **self.status()})
+        self._events.close()
+        API_JOBS.inc(mode=self.mode, state=state)
+
+    def status(self) -> dict:
+        return {
+            "id": self.id,
+            "state": self.state,
+            "mode": self.mode,
+            "start": self.start,
+            "end": self.end,
+            "district": self.district,
+            "counts": dict(self.counts),
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "results_url": f"/api/jobs/{self.id}/results",
+        }
+
+    def pdf_path(self, tp_num: str) -> Optional[str]:
+        path = os.path.join(self.pdf_dir, f"{tp_num}.pdf")
+        return path if tp_num.isdigit() and os.path.isfile(path) else None
+
+
+class BulkAPI:
+    def __init__(self, keys: Dict[str, str] = None, max_jobs: int = API_MAX_JOBS):
+        self.keys = API_KEYS if keys is None else keys
+        self.max_jobs = max_jobs
+        self.jobs: Dict[str, ApiJob] = {}
+
+    def install(self, server: HTTPServer):
+        server.route("POST", "/api/jobs", self._guard(self.submit))
+        server.route("GET", "/api/jobs", self._guard(self.list_jobs))
+        server.route("GET", "/api/jobs/", self._guard(self.get), prefix=True)
+        server.route("DELETE", "/api/jobs/", self._guard(self.delete), prefix=True)
+
+    # ---------- Handlers ----------
+    def _guard(self, handler):
+        async def handle(request: Request) -> Response:
+            auth = request.headers.get("authorization", "")
+            token = auth[7:] if auth.lower().startswith("bearer ") else ""
+            client = next((c for k, c in self.keys.items() if hmac.compare_digest(k, token)), None)
+            if client is None:
+                return Response.json({"error": "unauthorized"}, 401)
+            return await handler(request, client)
+        return handle
+
+    async def submit(self, request: Request, client: str) -> Response:
+        try:
+            body = request.json() or {}
+            start, end = int(body["start"]), int(body["end"])
+            district = str(body["district"]).strip()
+            mode = body.get("mode", "fetch")
+        except (KeyError, TypeError, ValueError):
+            return Response.json({"error": "expected JSON with integer start/end and a district"}, 400)
+        if mode not in API_MODES or not district or end < start or end - start + 1 > API_MAX_RANGE:
+            return Response.json(
+                {"error": f"mode must be one of {API_MODES}, start <= end, at most {API_MAX_RANGE} numbers"}, 400
+            )
+        if len(jobs.for_user(self._user(client))) >= self.max_jobs:
+            return Response.json(
+                {"error": f"at most {self.max_jobs} concurrent jobs per client"}, 429, headers={"Retry-After": "30"}
+            )
+
+        job = ApiJob(client, start, end, district, mode)
+        self.jobs[job.id] = job
+        jobs.start(self._user(client), f"api_{mode}", job.id, self._run(job), key=job.id)
+        logger.info("API job %s from %s: %s %s-%s %s", job.id, client, mode, start, end, district)
+        return Response.json(job.status(), 202, headers={"Location": f"/api/jobs/{job.id}"})
+
+    async def list_jobs(self, request: Request, client: str) -> Response:
+        return Response.json([job.status() for job in self.jobs.values() if job.client == client])
+
+    async def get(self, request: Request, client: str) -> Response:
+        job_id, _, rest = request.match.partition("/")
+        job = self.jobs.get(job_id)
+        if job is None or job.client != client:
+            return Response.json({"error": "no such job"}, 404)
+        if not rest:
+            return Response.json(job.status())
+        if rest == "results":
+            return Response(self._stream(job), content_type="application/x-ndjson")
+        if rest.startswith("pdf/"):
+            tp_num = rest[4:]
+            path = job.pdf_path(tp_num[:-4] if tp_num.endswith(".pdf") else tp_num)
+            if not path:
+                return Response.json({"error": "no such PDF"}, 404)
+            return await serve_file(request, path, "application/pdf")
+        return Response.json({"error": "not found"}, 404)
+
+    async def delete(self, request: Request, client: str) -> Response:
+        job = self.jobs.get(request.match)
+        if job is None or job.client != client:
+            return Response.json({"error": "no such job"}, 404)
+        running = jobs.find(self._user(client), job.id)
+        if running and not await jobs.cancel(running):
+            # Still unwinding: it may yet write to its directory, so expire() removes it once it has stopped
+            job.deleted = True
+            return Response.json({"id": job.id, "state": "cancelling"}, 202)
+        await asyncio.to_thread(self._remove, job)
+        return Response.json({"id": job.id, "state": job.state})
+
+    # ---------- Jobs ----------
+    @staticmethod
+    def _user(client: str) -> str:
+        """Scheduler/registry identity of an API client (kept apart from Telegram user ids)."""
+        return f"api:{client}"
+
+    async def _run(self, job: ApiJob):
+        from fetch_emm11_data import CONCURRENCY_LIMIT, fetch_emm11_data
+
+        user = self._user(job.client)
+
+        async def on_entry(entry):
+            job.counts["entries"] += 1
+            job.emit({"type": "entry", **dict(entry)})
+
+        async def on_queued(position: int, eta: float):
+            job.emit({"type": "queued", "position": position, "eta_s": round(eta, 1)})
+
+        try:
+            with job_trace(f"api_{job.mode}", user, f"{job.start}-{job.end} {job.district}"):
+                if breaker.state == OPEN:
+                    job.emit({"type": "portal_down"})
+                    await breaker.wait_ready()
+                if job.mode == "pipeline":
+                    from pipeline import PIPELINE_BROWSERS, run_pipeline
+
+                    async def on_checked(tp_num, outcome):
+                        job.counts["checked"] += 1
+                        job.counts["eligible"] += outcome == "unused"
+                        job.emit({"type": "checked", "tp": tp_num, "outcome": outcome})
+
+                    async def on_pdf(tp_num, path):
+                        job.counts["pdfs"] += 1
+                        job.emit({"type": "pdf", "tp": tp_num, "url": f"/api/jobs/{job.id}/pdf/{tp_num}",
+                                  "bytes": os.path.getsize(path)})
+
+                    async with scheduler.slot(
+                        user, "pipeline", size=job.end - job.start + 1,
+                        browsers=CONCURRENCY_LIMIT + PIPELINE_BROWSERS, cpu=1, on_queued=on_queued,
+                        min_browsers=PIPELINE_BROWSERS + 1,
+                    ) as grant:
+                        job.state = "running"
+                        await run_pipeline(
+                            job.start, job.end, job.district, output_dir=job.pdf_dir,
+                            on_entry=on_entry, on_checked=on_checked, on_pdf=on_pdf,
+                            log=lambda msg: job.emit({"type": "log", "message": msg}),
+                            concurrency=grant.browsers - PIPELINE_BROWSERS,
+                        )
+                else:
+                    # Whatever the crawler already indexed is answered from disk, like /start scans
+                    index = get_index()
+                    covered, live = (
+                        await asyncio.to_thread(index.split_range, job.start, job.end)
+                        if index else (None, [(job.start, job.end)])
+                    )
+                    if covered:
+                        for entry in await asyncio.to_thread(index.by_numbers, job.district, *covered):
+                            await on_entry(entry)
+                    if live:
+                        async with scheduler.slot(
+                            user, "fetch", size=sum(b - a + 1 for a, b in live),
+                            browsers=CONCURRENCY_LIMIT, on_queued=on_queued,
+                        ) as grant:
+                            job.state = "running"
+                            for a, b in live:
+                                await fetch_emm11_data(a, b, job.district, data_callback=on_entry,
+                                                       log=logger.info, concurrency=grant.browsers)
+            job.finish("done")
+        except asyncio.CancelledError:
+            job.finish("cancelled")
+            raise
+        except Exception as e:
+            logger.exception("API job %s failed: %s", job.id, e)
+            job.finish("failed", f"{type(e).__name__}: {e}")
+
+    async def _stream(self, job: ApiJob) -> AsyncIterator[bytes]:
+        """The job's events from the first one, following the log until the job ends."""
+        with open(job.events_path, "rb") as f:
+            partial = b""
+            while True:
+                changed, finished = job.changed, job.done
+                data = await asyncio.to_thread(f.read, STREAM_CHUNK)
+                if data:
+                    # Only hand out whole lines; a write may be caught halfway
+                    data, _, partial = (partial + data).rpartition(b"\n")
+                    if data:
+                        yield data + b"\n"
+                    continue
+                if finished:
+                    return
+                await changed.wait()
+
+    def _remove(self, job: ApiJob):
+        self.jobs.pop(job.id, None)
+        shutil.rmtree(job.dir, ignore_errors=True)
+
+    async def expire(self):
+        """Delete finished jobs (and their PDFs) once they are API_JOB_RETENTION seconds old, or DELETEd."""
+        while True:
+            cutoff = time.time() - API_JOB_RETENTION
+            for job in [j for j in self.jobs.values() if j.done and (j.deleted or j.finished_at < cutoff)]:
+                await asyncio.to_thread(self._remove, job)
+            await asyncio.sleep(60)
+
+
+async def serve_file(request: Request, path: str, content_type: str) -> Response:
+    """Serve a file whole, or the single byte range asked for with a Range header."""
+    size = os.path.getsize(path)
+    headers = {"Accept-Ranges": "bytes", "Content-Disposition": f'attachment; filename="{os.path.basename(path)}"'}
+    spec = request.headers.get("range", "")
+    first, last, status = 0, size - 1, 200
+    if spec:
+        m = _RANGE.match(spec.replace(" ", ""))
+        if not m or m.groups() == ("", ""):
+            return Response("", 416, headers={"Content-Range": f"bytes */{size}"})
+        lo, hi = m.groups()
+        if lo:
+            first, last = int(lo), min(int(hi), size - 1) if hi else size - 1
+        else:
+            first = max(0, size - int(hi))  # "bytes=-N": the last N bytes
+        if first > last or first >= size:
+            return Response("", 416, headers={"Content-Range": f"bytes */{size}"})
+        status = 206
+        headers["Content-Range"] = f"bytes {first}-{last}/{size}"
+
+    def read():
+        with open(path, "rb") as f:
+            f.seek(first)
+            return f.read(last - first + 1)
+
+    return Response(await asyncio.to_thread(read), status, content_type, headers)
+
+
+_server: Optional[HTTPServer] = None
+bulk_api = BulkAPI()
+
+
+async def start_api_server(host: str = API_LISTEN, port: int = API_PORT) -> Optional[HTTPServer]:
+    """Serve the bulk API (if API_PORT is set) from this process."""
+    global _server
+    if not port:
+        return None
+    if not bulk_api.keys:
+        logger.warning("API_PORT is set but API_KEYS is empty; the bulk API stays off")
+        return None
+    await asyncio.to_thread(shutil.rmtree, API_DIR, True)  # jobs do not survive a restart
+    _server = HTTPServer(host, port)
+    bulk_api.install(_server)
+    await _server.start()
+    asyncio.create_task(bulk_api.expire())
+    logger.info("Bulk API on http://%s:%s/api/jobs for %d client(s)", host, _server.port, len(set(bulk_api.keys.values())))
+    return _server
+
+
+async def stop_api_server():
+    global _server
+    if _server:
+        await _server.stop()
+        _server = None
@@ -0,0 +1,175 @@
+# bench_pdf.py
+# PDF rendering micro-benchmark: how many TP forms one core renders per second,
+# where the time goes (overlay draw, template merge, write) and how big each
+# PDF is, over fixture field sets. Compares against stored baselines and exits
+# non-zero when throughput or output size regresses beyond a threshold.
+#
+#   python bench_pdf.py --iterations 200
+#   python bench_pdf.py --update-baseline            # after an intended change
+#   python bench_pdf.py --max-slowdown 0.2 --json
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from io import BytesIO
+from typing import Dict, List
+
+from bench_pipeline import TEMPLATE_PATH, percentile
+from pdf_gen import create_qr_image_base64, draw_overlay, merge_template, write_pdf
+from portal import print_url
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(HERE, "bench_pdf_baseline.json")
+PHASES = ("draw", "merge", "write")
+TP_NUM = "31422307030112345"
+
+TYPICAL = {
+    "emM11": TP_NUM,
+    "lessee_id": "LS/AGR/2024/0173",
+    "lessee_name": "M/S Shri Balaji Stone Crusher",
+    "lessee_mobile": "9876543210",
+    "lease_details": "Gata No. 112, Village Rampur, 4.05 Ha",
+    "tehsil": "Kiraoli",
+    "district": "Agra",
+    "qty": "42.50",
+    "mineral": "Sand (Morrang)",
+    "loading_from": "Rampur Ghat",
+    "destination": "Shahganj, Agra",
+    "distance": "38",
+    "generated_on": "14-10-2026 10:42:17",
+    "valid_upto": "15-10-2026 10:42:17",
+    "travel_duration": "6 Hours",
+    "destination_district": "AGRA",
+    "destination_state": "Uttar Pradesh",
+    "pit_value": "1250",
+    "registration_number": "UP80AB1234",
+    "driver_mobile": "9123456780",
+    "vehicle_type": "14 TYRE TRUCK",
+    "driver_dl": "UP8020190012345",
+    "driver_name": "Ramesh Kumar",
+}
+
+FIXTURES = {
+    "typical": dict(TYPICAL),
+    # Wrapped fields at (and past) their three-line limit
+    "long_text": dict(
+        TYPICAL,
+        lessee_name="M/S Shri Maa Vaishno Devi Stone Crusher and Mining Industries Private Limited Partnership Firm",
+        lease_details="Gata No. 112, 113/2, 114 Min, 115 Ka, 116 Kha, Village Rampur Khurd, Pargana Fatehpur "
+                      "Sikri, Tehsil Kiraoli, Area 12.405 Ha, Lease period 01-04-2022 to 31-03-2027",
+        mineral="Sand (Morrang) / Bajri / Boulder mixed with Gitti and Stone Dust",
+    ),
+    "no_qr": dict(TYPICAL),
+    "sparse": {"emM11": TP_NUM, "district": "Agra", "qty": "10"},
+}
+QR_FIXTURES = ("typical", "long_text", "sparse")
+
+
+def prepare_fixtures() -> Dict[str, dict]:
+    qr = asyncio.run(create_qr_image_base64(TP_NUM, print_url(TP_NUM)))
+    return {name: dict(fields, qr_code_base64=qr) if name in QR_FIXTURES else dict(fields)
+            for name, fields in FIXTURES.items()}
+
+
+def bench_fixture(data: dict, iterations: int, warmup: int) -> dict:
+    phases: Dict[str, List[float]] = {phase: [] for phase in PHASES}
+    sizes = []
+    for i in range(warmup + iterations):
+        t0 = time.perf_counter()
+        overlay = draw_overlay(data)
+        t1 = time.perf_counter()
+        writer = merge_template(overlay, TEMPLATE_PATH)
+        t2 = time.perf_counter()
+        out = BytesIO()
+        write_pdf(writer, out)
+        t3 = time.perf_counter()
+        if i < warmup:
+            continue
+        phases["draw"].append(t1 - t0)
+        phases["merge"].append(t2 - t1)
+        phases["write"].append(t3 - t2)
+        sizes.append(out.tell())
+
+    total = sum(sum(samples) for samples in phases.values())
+    return {
+        "renders_per_s": round(iterations / total, 2),
+        "bytes_per_pdf": round(sum(sizes) / len(sizes)),
+        "phases_ms": {
+            phase: {
+                "mean": round(sum(samples) / len(samples) * 1000, 3),
+                "p95": round(percentile(samples, 95) * 1000, 3),
+            }
+            for phase, samples in phases.items()
+        },
+    }
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], max_slowdown: float, max_growth: float) -> List[str]:
+    """Regressions against the baseline, as human-readable lines (empty when within thresholds)."""
+    failures = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        floor = base["renders_per_s"] * (1 - max_slowdown)
+        if result["renders_per_s"] < floor:
+            failures.append(
+                f"{name}: {result['renders_per_s']} renders/s < {floor:.2f} "
+                f"(baseline {base['renders_per_s']}, -{max_slowdown:.0%} allowed)"
+            )
+        ceiling = base["bytes_per_pdf"] * (1 + max_growth)
+        if result["bytes_per_pdf"] > ceiling:
+            failures.append(
+                f"{name}: {result['bytes_per_pdf']} bytes/PDF > {ceiling:.0f} "
+                f"(baseline {base['bytes_per_pdf']}, +{max_growth:.0%} allowed)"
+            )
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF rendering micro-benchmark with regression thresholds")
+    parser.add_argument("--iterations", type=int, default=100, help="renders per fixture")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--fixtures", default=",".join(FIXTURES), help="comma-separated fixture names")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--max-slowdown", type=float, default=0.25, help="allowed drop in renders/s (fraction)")
+    parser.add_argument("--max-growth", type=float, default=0.05, help="allowed growth in bytes/PDF (fraction)")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    fixtures = prepare_fixtures()
+    names = [n for n in args.fixtures.split(",") if n]
+    unknown = [n for n in names if n not in fixtures]
+    if unknown:
+        parser.error(f"unknown fixture(s): {', '.join(unknown)}")
+    results = {name: bench_fixture(fixtures[name], args.iterations, args.warmup) for name in names}
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({name: {k: r[k] for k in ("renders_per_s", "bytes_per_pdf")} for name, r in results.items()},
+                      f, indent=2)
+            f.write("\n")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    failures = compare(results, baseline, args.max_slowdown, args.max_growth)
+
+    if args.json:
+        print(json.dumps({"results": results, "regressions": failures}, indent=2))
+    else:
+        for name, r in results.items():
+            phases = "  ".join(f"{p} {r['phases_ms'][p]['mean']:.2f}ms" for p in PHASES)
+            print(f"{name:<10} {r['renders_per_s']:>8.1f} renders/s  {r['bytes_per_pdf']:>7} B/PDF  {phases}")
+        for line in failures:
+            print(f"REGRESSION {line}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
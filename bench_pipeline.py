@@ -0,0 +1,177 @@
+# bench_pipeline.py
+# Offline end-to-end throughput benchmark against the local mock portal.
+# Reports throughput and p50/p95/p99 latency for the fetch, login/process and
+# PDF stages, so every optimization can be measured reproducibly.
+#
+#   python bench_pipeline.py --count 200 --latency 0.15 --missing 0.1
+#   python bench_pipeline.py --stages fetch --json > bench_output.txt
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+from playwright.async_api import async_playwright
+
+import portal
+from mock_portal import MockPortal, MockPortalConfig
+
+START_NUM = 31422307030112000
+TEMPLATE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "form_template.pdf"))
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile (0 for an empty sample)."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(stage: str, latencies: List[float], wall: float, items: int) -> Dict[str, float]:
+    return {
+        "stage": stage,
+        "items": items,
+        "wall_s": round(wall, 3),
+        "throughput_per_s": round(items / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+# ---------- Stages ----------
+async def bench_fetch(numbers: List[int], district: str, concurrency: int):
+    """Per-number lookups with the same browser-per-number model as fetch_emm11_data."""
+    from fetch_emm11_data import fetch_single_emm11
+
+    latencies: List[float] = []
+    matches: List[dict] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with async_playwright() as playwright:
+        async def one(num):
+            async with semaphore:
+                started = time.perf_counter()
+                result = await fetch_single_emm11(playwright, num, district, log=lambda *_: None)
+                latencies.append(time.perf_counter() - started)
+                if result:
+                    matches.append(result)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(n) for n in numbers))
+        wall = time.perf_counter() - started
+    return summarize("fetch", latencies, wall, len(numbers)), matches
+
+
+async def bench_login_process(numbers: List[int]):
+    """One captcha login, then one eFormC check per TP (latency = gap between TP results)."""
+    from login_to_website import login_to_website
+
+    stamps: List[float] = []
+
+    async def log_callback(msg: str):
+        if "TP Number" in msg or "Unused" in msg or "Failed to process" in msg:
+            stamps.append(time.perf_counter())
+
+    started = time.perf_counter()
+    await login_to_website([{"eMM11_num": n} for n in numbers], log_callback=log_callback)
+    wall = time.perf_counter() - started
+    # The first TP result also covers the login itself; report that separately
+    first = stamps[0] if stamps else started
+    latencies = [b - a for a, b in zip(stamps, stamps[1:])]
+    summary = summarize("process", latencies, wall, len(numbers))
+    summary["login_s"] = round(first - started, 3)
+    return summary
+
+
+async def bench_pdf(numbers: List[int], workdir: str):
+    """Scrape + render one PDF per TP (latency = gap between finished PDFs)."""
+    from pdf_gen import pdf_gen
+
+    stamps: List[float] = []
+    started = time.perf_counter()
+    cwd = os.getcwd()
+    os.chdir(workdir)  # pdf_gen writes into ./pdf
+    try:
+        await pdf_gen(
+            numbers, template_path=TEMPLATE_PATH,
+            send_pdf_callback=lambda path, tp: stamps.append(time.perf_counter()),
+        )
+    finally:
+        os.chdir(cwd)
+    wall = time.perf_counter() - started
+    latencies = [b - a for a, b in zip([started] + stamps, stamps)]
+    summary = summarize("pdf", latencies, wall, len(stamps))
+    sizes = [os.path.getsize(os.path.join(workdir, "pdf", f)) for f in os.listdir(os.path.join(workdir, "pdf"))]
+    summary["avg_pdf_bytes"] = int(sum(sizes) / len(sizes)) if sizes else 0
+    return summary
+
+
+# ---------- Runner ----------
+async def run(args) -> List[Dict[str, float]]:
+    mock = MockPortal(MockPortalConfig(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        missing_density=args.missing, unused_rate=args.unused,
+    ))
+    await mock.start()
+    portal.PORTAL_ROOT = mock.url
+    results = []
+    try:
+        numbers = list(range(args.start, args.start + args.count))
+        district = args.district or mock.district_of(numbers[0])
+        existing = [n for n in numbers if mock.exists(n)]
+        tps = existing[: args.tp_count]
+
+        if "fetch" in args.stages:
+            summary, matches = await bench_fetch(numbers, district, args.concurrency)
+            summary["matches"] = len(matches)
+            results.append(summary)
+        if "process" in args.stages:
+            results.append(await bench_login_process(tps))
+        if "pdf" in args.stages:
+            with tempfile.TemporaryDirectory() as workdir:
+                results.append(await bench_pdf(tps, workdir))
+    finally:
+        await mock.stop()
+    for summary in results:
+        summary["portal_requests"] = mock.requests
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmark against mock_portal")
+    parser.add_argument("--stages", default="fetch,process,pdf")
+    parser.add_argument("--start", type=int, default=START_NUM)
+    parser.add_argument("--count", type=int, default=100, help="eMM11 numbers to scan")
+    parser.add_argument("--tp-count", type=int, default=20, help="TPs for process/pdf stages")
+    parser.add_argument("--district", default="", help="defaults to the first number's district")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.15)
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--missing", type=float, default=0.1)
+    parser.add_argument("--unused", type=float, default=0.5)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+    args.stages = {s.strip() for s in args.stages.split(",") if s.strip()}
+
+    results = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'stage':<8} {'items':>6} {'wall s':>8} {'items/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for r in results:
+        print(
+            f"{r['stage']:<8} {r['items']:>6} {r['wall_s']:>8} {r['throughput_per_s']:>8} "
+            f"{r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# bench_startup.py
+# Startup-time budget: measures how long a cold bot process takes to answer
+# its first /start, and its resident memory at that moment, against the local
+# fake Bot API. Exits non-zero when a budget is exceeded.
+#
+#   python bench_startup.py --runs 3 --budget-seconds 4 --budget-rss-mb 200
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from fake_bot_api import FakeBotAPI
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def rss_mb(pid: int) -> float:
+    """Resident set size of a live process (Linux /proc), in MiB."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def import_time() -> float:
+    """Seconds for a fresh interpreter to `import bot`."""
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import bot"], cwd=HERE, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+async def first_response(warmup: str, timeout: float) -> dict:
+    api = FakeBotAPI()
+    await api.start()
+    env = dict(
+        os.environ,
+        BOT_TOKEN="123:FAKE",
+        BOT_API_BASE_URL=api.base_url,
+        BOT_MODE="polling",
+        METRICS_PORT="0",
+        WARMUP=warmup,
+    )
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "bot.py"], cwd=HERE, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        await api.push(api.make_message(4242, "/start"))
+        await api.wait_for(4242, lambda m: "start number" in m.get("text", ""), timeout=timeout)
+        elapsed = time.perf_counter() - started
+        rss_at_answer = rss_mb(proc.pid)
+        # Let background warm-up (if any) settle to see steady-state memory
+        await asyncio.sleep(3)
+        return {"first_response_s": round(elapsed, 3), "rss_mb": round(rss_at_answer, 1),
+                "rss_after_warmup_mb": round(rss_mb(proc.pid), 1)}
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bot cold-start benchmark")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--warmup", default="imports", choices=("none", "imports", "all"))
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--budget-seconds", type=float, default=0, help="fail if median first response is slower")
+    parser.add_argument("--budget-rss-mb", type=float, default=0, help="fail if RSS at first response is larger")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    imports = [import_time() for _ in range(args.runs)]
+    runs = [asyncio.run(first_response(args.warmup, args.timeout)) for _ in range(args.runs)]
+    result = {
+        "import_bot_s": round(statistics.median(imports), 3),
+        "first_response_s": statistics.median(r["first_response_s"] for r in runs),
+        "rss_mb": max(r["rss_mb"] for r in runs),
+        "rss_after_warmup_mb": max(r["rss_after_warmup_mb"] for r in runs),
+        "warmup": args.warmup,
+    }
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        for key, value in result.items():
+            print(f"{key:<22} {value}")
+
+    failures = []
+    if args.budget_seconds and result["first_response_s"] > args.budget_seconds:
+        failures.append(f"first response {result['first_response_s']}s > {args.budget_seconds}s")
+    if args.budget_rss_mb and result["rss_mb"] > args.budget_rss_mb:
+        failures.append(f"RSS {result['rss_mb']} MiB > {args.budget_rss_mb} MiB")
+    for failure in failures:
+        print(f"❌ budget exceeded: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
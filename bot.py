@@ -4,8 +4,11 @@
 
 import os
 import asyncio
+import importlib
 import logging
 import shutil
+import subprocess
+import sys
 import time
 import uuid
 import nest_asyncio  # for environments where an event loop is already running (e.g., Jupyter)
@@ -22,9 +25,24 @@ from telegram.ext import (
     filters,
 )
 
-from fetch_emm11_data import fetch_emm11_data
-from login_to_website import login_to_website
-from pdf_gen import pdf_gen
+# fetch_emm11_data / login_to_website / pdf_gen (Playwright, EasyOCR, ReportLab)
+# are imported where they are used, or by warm_up() once the bot is answering.
+from scheduler import MAX_BROWSERS, scheduler
+from outbox import outbox
+from webhook import run_webhook, WEBHOOK_WORKERS
+from metrics import Gauge, start_metrics_server
+from tracing import export_chrome_json, get_trace, job_trace, recent_traces
+from session_store import (
+    QUOTA_CHECK_INTERVAL, SESSION_TTL, SessionExpiry, enforce_disk_quota, sweep_orphans,
+)
+from scan_state import get_mark, load_marks, record_scan
+from crawler import get_index, parse_date, run_crawler
+from exporter import EXPORT_FORMATS, ResultExporter
+from result_buffer import ResultBuffer
+from portal import OPEN, PORTAL_DOWN_POLICY, breaker
+from work_queue import SCAN_BACKEND, SCAN_WORKERS, WORKER_BROWSERS, get_work_queue, run_sharded_scan
+from jobs import jobs
+from api import start_api_server, stop_api_server
 
 # Optional: load BOT_TOKEN from .env if available
 try:
@@ -34,15 +52,27 @@ except Exception:
     pass
 
 BOT_TOKEN = os.getenv("BOT_TOKEN", "7933257148:AAHf7HUyBtjQbnzlUqJpGwz0S2yJfC33mqw")
+BOT_MODE = os.getenv("BOT_MODE", "polling")               # "polling" (local dev) or "webhook"
+BOT_API_BASE_URL = os.getenv("BOT_API_BASE_URL", "")      # e.g. http://127.0.0.1:8081/bot for a fake API
+WARMUP = os.getenv("WARMUP", "imports")  # "none", "imports", or "all" (also loads the OCR model)
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if x}
 
 # Conversation states
 ASK_START, ASK_END, ASK_DISTRICT = range(3)
 
+# Buttons that start a job carry the session's data key ("login_process:<key>"):
+# a repeated tap attaches to the job it already started, an outdated one is rejected
+KEYED_ACTIONS = ("continue_scan", "login_process", "generate_pdf")
+STALE_JOB_TEXT = "⌛ A newer search replaced these results before this job started. Use the latest message."
+
 # Per-user in-memory sessions
 # user_sessions[user_id] = {
-#   start, end, district, data[list], tp_num_list[list], user_dir, pdf_dir, lock(asyncio.Lock)
+#   start, end, district, data[ResultBuffer], processed[bool], user_dir, pdf_dir, lock(asyncio.Lock),
+#   data_key, completed[set of job keys], created_at, last_active
 # }
 user_sessions: Dict[int, Dict[str, Any]] = {}
+session_expiry = SessionExpiry(SESSION_TTL)
+Gauge("upmines_sessions", "Active user sessions", callback=lambda: len(user_sessions))
 
 # ---------- Logging ----------
 logging.basicConfig(
@@ -62,11 +92,55 @@ def create_user_dir(user_id: int) -> (str, str): # type: ignore
     return user_dir, pdf_dir
 
 
+def get_session(user_id: int) -> Dict[str, Any]:
+    """Return the user's session, creating a fresh one (with its own folder and lock) if needed."""
+    session = user_sessions.get(user_id)
+    if session is None:
+        user_dir, pdf_dir = create_user_dir(user_id)
+        session = user_sessions[user_id] = {
+            "data": ResultBuffer(os.path.join(user_dir, "results.jsonl")),
+            "processed": False,  # login & process done: every entry's number is a TP for PDFs
+            "user_dir": user_dir,
+            "pdf_dir": pdf_dir,
+            "lock": asyncio.Lock(),
+            "created_at": time.time(),
+        }
+        new_data_key(session)
+    touch_session(user_id)
+    return session
+
+
+def new_data_key(session: Dict[str, Any]):
+    """The session's results changed: buttons built for the previous results become stale."""
+    session["data_key"] = uuid.uuid4().hex[:8]
+    session["completed"] = set()
+
+
+def reset_results(session: Dict[str, Any]):
+    """Drop the session's results before new ones arrive. Needs session["lock"] (or a check that it is
+    free, with no await since): login and PDF jobs read the results lazily while holding it."""
+    session["data"].clear()
+    session["processed"] = False
+    new_data_key(session)
+
+
+def touch_session(user_id: int):
+    """Mark activity so the session's expiry moves SESSION_TTL into the future."""
+    session = user_sessions.get(user_id)
+    if session is not None:
+        session["last_active"] = time.time()
+        session_expiry.touch(user_id)
+
+
 def cleanup_user(user_id: int):
     """Delete session folder and remove from memory."""
     session = user_sessions.pop(user_id, None)
+    session_expiry.forget(user_id)
     if not session:
         return
+    exporter = session.pop("exporter", None)
+    if exporter:
+        exporter.discard()
     folder = session.get("user_dir")
     if folder and os.path.isdir(folder):
         try:
@@ -76,49 +150,184 @@ def cleanup_user(user_id: int):
 
 
 async def safe_send(chat_id: int, context: ContextTypes.DEFAULT_TYPE, text: str):
-    """Send message with safety."""
+    """Send message with safety (through the outbox's rate limits; failures are logged)."""
+    await outbox.send_message(chat_id, text)
+
+
+async def reply(update: Update, text: str, **kwargs):
+    """Answer the user's message through the outbox, so replies share its rate limits."""
+    return await outbox.send_message(update.effective_chat.id, text, **kwargs)
+
+
+async def edit_query(query, text: str, **kwargs):
+    """Edit the message whose button was tapped, through the outbox's rate limits."""
+    return await outbox.edit_message(query.message.chat.id, query.message.message_id, text, **kwargs)
+
+
+async def run_traced(kind: str, user_id: int, label: str, job):
+    """Run a job coroutine function under its own span timeline (see /trace)."""
+    with job_trace(kind, user_id, label) as trace:
+        logger.info("Job %s started for user %s (%s)", trace.id, user_id, label)
+        await job()
+
+
+def start_job(kind: str, user_id: int, label: str, job, key: str = None):
+    """Run a job in the background, traced and tracked so /cancel can stop it."""
+    return jobs.start(user_id, kind, label, run_traced(kind, user_id, label, job), key=key)
+
+
+async def cancel_jobs(user_id: int, chat_id: int) -> str:
+    """Stop the user's running jobs (browsers closed, capacity released) and describe what was stopped."""
+    cancelled = await jobs.cancel_user(user_id)
+    outbox.discard(chat_id)
+    if not cancelled:
+        return ""
+    return "\n".join(["🛑 Stopped:"] + [f"• {job.describe()}" for job in cancelled])
+
+
+def format_entry(entry: dict) -> str:
+    return (
+        f"{entry.get('eMM11_num','')}\n"
+        f"{entry.get('destination_district','')}\n"
+        f"{entry.get('destination_address','')}\n"
+        f"{entry.get('quantity_to_transport','')}\n"
+        f"{entry.get('generated_on','')}"
+    )
+
+
+async def emit_entry(session: Dict[str, Any], chat_id: int, entry: dict):
+    """Stream one scan result: into the export file when /export is on, otherwise to the chat."""
+    exporter = session.get("exporter")
+    if exporter:
+        exporter.write(entry)
+        outbox.progress(chat_id, f"📦 {exporter.rows} entries exported...")
+    else:
+        # Coalesced into a few messages by the outbox; blocks if the chat is backlogged
+        await outbox.put(chat_id, format_entry(entry))
+
+
+def new_exporter(session: Dict[str, Any], fmt: str) -> ResultExporter:
+    district = "".join(c if c.isalnum() else "_" for c in session.get("district", "")) or "all"
+    name = f"emm11_{district}_{time.strftime('%Y%m%d_%H%M%S')}"
+    return ResultExporter(os.path.join(session["user_dir"], "export"), fmt, name=name)
+
+
+async def finish_export(session: Dict[str, Any], chat_id: int, context: ContextTypes.DEFAULT_TYPE):
+    """Close the session's export (if any), upload its parts and delete them."""
+    exporter = session.pop("exporter", None)
+    if not exporter:
+        return
+    outbox.end_progress(chat_id)
+    paths = await asyncio.to_thread(exporter.close)
     try:
-        await context.bot.send_message(chat_id=chat_id, text=text)
+        if not paths:
+            await safe_send(chat_id, context, "📦 Nothing to export.")
+        for i, path in enumerate(paths, 1):
+            await outbox.send_document(
+                chat_id,
+                path,
+                filename=os.path.basename(path),
+                caption=f"📦 {exporter.rows} entries ({exporter.fmt}.gz), part {i}/{len(paths)}",
+            )
     except Exception as e:
-        logger.error("Send message failed: %s", e)
+        logger.error("Uploading export failed: %s", e)
+        await safe_send(chat_id, context, "❌ Failed to upload the export.")
+    finally:
+        await asyncio.to_thread(exporter.discard)
+
+
+async def send_pdf_document(chat_id: int, context: ContextTypes.DEFAULT_TYPE, tp_num: str, pdf_path: str):
+    """Upload one TP's PDF to the chat."""
+    try:
+        await outbox.send_document(chat_id, pdf_path, filename=f"{tp_num}.pdf", caption=f"📎 TP: {tp_num}")
+    except Exception as e:
+        logger.error("Sending PDF failed: %s", e)
+        await safe_send(chat_id, context, "❌ Failed to send PDF.")
+
+
+def fetched_keyboard(session: Dict[str, Any]) -> InlineKeyboardMarkup:
+    key = session["data_key"]
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("⏩ Continue (new numbers only)", callback_data=f"continue_scan:{key}")],
+        [InlineKeyboardButton("🔁 Start Again", callback_data="start_again")],
+        [InlineKeyboardButton("🔐 Login & Process", callback_data=f"login_process:{key}")],
+        [InlineKeyboardButton("❌ Exit", callback_data="exit_process")],
+    ])
+
+
+async def send_generate_prompt(chat_id: int, context: ContextTypes.DEFAULT_TYPE, session: Dict[str, Any]):
+    keyboard = [
+        [InlineKeyboardButton("📄 Generate PDF", callback_data=f"generate_pdf:{session['data_key']}")],
+        [InlineKeyboardButton("❌ Exit", callback_data="exit_process")],
+    ]
+    await outbox.send_message(chat_id, "Click below to generate PDF.", reply_markup=InlineKeyboardMarkup(keyboard))
+
+
+async def send_pdf_list(chat_id: int, context: ContextTypes.DEFAULT_TYPE, session: Dict[str, Any]) -> bool:
+    """Offer a download button per generated PDF; False if there are none."""
+    # Only show buttons for PDFs that really exist
+    keyboard = [
+        [InlineKeyboardButton(f"📎 {tp}.pdf", callback_data=f"pdf_{tp}")]
+        for tp in session["data"].numbers()
+        if os.path.exists(os.path.join(session["pdf_dir"], f"{tp}.pdf"))
+    ]
+    if not keyboard:
+        return False
+    keyboard.append([InlineKeyboardButton("❌ Exit", callback_data="exit_process")])
+    await outbox.send_message(chat_id, "📄 Click to download your PDFs:", reply_markup=InlineKeyboardMarkup(keyboard))
+    return True
+
+
+async def portal_gate(chat_id: int):
+    """Hold a job back while the portal circuit is open: park it (and say so) or fail fast."""
+    if breaker.state != OPEN:
+        return
+    if PORTAL_DOWN_POLICY == "park":
+        outbox.progress(chat_id, "⏸️ The mines portal is down. Your job is parked and will resume automatically.")
+    await breaker.wait_ready()
+
+
+def queue_notifier(chat_id: int, context: ContextTypes.DEFAULT_TYPE, label: str):
+    """Build a scheduler callback that tells the user where their job is in the queue."""
+    async def on_queued(position: int, eta: float):
+        outbox.progress(chat_id, f"⏳ {label} queued: position {position}, ETA ~{int(eta) + 1}s")
+    return on_queued
 
 
 # ---------- Handlers ----------
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     # Init a fresh session container with an asyncio lock to serialize this user's actions
-    if user_id not in user_sessions:
-        user_dir, pdf_dir = create_user_dir(user_id)
-        user_sessions[user_id] = {
-            "data": [],
-            "tp_num_list": [],
-            "user_dir": user_dir,
-            "pdf_dir": pdf_dir,
-            "lock": asyncio.Lock(),
-        }
-    await update.message.reply_text("Welcome! Please enter the start number:")
+    get_session(user_id)
+    await reply(
+        update,
+        "Welcome! Please enter the start number:\n"
+        "(or /continue <district> to fetch only numbers issued since your last scan)"
+    )
     return ASK_START
 
 
 async def ask_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    touch_session(update.effective_user.id)
     try:
         start = int(update.message.text)
         context.user_data["start"] = start
-        await update.message.reply_text("Got it. Now enter the end number:")
+        await reply(update, "Got it. Now enter the end number:")
         return ASK_END
     except ValueError:
-        await update.message.reply_text("⚠️ Please enter a valid number.")
+        await reply(update, "⚠️ Please enter a valid number.")
         return ASK_START
 
 
 async def ask_end(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    touch_session(update.effective_user.id)
     try:
         end = int(update.message.text)
         context.user_data["end"] = end
-        await update.message.reply_text("Now, please enter the district name:")
+        await reply(update, "Now, please enter the district name:")
         return ASK_DISTRICT
     except ValueError:
-        await update.message.reply_text("⚠️ Please enter a valid number.")
+        await reply(update, "⚠️ Please enter a valid number.")
         return ASK_END
 
 
@@ -129,139 +338,405 @@ async def ask_district(update: Update, context: ContextTypes.DEFAULT_TYPE):
     end = context.user_data.get("end")
 
     # Ensure user session exists & has lock
-    if user_id not in user_sessions:
-        user_dir, pdf_dir = create_user_dir(user_id)
-        user_sessions[user_id] = {
-            "data": [],
-            "tp_num_list": [],
-            "user_dir": user_dir,
-            "pdf_dir": pdf_dir,
-            "lock": asyncio.Lock(),
-        }
+    session = get_session(user_id)
 
     # Update session core fields
-    session = user_sessions[user_id]
     session["start"] = start
     session["end"] = end
     session["district"] = district
-    session["data"].clear()
-    session["tp_num_list"].clear()
 
-    await update.message.reply_text(f"🔎 Fetching data for district: {district}...")
+    if session.get("export_format"):
+        session["exporter"] = new_exporter(session, session.pop("export_format"))
+    if session.get("pipeline"):
+        await reply(update, f"⚡ Fetching, checking and generating PDFs for district: {district}...")
+        start_pipeline(user_id, update.effective_chat.id, context, start, end, district)
+        return ConversationHandler.END
+    await reply(update, f"🔎 Fetching data for district: {district}...")
 
     async def send_entry(entry):
-        # Stream entries to the user as they arrive
-        msg = (
-            f"{entry.get('eMM11_num','')}\n"
-            f"{entry.get('destination_district','')}\n"
-            f"{entry.get('destination_address','')}\n"
-            f"{entry.get('quantity_to_transport','')}\n"
-            f"{entry.get('generated_on','')}"
-        )
-        await safe_send(update.effective_chat.id, context, msg)
+        # Stream entries to the user (or the export file) as they arrive
+        await emit_entry(session, update.effective_chat.id, entry)
         session["data"].append(entry)
 
     async def run_fetch():
+        from fetch_emm11_data import fetch_emm11_data, CONCURRENCY_LIMIT
+
+        high_water = 0  # highest issued number seen (any district), the mark /continue resumes after
+
+        def issued(num):
+            nonlocal high_water
+            high_water = max(high_water, num)
+
         try:
-            # Serialize this user's heavy operations
+            # Serialize this user's heavy operations, then wait for global browser capacity
             async with session["lock"]:
-                # Your function must be async; if it's sync, wrap with asyncio.to_thread
-                await fetch_emm11_data(start, end, district, data_callback=send_entry)
+                reset_results(session)
+                session["scanning"] = True
+                try:
+                    # Whatever the background crawler already indexed is answered from disk
+                    index = get_index()
+                    covered, live = await asyncio.to_thread(index.split_range, start, end) if index else (None, [(start, end)])
+                    if covered:
+                        for entry in await asyncio.to_thread(index.by_numbers, district, *covered):
+                            await send_entry(entry)
+                        issued(await asyncio.to_thread(index.highest, *covered) or 0)
+                    if live and SCAN_BACKEND == "queue":
+                        # Sharded across worker processes (worker.py), within the browsers reserved for them
+                        await portal_gate(update.effective_chat.id)
+                        progress = await run_sharded_scan(
+                            live, district, send_entry,
+                            on_progress=lambda p: outbox.progress(
+                                update.effective_chat.id, f"🧩 Shards done: {p['done']}/{p['total']}"
+                            ),
+                        )
+                        issued(progress["high_water"])
+                        if progress["failed"]:
+                            await outbox.put(
+                                update.effective_chat.id,
+                                f"⚠️ {progress['failed']} shard(s) could not be fetched after retries.",
+                            )
+                    elif live:
+                        await portal_gate(update.effective_chat.id)
+                        async with scheduler.slot(
+                            user_id, "fetch",
+                            size=sum(b - a + 1 for a, b in live),
+                            browsers=CONCURRENCY_LIMIT,
+                            on_queued=queue_notifier(update.effective_chat.id, context, "Fetch"),
+                        ) as grant:
+                            for a, b in live:
+                                await fetch_emm11_data(
+                                    a, b, district, data_callback=send_entry, concurrency=grant.browsers,
+                                    on_issued=issued,
+                                )
+                finally:
+                    session["scanning"] = False
+                # Remember how far this district is scanned, for /continue: up to the last number the
+                # portal had issued, not the typed end, or numbers issued after the scan would be skipped
+                await asyncio.to_thread(record_scan, user_id, district, high_water, session["data"])
 
+            outbox.end_progress(update.effective_chat.id)
+            await outbox.flush(update.effective_chat.id)
+            await finish_export(session, update.effective_chat.id, context)
             if session["data"]:
-                keyboard = [
-                    [InlineKeyboardButton("🔁 Start Again", callback_data="start_again")],
-                    [InlineKeyboardButton("🔐 Login & Process", callback_data="login_process")],
-                    [InlineKeyboardButton("❌ Exit", callback_data="exit_process")],
-                ]
-                await context.bot.send_message(
-                    chat_id=update.effective_chat.id,
-                    text="✅ Data fetched. What would you like to do next?",
-                    reply_markup=InlineKeyboardMarkup(keyboard),
+                await outbox.send_message(
+                    update.effective_chat.id,
+                    "✅ Data fetched. What would you like to do next?",
+                    reply_markup=fetched_keyboard(session),
                 )
             else:
                 await safe_send(update.effective_chat.id, context, "⚠️ No data found.")
                 cleanup_user(user_id)
         except Exception as e:
             logger.exception("Fetch failed for user %s: %s", user_id, e)
+            await finish_export(session, update.effective_chat.id, context)  # whatever was fetched
             await safe_send(update.effective_chat.id, context, f"❌ Error while fetching: {e}")
 
     # Run concurrently so other users aren't blocked
-    asyncio.create_task(run_fetch())
+    start_job("fetch", user_id, f"{start}-{end} {district}", run_fetch)
     return ConversationHandler.END
 
 
+def start_pipeline(user_id: int, chat_id: int, context: ContextTypes.DEFAULT_TYPE, start: int, end: int, district: str):
+    """One-shot mode (/pipeline): each match is checked, and each eligible TP's PDF sent, as soon as it is found."""
+    session = get_session(user_id)
+
+    async def on_entry(entry):
+        await emit_entry(session, chat_id, entry)
+        session["data"].append(entry)
+
+    async def on_pdf(tp_num, pdf_path):
+        await outbox.flush(chat_id)  # keep the PDF after the entries that led to it
+        await send_pdf_document(chat_id, context, tp_num, pdf_path)
+
+    async def run_one_shot():
+        from fetch_emm11_data import CONCURRENCY_LIMIT
+        from pipeline import PIPELINE_BROWSERS, run_pipeline
+
+        try:
+            async with session["lock"]:
+                reset_results(session)
+                session["scanning"] = True
+                try:
+                    await portal_gate(chat_id)
+                    # Fetch browsers plus one each for the check and PDF stages, and an OCR slot for the captcha
+                    async with scheduler.slot(
+                        user_id, "pipeline",
+                        size=end - start + 1,
+                        browsers=CONCURRENCY_LIMIT + PIPELINE_BROWSERS,
+                        cpu=1,
+                        on_queued=queue_notifier(chat_id, context, "Pipeline"),
+                        min_browsers=PIPELINE_BROWSERS + 1,
+                    ) as grant:
+                        stats = await run_pipeline(
+                            start, end, district,
+                            output_dir=session["pdf_dir"],
+                            on_entry=on_entry,
+                            on_pdf=on_pdf,
+                            log=lambda msg: outbox.put(chat_id, msg),
+                            concurrency=grant.browsers - PIPELINE_BROWSERS,
+                        )
+                finally:
+                    session["scanning"] = False
+                session["processed"] = True
+                await asyncio.to_thread(record_scan, user_id, district, stats["high_water"], session["data"])
+
+            outbox.end_progress(chat_id)
+            await outbox.flush(chat_id)
+            await finish_export(session, chat_id, context)
+            await enforce_sessions_quota()
+            summary = (
+                f"✅ {stats['matched']} entries found, {stats['eligible']} eligible, "
+                f"{stats['pdfs']} PDFs sent in {stats['wall_s']:.0f}s."
+            )
+            if session["data"]:
+                await outbox.send_message(chat_id, summary, reply_markup=fetched_keyboard(session))
+            else:
+                await safe_send(chat_id, context, "⚠️ No data found.")
+                cleanup_user(user_id)
+        except Exception as e:
+            logger.exception("Pipeline failed for user %s: %s", user_id, e)
+            await finish_export(session, chat_id, context)
+            await safe_send(chat_id, context, f"❌ Error in pipeline: {e}")
+
+    start_job("pipeline", user_id, f"{start}-{end} {district}", run_one_shot)
+
+
+def start_continue(user_id: int, chat_id: int, context: ContextTypes.DEFAULT_TYPE, district: str, mark: dict,
+                   key: str = None):
+    """Fetch only numbers issued after the district's high-water mark and merge with stored results."""
+    session = get_session(user_id)
+    session["district"] = district
+    after = int(mark["high_water"])
+    new_entries = []
+    if session.get("export_format"):
+        session["exporter"] = new_exporter(session, session.pop("export_format"))
+
+    async def send_entry(entry):
+        await emit_entry(session, chat_id, entry)
+        new_entries.append(entry)
+
+    async def run_continue():
+        from fetch_emm11_data import fetch_emm11_since, CONCURRENCY_LIMIT, FORWARD_CHUNK
+
+        try:
+            async with session["lock"]:
+                session["scanning"] = True
+                try:
+                    await portal_gate(chat_id)
+                    async with scheduler.slot(
+                        user_id, "fetch",
+                        size=FORWARD_CHUNK,
+                        browsers=CONCURRENCY_LIMIT,
+                        on_queued=queue_notifier(chat_id, context, "Continue"),
+                    ) as grant:
+                        high_water = await fetch_emm11_since(
+                            after, district, data_callback=send_entry, concurrency=grant.browsers
+                        )
+                finally:
+                    session["scanning"] = False
+                merged = await asyncio.to_thread(record_scan, user_id, district, high_water, new_entries)
+                session["start"], session["end"] = after + 1, high_water
+                reset_results(session)
+                session["data"].extend(merged["results"])
+
+            outbox.end_progress(chat_id)
+            await outbox.flush(chat_id)
+            await finish_export(session, chat_id, context)
+            summary = f"✅ {len(new_entries)} new entries after {after} (scanned up to {high_water})."
+            if session["data"]:
+                await outbox.send_message(
+                    chat_id,
+                    f"{summary}\n📦 {len(session['data'])} entries for {district.upper()} in total. What next?",
+                    reply_markup=fetched_keyboard(session),
+                )
+            else:
+                await safe_send(chat_id, context, f"{summary}\n⚠️ No data found.")
+                cleanup_user(user_id)
+        except Exception as e:
+            logger.exception("Continue scan failed for user %s: %s", user_id, e)
+            await finish_export(session, chat_id, context)
+            await safe_send(chat_id, context, f"❌ Error while fetching: {e}")
+
+    start_job("fetch", user_id, f">{after} {district} (continue)", run_continue, key=key)
+
+
+async def continue_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/continue [district]: scan only numbers issued since the last scan of that district."""
+    user_id = update.effective_user.id
+    district = " ".join(context.args or []).strip()
+    if not district:
+        marks = await asyncio.to_thread(load_marks, user_id)
+        if not marks:
+            await reply(update, "No earlier scans to continue. Use /start to scan a range first.")
+            return
+        district = max(marks, key=lambda d: marks[d].get("updated_at", 0))
+    mark = await asyncio.to_thread(get_mark, user_id, district)
+    if not mark:
+        await reply(update, f"No earlier scan of {district}. Use /start to scan a range first.")
+        return
+    await reply(update, f"⏩ Fetching numbers after {mark['high_water']} for {district}...")
+    start_continue(user_id, update.effective_chat.id, context, district, mark)
+
+
+async def pipeline_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/pipeline [on|off]: one-shot mode, PDFs for eligible TPs are sent while the scan is still running."""
+    session = get_session(update.effective_user.id)
+    arg = (context.args[0].lower() if context.args else "")
+    session["pipeline"] = (arg == "on") if arg in ("on", "off") else not session.get("pipeline")
+    if session["pipeline"]:
+        await reply(
+            update,
+            "⚡ Pipeline mode on: your next /start scan logs in, checks every entry and sends the PDF "
+            "of each eligible TP as soon as it is found."
+        )
+    else:
+        await reply(update, "Pipeline mode off: scans stop after fetching, as before.")
+
+
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     user_id = query.from_user.id
-    await query.answer()
+    chat_id = query.message.chat.id
 
     session = user_sessions.get(user_id)
     if not session:
-        await query.edit_message_text("⚠️ Session expired. Please start again with /start.")
+        await query.answer()
+        await edit_query(query, "⚠️ Session expired. Please start again with /start.")
         return
+    touch_session(user_id)
 
-    if query.data == "start_again":
-        await query.edit_message_text("🔁 Restarting...")
+    # Job buttons answer the callback only once their job is registered (see below)
+    action, _, key = query.data.partition(":")
+    if action in KEYED_ACTIONS:
+        if key != session["data_key"]:
+            # Built for results this session no longer holds; answering is all it costs
+            await query.answer("⌛ This button is out of date. Use the latest message, or /start.", show_alert=True)
+            return
+        if jobs.find(user_id, query.data):
+            # A repeated tap or a retried callback: the running job already reports to this chat
+            await query.answer("⏳ Already running. Progress and results will appear here.")
+            return
+    else:
+        await query.answer()
+
+    if action == "start_again":
+        await edit_query(query, "🔁 Restarting...")
+        stopped = await cancel_jobs(user_id, chat_id)
         cleanup_user(user_id)
-        await context.bot.send_message(chat_id=query.message.chat.id, text="/start")
+        if stopped:
+            await safe_send(chat_id, context, stopped)
+        await outbox.send_message(chat_id, "/start")
+        return
+
+    if action == "continue_scan":
+        await query.answer()
+        district = session.get("district", "")
+        mark = await asyncio.to_thread(get_mark, user_id, district) if district else None
+        if not mark:
+            await edit_query(query, "⚠️ Nothing to continue. Please start again with /start.")
+            return
+        if jobs.find(user_id, query.data):
+            return  # a duplicate started it while the mark was being read
+        start_continue(user_id, chat_id, context, district, mark, key=query.data)
+        await edit_query(query, f"⏩ Fetching numbers after {mark['high_water']} for {district}...")
         return
 
-    if query.data == "exit_process":
-        await query.edit_message_text("❌ Exiting session.")
+    if action == "exit_process":
+        await edit_query(query, "❌ Exiting session.")
+        stopped = await cancel_jobs(user_id, chat_id)
         cleanup_user(user_id)
+        if stopped:
+            await safe_send(chat_id, context, stopped)
         return
 
-    if query.data == "login_process":
-        await query.edit_message_text("🔐 Logging in and processing data...")
+    if action == "login_process":
+        job_key = query.data
+        if job_key in session["completed"]:
+            await query.answer()
+            await send_generate_prompt(chat_id, context, session)
+            return
 
         async def process_data():
+            from login_to_website import login_to_website
+
             try:
                 async with session["lock"]:
+                    if session["data_key"] != key:
+                        # A newer search replaced these results while this job waited for the lock
+                        await safe_send(chat_id, context, STALE_JOB_TEXT)
+                        return
+
                     async def log_callback(msg):
-                        await safe_send(query.message.chat.id, context, msg)
-
-                    # If login_to_website is blocking/sync, wrap it:
-                    # await asyncio.to_thread(login_to_website, session["data"], log_callback=log_callback)
-                    await login_to_website(session["data"], log_callback=log_callback)
-
-                    session["tp_num_list"] = [e.get("eMM11_num", "") for e in session["data"] if e.get("eMM11_num")]
-                keyboard = [
-                    [InlineKeyboardButton("📄 Generate PDF", callback_data="generate_pdf")],
-                    [InlineKeyboardButton("❌ Exit", callback_data="exit_process")],
-                ]
-                await context.bot.send_message(
-                    chat_id=query.message.chat.id,
-                    text="Click below to generate PDF.",
-                    reply_markup=InlineKeyboardMarkup(keyboard),
-                )
+                        await outbox.put(chat_id, msg)
+
+                    # One browser plus an OCR slot for the captcha
+                    await portal_gate(chat_id)
+                    async with scheduler.slot(
+                        user_id, "login",
+                        size=len(session["data"]),
+                        browsers=1,
+                        cpu=1,
+                        on_queued=queue_notifier(chat_id, context, "Login & process"),
+                    ):
+                        await login_to_website(session["data"], log_callback=log_callback)
+
+                    outbox.end_progress(chat_id)
+                    await outbox.flush(chat_id)
+                    if session["data_key"] == key:
+                        session["processed"] = True
+                        session["completed"].add(job_key)
+                await send_generate_prompt(chat_id, context, session)
             except Exception as e:
                 logger.exception("Login/process failed for user %s: %s", user_id, e)
-                await safe_send(query.message.chat.id, context, f"❌ Error during process: {e}")
+                await safe_send(chat_id, context, f"❌ Error during process: {e}")
 
-        asyncio.create_task(process_data())
+        # Registered before the first await, so a concurrent duplicate finds it
+        start_job("login", user_id, f"{len(session['data'])} entries", process_data, key=job_key)
+        await query.answer()
+        await edit_query(query, "🔐 Logging in and processing data...")
         return
 
-    if query.data == "generate_pdf":
-        tp_list = session.get("tp_num_list", [])
-        if not tp_list:
-            await safe_send(query.message.chat.id, context, "⚠️ No TP numbers found.")
+    if action == "generate_pdf":
+        job_key = query.data
+        if not session.get("processed") or not session["data"]:
+            await query.answer()
+            await safe_send(chat_id, context, "⚠️ No TP numbers found.")
             return
+        if job_key in session["completed"]:
+            await query.answer()
+            if await send_pdf_list(chat_id, context, session):
+                return
+            if jobs.find(user_id, job_key):
+                return  # PDFs were evicted and a duplicate is already regenerating them
+        tp_count = len(session["data"])
 
         async def generate():
+            from pdf_gen import pdf_gen
+
             try:
                 async with session["lock"]:
-                    await pdf_gen(
-                        tp_list,
-                        output_dir=session["pdf_dir"],
-                        log_callback=lambda msg: asyncio.create_task(
-                            safe_send(query.message.chat.id, context, msg)
-                        ),
-                        send_pdf_callback=None,
-                    )
+                    if session["data_key"] != key:
+                        await safe_send(chat_id, context, STALE_JOB_TEXT)
+                        return
+                    await portal_gate(chat_id)
+                    async with scheduler.slot(
+                        user_id, "pdf",
+                        size=tp_count,
+                        browsers=1,
+                        cpu=1,
+                        on_queued=queue_notifier(chat_id, context, "PDF generation"),
+                    ):
+                        await pdf_gen(
+                            session["data"].numbers(),
+                            output_dir=session["pdf_dir"],
+                            log_callback=lambda msg: outbox.progress(chat_id, msg),
+                            send_pdf_callback=None,
+                        )
+                    await outbox.flush(chat_id)
+                    outbox.end_progress(chat_id)
 
                     # Ensure files exist; if not, try moving from default pdf_gen dir
-                    for tp in tp_list:
+                    for tp in session["data"].numbers():
                         expected_path = os.path.join(session["pdf_dir"], f"{tp}.pdf")
                         if not os.path.exists(expected_path):
                             # Optional: check a fallback location
@@ -271,27 +746,21 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                             else:
                                 logger.error("PDF for %s not found after generation", tp)
 
-                # Only show buttons for PDFs that really exist
-                keyboard = [
-                    [InlineKeyboardButton(f"📎 {tp}.pdf", callback_data=f"pdf_{tp}")]
-                    for tp in tp_list
-                    if os.path.exists(os.path.join(session["pdf_dir"], f"{tp}.pdf"))
-                ]
-                if not keyboard:
-                    await safe_send(query.message.chat.id, context, "❌ No PDFs could be generated.")
-                    return
+                # New artifacts may push sessions/ over quota; evict other idle data first
+                await enforce_sessions_quota()
 
-                keyboard.append([InlineKeyboardButton("❌ Exit", callback_data="exit_process")])
-                await context.bot.send_message(
-                    chat_id=query.message.chat.id,
-                    text="📄 Click to download your PDFs:",
-                    reply_markup=InlineKeyboardMarkup(keyboard),
-                )
+                if not await send_pdf_list(chat_id, context, session):
+                    await safe_send(chat_id, context, "❌ No PDFs could be generated.")
+                    return
+                if session["data_key"] == key:
+                    session["completed"].add(job_key)
             except Exception as e:
                 logger.exception("PDF gen failed for user %s: %s", user_id, e)
-                await safe_send(query.message.chat.id, context, f"❌ Error during PDF generation: {e}")
+                await safe_send(chat_id, context, f"❌ Error during PDF generation: {e}")
 
-        asyncio.create_task(generate())
+        start_job("pdf", user_id, f"{tp_count} TPs", generate, key=job_key)
+        if job_key not in session["completed"]:
+            await query.answer()
         return
 
 
@@ -299,25 +768,16 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         tp_num = query.data.split("_", 1)[1]
         pdf_path = os.path.join(session["pdf_dir"], f"{tp_num}.pdf")
         if os.path.exists(pdf_path):
-            try:
-                with open(pdf_path, "rb") as f:
-                    await context.bot.send_document(
-                        chat_id=query.message.chat.id,
-                        document=f,
-                        filename=f"{tp_num}.pdf",
-                        caption=f"📎 TP: {tp_num}",
-                    )
-            except Exception as e:
-                logger.error("Sending PDF failed: %s", e)
-                await safe_send(query.message.chat.id, context, "❌ Failed to send PDF.")
+            await send_pdf_document(chat_id, context, tp_num, pdf_path)
         else:
-            await safe_send(query.message.chat.id, context, "❌ PDF not found.")
+            await safe_send(chat_id, context, "❌ PDF not found.")
         return
 
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    stopped = await cancel_jobs(update.effective_user.id, update.effective_chat.id)
     cleanup_user(update.effective_user.id)
-    await update.message.reply_text("🚫 Operation cancelled.")
+    await reply(update, f"🚫 Operation cancelled.\n{stopped}" if stopped else "🚫 Operation cancelled.")
     return ConversationHandler.END
 
 
@@ -326,35 +786,248 @@ async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     session = user_sessions.get(user_id)
     if not session:
-        await update.message.reply_text("No active session. Use /start to begin.")
+        await reply(update, "No active session. Use /start to begin.")
         return
-    count = len(session.get("data", []))
-    await update.message.reply_text(
+    data = session.get("data", [])
+    count = len(data)
+    spilled = f" ({data.spilled} on disk)" if getattr(data, "spilled", 0) else ""
+    load = scheduler.snapshot()
+    await reply(
+        update,
         f"👤 User: {user_id}\n"
-        f"📦 Entries fetched: {count}\n"
-        f"📄 PDFs dir: {session.get('pdf_dir')}"
+        f"📦 Entries fetched: {count}{spilled}\n"
+        f"📄 PDFs dir: {session.get('pdf_dir')}\n"
+        f"🧵 Your jobs: {', '.join(job.describe() for job in jobs.for_user(user_id)) or 'none'}\n"
+        f"⚙️ Jobs running: {load['running']}, queued: {load['queued']}\n"
+        f"🌐 Portal: {breaker.state.replace('_', '-')}"
     )
 
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/export [csv|jsonl]: deliver scan results as a compressed file instead of chat messages."""
+    fmt = (context.args[0].lower() if context.args else "csv")
+    if fmt not in EXPORT_FORMATS:
+        await reply(update, "Usage: /export [csv|jsonl]")
+        return
+    chat_id = update.effective_chat.id
+    session = get_session(update.effective_user.id)
+    if session.get("exporter"):
+        await reply(update, "📦 An export is already in progress.")
+        return
+
+    if session.get("scanning"):
+        # Attach to the running scan: what it found so far, then every new entry as it arrives
+        exporter = new_exporter(session, fmt)
+        exporter.write_all(session["data"])
+        session["exporter"] = exporter
+        await reply(update, f"📦 Exporting the running scan as {fmt}.gz; the file follows when it finishes.")
+    elif session["data"]:
+        exporter = new_exporter(session, fmt)
+        async with session["lock"]:  # no scan may clear the results while they are written
+            await asyncio.to_thread(exporter.write_all, session["data"])
+        session["exporter"] = exporter
+        await finish_export(session, chat_id, context)
+    else:
+        session["export_format"] = fmt
+        await reply(update, f"📦 Your next scan will be delivered as a {fmt}.gz file.")
+
+
+async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/search <district> <from> <to>: answer from the crawler's index (numbers or dates)."""
+    args = context.args or []
+    if len(args) < 3:
+        await reply(
+            update,
+            "Usage: /search <district> <from> <to>\n"
+            "e.g. /search Agra 31422307030112000 31422307030112500\n"
+            "or   /search Agra 01-10-2026 15-10-2026"
+        )
+        return
+    index = get_index()
+    if index is None:
+        await reply(update, "⚠️ Search index is not available (the crawler is not enabled).")
+        return
+
+    district, lo, hi = " ".join(args[:-2]), args[-2], args[-1]
+    started = time.perf_counter()
+    live = []
+    if lo.isdigit() and hi.isdigit():
+        covered, live = await asyncio.to_thread(index.split_range, int(lo), int(hi))
+        results = await asyncio.to_thread(index.by_numbers, district, *covered) if covered else []
+    else:
+        date_from, date_to = parse_date(lo), parse_date(hi)
+        if not date_from or not date_to:
+            await reply(update, "⚠️ Use two numbers or two dates like 01-10-2026.")
+            return
+        results = await asyncio.to_thread(index.by_dates, district, date_from, date_to)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    chat_id = update.effective_chat.id
+    for entry in results:
+        await outbox.put(chat_id, format_entry(entry))
+    await outbox.flush(chat_id)
+
+    text = f"🔎 {len(results)} entries for {district} ({elapsed_ms:.0f} ms)."
+    if live:
+        ranges = ", ".join(f"{a}-{b}" for a, b in live)
+        text += f"\n⚠️ Not indexed yet: {ranges}. Use /start for a live scan."
+    session = get_session(update.effective_user.id) if results else None
+    if session and not session["lock"].locked():
+        # Results become the session's data, so Login & Process works on them
+        session["district"] = district
+        reset_results(session)
+        session["data"].extend(results)
+        await reply(update, text, reply_markup=fetched_keyboard(session))
+    else:
+        await reply(update, text)
+
+
+async def trace_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin: /trace, /trace user <id> or /trace <job_id> (sends Chrome trace JSON)."""
+    if update.effective_user.id not in ADMIN_IDS:
+        await reply(update, "⛔ Admins only.")
+        return
+
+    args = context.args or []
+    if len(args) == 1:
+        trace = get_trace(args[0])
+        if not trace:
+            await reply(update, "❌ Trace not found (it may have expired).")
+            return
+        await outbox.send_document(
+            update.effective_chat.id,
+            export_chrome_json(trace),
+            filename=f"{trace.id}.trace.json",
+            caption=f"🧭 {trace.id}: {trace.duration:.1f}s, {trace.outcome}. Open in ui.perfetto.dev",
+        )
+        return
+
+    user_filter = int(args[1]) if len(args) == 2 and args[0] == "user" and args[1].isdigit() else None
+    traces = recent_traces(limit=15, user_id=user_filter)
+    if not traces:
+        await reply(update, "No traces recorded.")
+        return
+    lines = [
+        f"{t.id}  user {t.user_id}  {t.label}  {t.duration:.1f}s  {t.outcome}"
+        for t in traces
+    ]
+    await reply(update, "🧭 Recent jobs:\n" + "\n".join(lines))
+
+
+async def enforce_sessions_quota() -> int:
+    """Keep sessions/ within SESSIONS_DISK_QUOTA_MB (LRU eviction)."""
+    # The disk walk runs in a thread; whole sessions are evicted back on the loop, which owns user_sessions
+    to_evict = []
+    try:
+        freed = await asyncio.to_thread(enforce_disk_quota, list(user_sessions.values()), evict_session=to_evict.append)
+    except OSError as e:
+        logger.warning("Disk quota check failed: %s", e)
+        return 0
+    for session in to_evict:
+        if session["lock"].locked():
+            continue  # a job started since the check
+        for user_id, s in list(user_sessions.items()):
+            if s is session:
+                logger.info("🧹 Evicting idle session for user %s (disk quota)", user_id)
+                cleanup_user(user_id)
+    if freed:
+        logger.info("🧹 Freed %.1f MB of session data", freed / 1024 / 1024)
+    return freed
+
+
 async def cleanup_expired_sessions():
-    while True:
-        now = time.time()
-        expired_users = []
-        for user_id, session in list(user_sessions.items()):
-            created_at = session.get("created_at", now)
-            if now - created_at > 12 * 3600:  # 12 hours in seconds
-                expired_users.append(user_id)
+    """Expire sessions when their inactivity TTL passes and keep disk use under quota."""
+    removed = await asyncio.to_thread(sweep_orphans, [s["user_dir"] for s in user_sessions.values()])
+    if removed:
+        logger.info("🧹 Removed %s stale session folder(s) left from earlier runs", removed)
 
-        for user_id in expired_users:
-            logger.info(f"🧹 Auto-cleaning expired session for user {user_id}")
-            cleanup_user(user_id)
+    async def expire(user_id: int):
+        session = user_sessions.get(user_id)
+        if session and session["lock"].locked():
+            touch_session(user_id)  # a job is still running: that counts as activity
+            return
+        logger.info(f"🧹 Auto-cleaning expired session for user {user_id}")
+        cleanup_user(user_id)
 
-        await asyncio.sleep(3600)  # check every hour
+    async def quota_loop():
+        while True:
+            try:
+                await enforce_sessions_quota()
+            except Exception as e:
+                logger.warning("Disk quota enforcement failed: %s", e)
+            await asyncio.sleep(QUOTA_CHECK_INTERVAL)
+
+    await asyncio.gather(session_expiry.run(expire), quota_loop())
 
 # ---------- Boot ----------
-async def run_bot():
-    os.makedirs("sessions", exist_ok=True)
+async def warm_up():
+    """Import the heavy pipeline modules in the background once the bot is up."""
+    if WARMUP == "none":
+        return
+    started = time.perf_counter()
+    try:
+        for name in ("fetch_emm11_data", "login_to_website", "pdf_gen"):
+            await asyncio.to_thread(importlib.import_module, name)
+        if WARMUP == "all":
+            from login_to_website import get_reader
+            await asyncio.to_thread(get_reader)
+        logger.info("🔥 Warm-up (%s) finished in %.1fs", WARMUP, time.perf_counter() - started)
+    except Exception as e:
+        logger.warning("Warm-up failed (modules will load on first use): %s", e)
+
+
+# Local scan workers started by the bot (SCAN_BACKEND=queue with SCAN_WORKERS > 0)
+worker_proc = None
+
+
+async def start_scan_workers():
+    global worker_proc
+    purged = await asyncio.to_thread(get_work_queue().purge_older)
+    if purged:
+        logger.info("🧹 Dropped %s abandoned scan job(s) from the work queue", purged)
+    if SCAN_WORKERS > 0:
+        # The workers' browsers come out of the bot's own pool, so the host stays within MAX_BROWSERS
+        budget = scheduler.reserve(WORKER_BROWSERS or max(1, MAX_BROWSERS // 2))
+        if not budget:
+            logger.warning("⚠️ MAX_BROWSERS=%s leaves no browsers for scan workers; not starting them", MAX_BROWSERS)
+            return
+        worker_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "worker.py")
+        worker_proc = subprocess.Popen([sys.executable, worker_script, "--processes", str(SCAN_WORKERS),
+                                        "--browsers", str(budget)])
+        logger.info("🧩 Started %s scan worker process(es) sharing %s browser(s)", SCAN_WORKERS, budget)
+
+
+async def on_startup(app):
+    outbox.start(app.bot)
+    await start_metrics_server()
+    await start_api_server()
+    if SCAN_BACKEND == "queue":
+        await start_scan_workers()
+    asyncio.create_task(warm_up())
+    asyncio.create_task(cleanup_expired_sessions())
+    asyncio.create_task(run_crawler())
 
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+
+async def on_shutdown(app):
+    await stop_api_server()
+    await outbox.stop()
+    if worker_proc and worker_proc.poll() is None:
+        worker_proc.terminate()
+
+
+def build_application(bot_token: str = BOT_TOKEN, base_url: str = BOT_API_BASE_URL, webhook: bool = False):
+    """Build the PTB application with all handlers registered."""
+    builder = (
+        ApplicationBuilder()
+        .token(bot_token)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    if base_url:
+        builder = builder.base_url(base_url).base_file_url(base_url.replace("/bot", "/file/bot"))
+    if webhook:
+        # Updates arrive over HTTP; handle up to WEBHOOK_WORKERS of them at once
+        builder = builder.updater(None).concurrent_updates(WEBHOOK_WORKERS)
+    app = builder.build()
 
     # Conversation
     conv_handler = ConversationHandler(
@@ -368,12 +1041,26 @@ async def run_bot():
         name="main_conversation",
         persistent=False,
     )
-    asyncio.create_task(cleanup_expired_sessions())
     app.add_handler(conv_handler)
     app.add_handler(CallbackQueryHandler(button_handler))
+    app.add_handler(CommandHandler("continue", continue_command))
+    app.add_handler(CommandHandler("search", search_command))
+    app.add_handler(CommandHandler("export", export_command))
+    app.add_handler(CommandHandler("pipeline", pipeline_command))
     app.add_handler(CommandHandler("status", status))
+    app.add_handler(CommandHandler("trace", trace_command))
     app.add_handler(CommandHandler("cancel", cancel))
+    return app
+
+
+async def run_bot():
+    os.makedirs("sessions", exist_ok=True)
+
+    if BOT_MODE == "webhook":
+        await run_webhook(build_application(webhook=True))
+        return
 
+    app = build_application()
     logger.info("🤖 Bot is starting...")
     await app.run_polling(
         allowed_updates=None,              # PTB manages what it needs
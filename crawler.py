@@ -0,0 +1,238 @@
+# crawler.py
+# Background watch mode: follows newly issued eMM11 numbers at a controlled
+# rate and keeps a local SQLite index by destination district and
+# `generated_on` date, so /search and the covered part of a /start scan are
+# answered from disk instead of a live portal scan.
+#
+# The index covers the contiguous range [low, cursor): every issued number in
+# it has been looked up once. Numbers at or above the cursor still need a
+# live scan until the crawler reaches them. Numbers below the cursor whose
+# lookup failed (timeout, page error) are kept as gaps: they count as not
+# covered, and the crawler retries them with every chunk.
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+from metrics import Counter, Gauge
+from scan_state import STATE_DIR
+from scheduler import scheduler
+
+logger = logging.getLogger("up-mines-bot.crawler")
+
+INDEX_PATH = os.getenv("CRAWL_INDEX_PATH", os.path.join(STATE_DIR, "emm11_index.sqlite3"))
+CRAWL_START = int(os.getenv("CRAWL_START", "0"))            # first number to crawl; 0 = only resume
+CRAWL_RATE = float(os.getenv("CRAWL_RATE", "2"))            # portal lookups per second
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "2"))  # browsers the crawler may use
+CRAWL_CHUNK = int(os.getenv("CRAWL_CHUNK", "50"))
+CRAWL_IDLE = float(os.getenv("CRAWL_IDLE", "300"))          # seconds to wait once caught up
+CRAWLER_USER_ID = 0                                          # scheduler identity of the crawler
+
+CRAWL_INDEXED = Counter("upmines_crawler_indexed_total", "eMM11 records added to the local index")
+
+DATE_FORMATS = ("%d-%m-%Y %H:%M:%S", "%d-%m-%Y %H:%M", "%d-%m-%Y", "%d/%m/%Y %H:%M:%S", "%d/%m/%Y", "%Y-%m-%d")
+
+
+def parse_date(text: str) -> Optional[str]:
+    """Portal `generated_on` (or a user-typed date) as an ISO date, or None."""
+    text = (text or "").strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    # Portal sometimes appends AM/PM or seconds fractions; the date part is enough
+    head = text.split(" ", 1)[0]
+    return parse_date(head) if head != text else None
+
+
+# ---------- Index ----------
+class Emm11Index:
+    def __init__(self, path: str = INDEX_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()  # queries run in worker threads
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS passes (
+                num INTEGER PRIMARY KEY,
+                district TEXT NOT NULL,
+                generated_date TEXT,
+                record TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS passes_by_date ON passes (district, generated_date);
+            CREATE TABLE IF NOT EXISTS coverage (id INTEGER PRIMARY KEY CHECK (id = 1), low INTEGER, cursor INTEGER);
+            CREATE TABLE IF NOT EXISTS gaps (num INTEGER PRIMARY KEY);
+        """)
+
+    def coverage(self) -> Optional[Tuple[int, int]]:
+        """(low, cursor): numbers in [low, cursor) are indexed. None before the first crawl."""
+        with self._lock:
+            row = self._db.execute("SELECT low, cursor FROM coverage WHERE id = 1").fetchone()
+        return (row[0], row[1]) if row else None
+
+    def add(self, records: Iterable[dict], low: int, cursor: int,
+            failed: Iterable[int] = (), resolved: Iterable[int] = ()):
+        """Store looked-up records, record failed numbers as gaps, close resolved gaps and move
+        the covered range, in one transaction."""
+        rows = [
+            (int(r["eMM11_num"]), r["destination_district"].strip().upper(),
+             parse_date(r.get("generated_on", "")), json.dumps(r))
+            for r in records
+        ]
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR REPLACE INTO passes VALUES (?, ?, ?, ?)", rows)
+            self._db.executemany("DELETE FROM gaps WHERE num = ?", [(n,) for n in resolved])
+            self._db.executemany("INSERT OR IGNORE INTO gaps VALUES (?)", [(n,) for n in failed])
+            self._db.execute("INSERT OR REPLACE INTO coverage VALUES (1, ?, ?)", (low, cursor))
+
+    def gaps(self, start: int = None, end: int = None, limit: int = -1) -> List[int]:
+        """Numbers below the cursor whose lookup failed, optionally within [start, end]."""
+        with self._lock:
+            return [row[0] for row in self._db.execute(
+                "SELECT num FROM gaps WHERE num BETWEEN ? AND ? ORDER BY num LIMIT ?",
+                (start if start is not None else -1, end if end is not None else 2 ** 62, limit),
+            )]
+
+    def by_numbers(self, district: str, start: int, end: int) -> List[dict]:
+        return self._query(
+            "SELECT record FROM passes WHERE district = ? AND num BETWEEN ? AND ? ORDER BY num",
+            (district.strip().upper(), start, end),
+        )
+
+    def by_dates(self, district: str, date_from: str, date_to: str) -> List[dict]:
+        return self._query(
+            "SELECT record FROM passes WHERE district = ? AND generated_date BETWEEN ? AND ? ORDER BY num",
+            (district.strip().upper(), date_from, date_to),
+        )
+
+    def highest(self, start: int, end: int) -> Optional[int]:
+        """Highest indexed (issued) number in [start, end], any district."""
+        with self._lock:
+            return self._db.execute("SELECT MAX(num) FROM passes WHERE num BETWEEN ? AND ?", (start, end)).fetchone()[0]
+
+    def split_range(self, start: int, end: int) -> Tuple[Optional[Tuple[int, int]], List[Tuple[int, int]]]:
+        """Split [start, end] into the indexed part and the parts that still need a live scan.
+
+        Gaps inside the indexed part (failed lookups) are returned as live ranges too.
+        """
+        cov = self.coverage()
+        if not cov or start > end:
+            return None, [(start, end)] if start <= end else []
+        low, cursor = cov
+        lo, hi = max(start, low), min(end, cursor - 1)
+        if lo > hi:
+            return None, [(start, end)]
+        live: List[Tuple[int, int]] = []
+
+        def add_live(a: int, b: int):
+            if live and live[-1][1] == a - 1:
+                live[-1] = (live[-1][0], b)
+            else:
+                live.append((a, b))
+
+        if start < lo:
+            add_live(start, lo - 1)
+        for num in self.gaps(lo, hi):
+            add_live(num, num)
+        if hi < end:
+            add_live(hi + 1, end)
+        return (lo, hi), live
+
+    def _query(self, sql: str, params: tuple) -> List[dict]:
+        with self._lock:
+            return [json.loads(row[0]) for row in self._db.execute(sql, params)]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM passes").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_index: Optional[Emm11Index] = None
+
+
+def get_index() -> Optional[Emm11Index]:
+    """The shared index, or None when crawling was never enabled on this host."""
+    global _index
+    if _index is None and (CRAWL_START or os.path.exists(INDEX_PATH)):
+        _index = Emm11Index()
+    return _index
+
+
+Gauge("upmines_crawler_cursor", "Next eMM11 number the crawler will look up",
+      callback=lambda: (_index.coverage() or (0, 0))[1] if _index else 0)
+
+
+# ---------- Crawler ----------
+async def crawl_chunk(playwright, index: Emm11Index, low: int, cursor: int) -> int:
+    """Look up CRAWL_CHUNK numbers from `cursor` (plus earlier gaps), paced to CRAWL_RATE. Returns the new cursor."""
+    from fetch_emm11_data import LookupFailed, lookup_shared
+
+    retry = await asyncio.to_thread(index.gaps, None, cursor - 1, CRAWL_CHUNK)
+    numbers = retry + list(range(cursor, cursor + CRAWL_CHUNK))
+    found, failed = {}, set()
+    interval = 1 / CRAWL_RATE if CRAWL_RATE > 0 else 0
+    async with scheduler.slot(CRAWLER_USER_ID, "crawl", size=len(numbers), browsers=CRAWL_CONCURRENCY) as grant:
+        semaphore = asyncio.Semaphore(grant.browsers)
+
+        async def one(num: int, delay: float):
+            await asyncio.sleep(delay)
+            try:
+                async with semaphore:
+                    record = await lookup_shared(playwright, num, log=lambda *_: None, strict=True)
+            except LookupFailed:
+                failed.add(num)
+                return
+            if record:
+                found[num] = record
+
+        await asyncio.gather(*(one(num, i * interval) for i, num in enumerate(numbers)))
+
+    new = [num for num in found if num >= cursor]
+    # Misses after the last issued number may simply not be issued yet: keep them uncovered
+    new_cursor = max(new) + 1 if new else cursor
+    # Below the new cursor only definite reads count as covered; failed lookups stay gaps to retry
+    gaps = [num for num in failed if num < new_cursor]
+    resolved = [num for num in retry if num not in failed]
+    if found or resolved:
+        await asyncio.to_thread(index.add, found.values(), low, new_cursor, gaps, resolved)
+        CRAWL_INDEXED.inc(len(found))
+    return new_cursor
+
+
+async def run_crawler(index: Emm11Index = None):
+    """Follow new numbers forever. Starts at CRAWL_START, or resumes the index's cursor."""
+    index = index or get_index()
+    coverage = await asyncio.to_thread(index.coverage) if index else None
+    if coverage is None:
+        if not CRAWL_START:
+            logger.info("Crawler disabled (set CRAWL_START to begin indexing)")
+            return
+        coverage = (CRAWL_START, CRAWL_START)
+    low, cursor = coverage
+    logger.info("🕷️ Crawler following eMM11 numbers from %s at %.1f lookups/s", cursor, CRAWL_RATE)
+
+    from playwright.async_api import async_playwright
+
+    async with async_playwright() as playwright:
+        while True:
+            try:
+                new_cursor = await crawl_chunk(playwright, index, low, cursor)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Crawl chunk at %s failed: %s", cursor, e)
+                new_cursor = cursor
+            if new_cursor == cursor:
+                await asyncio.sleep(CRAWL_IDLE)  # caught up with the portal
+            cursor = new_cursor
@@ -1,7 +1,51 @@
-from playwright.async_api import Page
-from pdf_gen import pdf_gen
+from playwright.async_api import Page, TimeoutError as PlaywrightTimeoutError
+from metrics import TP_CHECK_SECONDS
+from portal import PortalUnavailable, breaker
+from tracing import span
 import os
 
+async def open_eformc_page(page: Page):
+    """From the licensee home page, open the eFormC-by-transit-pass form."""
+    master_menu = page.locator("//a[normalize-space()='Master Entries']")
+    await master_menu.wait_for(state="visible", timeout=6000)
+    await master_menu.click()
+    await page.wait_for_timeout(1000)
+
+    submenu = page.locator("//a[normalize-space()='Apply for eFormC Quantity by Transit Pass Number']")
+    await submenu.wait_for(state="visible", timeout=6000)
+    await submenu.click()
+    await page.wait_for_timeout(1000)
+
+    await page.select_option("#ContentPlaceHolder1_ddl_LicenseeID", index=1)
+    await page.click("#ContentPlaceHolder1_RbtWise_0")
+    await page.wait_for_timeout(1500)
+
+
+async def check_tp(page: Page, tp_num) -> str:
+    """Check one TP on the eFormC form: "unused" (eligible), "used" or "rejected"."""
+    trial = await breaker.admit()  # park or fail fast while the portal is down
+    try:
+        with span("tp_check", cat="tp", tp=tp_num) as args, \
+                TP_CHECK_SECONDS.time(outcome="used") as timer:
+            await page.fill("#ContentPlaceHolder1_txt_eMM11No", str(tp_num))
+            await page.click("#ContentPlaceHolder1_btnProceed")
+            await page.wait_for_timeout(1000)
+
+            error_locator = page.locator("#ContentPlaceHolder1_ErrorLbl")
+            if await error_locator.is_visible():
+                error_text = await error_locator.inner_text()
+                timer.outcome = "unused" if "not generated for storage license" in error_text else "rejected"
+            args["outcome"] = timer.outcome
+        breaker.record_success()
+        return timer.outcome
+    except PlaywrightTimeoutError:
+        breaker.record_failure("TP check timeout")
+        raise
+    finally:
+        if trial:
+            breaker.release_trial()  # other errors and cancellation give no verdict on the portal
+
+
 async def process_emm11(
     page: Page,
     emm11_numbers_list,
@@ -26,35 +70,19 @@ async def process_emm11(
             print(msg)
 
     try:
-        master_menu = page.locator("//a[normalize-space()='Master Entries']")
-        await master_menu.wait_for(state="visible", timeout=6000)
-        await master_menu.click()
-        await page.wait_for_timeout(1000)
-
-        submenu = page.locator("//a[normalize-space()='Apply for eFormC Quantity by Transit Pass Number']")
-        await submenu.wait_for(state="visible", timeout=6000)
-        await submenu.click()
-        await page.wait_for_timeout(1000)
-
-        await page.select_option("#ContentPlaceHolder1_ddl_LicenseeID", index=1)
-        await page.click("#ContentPlaceHolder1_RbtWise_0")
-        await page.wait_for_timeout(1500)
+        await open_eformc_page(page)
 
         tp_num_list = []
         for tp_num in filter(None, emm11_numbers_list):
             try:
-                await page.fill("#ContentPlaceHolder1_txt_eMM11No", str(tp_num))
-                await page.click("#ContentPlaceHolder1_btnProceed")
-                await page.wait_for_timeout(1000)
-
-                error_locator = page.locator("#ContentPlaceHolder1_ErrorLbl")
-                if await error_locator.is_visible():
-                    error_text = await error_locator.inner_text()
-                    if "not generated for storage license" in error_text:
-                        await log(f"{tp_num} : ❌ Unused")
-                        tp_num_list.append(str(tp_num))
-                else:
+                outcome = await check_tp(page, tp_num)
+                if outcome == "unused":
+                    await log(f"{tp_num} : ❌ Unused")
+                    tp_num_list.append(str(tp_num))
+                elif outcome == "used":
                     await log(f"TP Number: {tp_num} ✅ No error detected or form submitted.")
+            except PortalUnavailable:
+                raise
             except Exception as e:
                 await log(f"⚠️ TP Number: {tp_num} - Failed to process due to: {e}")
 
@@ -71,6 +99,8 @@ async def process_emm11(
         # else:
         #     await log("ℹ️ No eligible TP numbers found for PDF generation.")
 
+    except PortalUnavailable:
+        raise
     except Exception as e:
         print("Error:",e)
         # await log(f"🔥 Fatal error in process_emm11: {e}")
@@ -0,0 +1,82 @@
+# exporter.py
+# Streaming export of scan results to gzip-compressed CSV or JSONL.
+#
+# Entries are written as they arrive, so memory stays constant however large
+# the scan. Output rolls over to a new part before the compressed file would
+# exceed Telegram's upload limit; every part is self-contained (CSV parts
+# repeat the header).
+
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+from typing import Iterable, List, Optional
+
+logger = logging.getLogger("up-mines-bot.exporter")
+
+EXPORT_FORMATS = ("csv", "jsonl")
+EXPORT_PART_BYTES = int(os.getenv("EXPORT_PART_MB", "45")) * 1024 * 1024  # Telegram bots may upload 50 MB
+FIELDS = ("eMM11_num", "destination_district", "destination_address", "quantity_to_transport", "generated_on")
+
+
+class ResultExporter:
+    def __init__(self, directory: str, fmt: str = "csv", name: str = "emm11", part_bytes: int = EXPORT_PART_BYTES):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {fmt}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.fmt = fmt
+        self.name = name
+        self.part_bytes = part_bytes
+        self.rows = 0
+        self.paths: List[str] = []
+        self._raw: Optional[io.BufferedWriter] = None
+        self._text: Optional[io.TextIOWrapper] = None
+        self._csv = None
+
+    def _open_part(self):
+        path = os.path.join(self.directory, f"{self.name}.part{len(self.paths) + 1}.{self.fmt}.gz")
+        self._raw = open(path, "wb")
+        self._gzip = gzip.GzipFile(fileobj=self._raw, mode="wb", compresslevel=6)
+        self._text = io.TextIOWrapper(self._gzip, encoding="utf-8", newline="")
+        self.paths.append(path)
+        if self.fmt == "csv":
+            self._csv = csv.DictWriter(self._text, fieldnames=FIELDS, extrasaction="ignore")
+            self._csv.writeheader()
+
+    def _close_part(self):
+        if self._text is not None:
+            self._text.close()  # flushes the gzip trailer
+            self._raw.close()
+            self._text = self._raw = self._csv = None
+
+    def write(self, entry: dict):
+        # Compressed bytes reach the file in blocks; leave a margin for the unflushed block
+        if self._raw is None or self._raw.tell() >= self.part_bytes - min(1024 * 1024, self.part_bytes // 8):
+            self._close_part()
+            self._open_part()
+        if self.fmt == "csv":
+            self._csv.writerow(entry)
+        else:
+            self._text.write(json.dumps(dict(entry), ensure_ascii=False) + "\n")
+        self.rows += 1
+
+    def write_all(self, entries: Iterable[dict]):
+        for entry in entries:
+            self.write(entry)
+
+    def close(self) -> List[str]:
+        """Finish the export and return its part files (none when nothing was written)."""
+        self._close_part()
+        return list(self.paths)
+
+    def discard(self):
+        self._close_part()
+        for path in self.paths:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning("Could not remove export part %s: %s", path, e)
+        self.paths.clear()
@@ -0,0 +1,297 @@
+# fake_bot_api.py
+# A local stand-in for the Telegram Bot API, for end-to-end runs without
+# touching api.telegram.org. Point the bot at it with
+#   BOT_API_BASE_URL=http://127.0.0.1:<port>/bot
+# It records every call, answers the methods the bot uses, serves getUpdates
+# long-polls from an in-memory queue and can push updates to a webhook.
+#
+#   python fake_bot_api.py --check-webhook    # end-to-end webhook smoke check
+
+import argparse
+import asyncio
+import json
+import logging
+import socket
+import time
+import urllib.request
+from collections import defaultdict
+from email.parser import BytesParser
+from email.policy import HTTP
+from typing import Dict, List, Optional
+
+from http_server import HTTPServer, Request, Response
+
+logger = logging.getLogger("up-mines-bot.fake-api")
+
+BOT_INFO = {"id": 1000001, "is_bot": True, "first_name": "FakeBot", "username": "fake_up_mines_bot"}
+
+
+def _params(request: Request) -> Dict[str, object]:
+    """Decode Bot API parameters from JSON, urlencoded or multipart bodies."""
+    ctype = request.headers.get("content-type", "")
+    params: Dict[str, object] = dict(request.query)
+    if ctype.startswith("application/json"):
+        params.update(request.json() or {})
+    elif ctype.startswith("multipart/form-data"):
+        message = BytesParser(policy=HTTP).parsebytes(
+            b"Content-Type: " + ctype.encode() + b"\r\n\r\n" + request.body
+        )
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            payload = part.get_payload(decode=True) or b""
+            if part.get_filename():
+                params[name] = {"filename": part.get_filename(), "size": len(payload)}
+            else:
+                params[name] = payload.decode("utf-8", "replace")
+    elif request.body:
+        params.update(request.form())
+    # PTB JSON-encodes non-string values inside form fields
+    for key, value in list(params.items()):
+        if isinstance(value, str) and value[:1] in "{[":
+            try:
+                params[key] = json.loads(value)
+            except ValueError:
+                pass
+    return params
+
+
+class FakeBotAPI:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        self.server = HTTPServer(host, port)
+        self.server.route("POST", "/bot", self._dispatch, prefix=True)
+        self.server.route("GET", "/bot", self._dispatch, prefix=True)
+        self.latency = latency
+        self.calls: List[dict] = []
+        self.sent: Dict[int, List[dict]] = defaultdict(list)  # chat_id -> messages/documents
+        self.webhook: Optional[dict] = None
+        self._updates: asyncio.Queue = asyncio.Queue()
+        self._update_id = 0
+        self._message_id = 0
+        self._waiters: Dict[int, List[asyncio.Future]] = defaultdict(list)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.server.host}:{self.server.port}/bot"
+
+    async def start(self):
+        await self.server.start()
+
+    async def stop(self):
+        await self.server.stop(drain_timeout=1)
+
+    # ---------- Simulating users ----------
+    def make_message(self, user_id: int, text: str) -> dict:
+        self._update_id += 1
+        self._message_id += 1
+        user = {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+        message = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": user,
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": self._update_id, "message": message}
+
+    def make_callback(self, user_id: int, data: str, message: Optional[dict] = None) -> dict:
+        self._update_id += 1
+        user = {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+        message = message or {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "text": "",
+        }
+        return {
+            "update_id": self._update_id,
+            "callback_query": {
+                "id": str(self._update_id),
+                "from": user,
+                "chat_instance": str(user_id),
+                "message": message,
+                "data": data,
+            },
+        }
+
+    async def push(self, update: dict):
+        """Deliver an update: to the webhook if one is set, else to getUpdates."""
+        if self.webhook:
+            await asyncio.to_thread(self._post_webhook, update)
+        else:
+            await self._updates.put(update)
+
+    def _post_webhook(self, update: dict):
+        headers = {"Content-Type": "application/json"}
+        if self.webhook.get("secret_token"):
+            headers["X-Telegram-Bot-Api-Secret-Token"] = self.webhook["secret_token"]
+        req = urllib.request.Request(
+            self.webhook["url"], data=json.dumps(update).encode(), headers=headers, method="POST"
+        )
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            resp.read()
+
+    async def wait_for(self, chat_id: int, predicate, timeout: float = 30.0, since: int = 0) -> dict:
+        """Wait until a message matching predicate(message) is sent to chat_id.
+
+        `since` skips the first N messages already sent to the chat (e.g. from an earlier step).
+        """
+        for message in self.sent[chat_id][since:]:
+            if predicate(message):
+                return message
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            future = loop.create_future()
+            self._waiters[chat_id].append(future)
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError(f"no matching message for chat {chat_id}")
+            message = await asyncio.wait_for(future, remaining)
+            if predicate(message):
+                return message
+
+    # ---------- Bot API ----------
+    async def _dispatch(self, request: Request) -> Response:
+        # request.match looks like "<token>/<method>"
+        _, _, method = request.match.partition("/")
+        params = _params(request)
+        self.calls.append({"method": method, "params": params, "at": time.monotonic()})
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        handler = getattr(self, f"_api_{method}", None)
+        if handler is None:
+            return Response.json({"ok": True, "result": True})
+        result = await handler(params)
+        return Response.json({"ok": True, "result": result})
+
+    async def _api_getMe(self, params):
+        return BOT_INFO
+
+    async def _api_setWebhook(self, params):
+        self.webhook = {"url": params.get("url"), "secret_token": params.get("secret_token")}
+        return True
+
+    async def _api_deleteWebhook(self, params):
+        self.webhook = None
+        return True
+
+    async def _api_getUpdates(self, params):
+        timeout = float(params.get("timeout") or 0)
+        updates = []
+        try:
+            if self._updates.empty() and timeout:
+                updates.append(await asyncio.wait_for(self._updates.get(), timeout))
+            while not self._updates.empty():
+                updates.append(self._updates.get_nowait())
+        except asyncio.TimeoutError:
+            pass
+        return updates
+
+    def _record(self, chat_id, message: dict) -> dict:
+        chat_id = int(chat_id)
+        self.sent[chat_id].append(message)
+        for future in self._waiters.pop(chat_id, []):
+            if not future.done():
+                future.set_result(message)
+        return message
+
+    def _message(self, chat_id, **fields) -> dict:
+        self._message_id += 1
+        message = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            "from": BOT_INFO,
+        }
+        message.update(fields)
+        return message
+
+    async def _api_sendMessage(self, params):
+        fields = {"text": params.get("text", "")}
+        if params.get("reply_markup"):
+            fields["reply_markup"] = params["reply_markup"]
+        return self._record(params["chat_id"], self._message(params["chat_id"], **fields))
+
+    async def _api_editMessageText(self, params):
+        message = self._message(params["chat_id"], text=params.get("text", ""))
+        message["message_id"] = int(params.get("message_id") or message["message_id"])
+        message["edit_date"] = int(time.time())
+        if params.get("reply_markup"):
+            message["reply_markup"] = params["reply_markup"]
+        return self._record(params["chat_id"], message)
+
+    async def _api_sendDocument(self, params):
+        document = params.get("document") or {}
+        size = document.get("size", 0) if isinstance(document, dict) else 0
+        file_name = document.get("filename") if isinstance(document, dict) else None
+        fields = {
+            "document": {"file_id": f"file{self._message_id}", "file_unique_id": f"u{self._message_id}",
+                         "file_name": file_name, "file_size": size},
+            "caption": params.get("caption", ""),
+        }
+        return self._record(params["chat_id"], self._message(params["chat_id"], **fields))
+
+    async def _api_answerCallbackQuery(self, params):
+        return True
+
+
+# ---------- End-to-end webhook check ----------
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def webhook_smoke_check() -> bool:
+    """Run the real bot in webhook mode against the fake API and drive /start."""
+    import bot
+    import webhook
+
+    api = FakeBotAPI()
+    await api.start()
+    webhook.WEBHOOK_SECRET = "s3cret"
+    port = free_port()
+    app = bot.build_application(bot_token="123:FAKE", base_url=api.base_url, webhook=True)
+    server = HTTPServer("127.0.0.1", port)
+
+    stop = asyncio.Event()
+    runner = asyncio.create_task(
+        webhook.run_webhook(app, stop_event=stop, server=server, webhook_url=f"http://127.0.0.1:{port}")
+    )
+    try:
+        for _ in range(100):
+            if api.webhook:
+                break
+            await asyncio.sleep(0.05)
+        await api.push(api.make_message(42, "/start"))
+        message = await api.wait_for(42, lambda m: "start number" in m.get("text", ""), timeout=15)
+        print("✅ webhook round trip ok:", message["text"])
+        return True
+    finally:
+        stop.set()
+        await runner
+        await api.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local fake Telegram Bot API")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--check-webhook", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    async def serve():
+        api = FakeBotAPI(port=args.port)
+        await api.start()
+        print(f"Fake Bot API at {api.base_url}")
+        await asyncio.Event().wait()
+
+    ok = True
+    if args.check_webhook:
+        ok = asyncio.run(webhook_smoke_check())
+    else:
+        asyncio.run(serve())
+    raise SystemExit(0 if ok else 1)
@@ -1,25 +1,63 @@
 # fetch_emm11_data.py
 import asyncio
+from typing import Dict
+
 from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 
-BASE_URL = "https://upmines.upsdc.gov.in/Registration/PrintRegistrationFormVehicleCheckValidOrNot.aspx?eId={}"
+from metrics import ACTIVE_BROWSERS, FETCH_COALESCED, FETCH_SECONDS
+from portal import PortalUnavailable, breaker, navigate, print_url
+from tracing import span
+
 HEADLESS = True
 CONCURRENCY_LIMIT = 10
+FORWARD_CHUNK = 50         # numbers per step when scanning past a high-water mark
+FORWARD_MAX = 5000         # never scan further than this past the mark in one go
 
-async def fetch_single_emm11(playwright, emm11_num, district, log=print):
-    url = BASE_URL.format(emm11_num)
-    browser = await playwright.chromium.launch(headless=HEADLESS)
-    page = await browser.new_page()
+# Lookups currently in flight, keyed by eMM11 number. Concurrent scans that
+# overlap await the same lookup instead of opening a second browser for it.
+_inflight: Dict[int, asyncio.Future] = {}
+_RETRY = object()  # the leading lookup was cancelled; a waiter should look up itself
+_FAILED = object()  # the leading lookup failed; waiters fail too
+
+
+class LookupFailed(Exception):
+    """The lookup itself failed (timeout, page error), so whether the number is issued is unknown."""
+
+
+async def lookup_emm11(playwright, emm11_num, log=print):
+    """Read one eMM11 print page. Returns the record (any district), or None if the number is not issued.
+
+    Raises LookupFailed when the page could not be read.
+    """
+    url = print_url(emm11_num)
+    # Admit before launching: while the circuit is half-open, callers waiting
+    # for the single trial call hold no browser (the trial holder navigates)
+    trial = await breaker.admit()
+    with span("lookup", cat="number", num=emm11_num) as args, \
+            FETCH_SECONDS.time(outcome="found") as timer:
+        try:
+            browser = await playwright.chromium.launch(headless=HEADLESS)
+        except BaseException:
+            if trial:
+                breaker.release_trial()
+            raise
+        ACTIVE_BROWSERS.inc()
+
+        try:
+            page = await browser.new_page()
+            admitted, trial = trial, False  # navigate() records the verdict or releases the trial
+            await navigate(lambda: page.goto(url, timeout=10000), admitted=admitted)
+            try:
+                await page.wait_for_selector("#lbl_destination_district", timeout=5000)
+            except PlaywrightTimeoutError:
+                # The page loaded but has no record: the number is not issued (yet)
+                timer.outcome = "missing"
+                return None
+            district_text = await page.locator("#lbl_destination_district").inner_text()
+            quantity = await page.locator("#lbl_qty_to_Transport").inner_text()
+            address = await page.locator("#lbl_destination_address").inner_text()
+            generated_on = await page.locator("#txt_etp_generated_on").inner_text()
 
-    try:
-        await page.goto(url, timeout=10000)
-        await page.wait_for_selector("#lbl_destination_district", timeout=5000)
-        district_text = await page.locator("#lbl_destination_district").inner_text()
-        quantity = await page.locator("#lbl_qty_to_Transport").inner_text()
-        address = await page.locator("#lbl_destination_address").inner_text()
-        generated_on = await page.locator("#txt_etp_generated_on").inner_text()
-
-        if district_text.strip().upper() == district.upper():
             return {
                 "eMM11_num": emm11_num,
                 "destination_district": district_text.strip(),
@@ -28,23 +66,88 @@ async def fetch_single_emm11(playwright, emm11_num, district, log=print):
                 "generated_on": generated_on.strip()
             }
 
-    except PlaywrightTimeoutError:
-        log(f"[{emm11_num}] Timeout while fetching data.")
-    except Exception as e:
-        log(f"[{emm11_num}] Error: {e}")
+        except PortalUnavailable:
+            timer.outcome = "unavailable"
+            raise
+        except PlaywrightTimeoutError as e:
+            timer.outcome = "timeout"
+            log(f"[{emm11_num}] Timeout while fetching data.")
+            raise LookupFailed(f"{emm11_num}: timeout") from e
+        except Exception as e:
+            timer.outcome = "error"
+            log(f"[{emm11_num}] Error: {e}")
+            raise LookupFailed(f"{emm11_num}: {e}") from e
+        finally:
+            if trial:
+                breaker.release_trial()  # the page never opened, so the navigation never ran
+            await browser.close()
+            ACTIVE_BROWSERS.dec()
+            args["outcome"] = timer.outcome
+
+async def lookup_shared(playwright, emm11_num, log=print, strict=False):
+    """Single-flight lookup: concurrent callers for the same number share one browser visit.
+
+    A failed lookup returns None like an unissued number, or raises LookupFailed with `strict`.
+    """
+    try:
+        result = await _lookup_coalesced(playwright, int(emm11_num), log)
+    except LookupFailed:
+        if strict:
+            raise
+        return None
+    return dict(result) if result else None
+
+async def _lookup_coalesced(playwright, emm11_num, log):
+    while True:
+        future = _inflight.get(emm11_num)
+        if future is None:
+            break
+        FETCH_COALESCED.inc()
+        with span("coalesced_wait", cat="number", num=emm11_num):
+            result = await asyncio.shield(future)
+        if result is _FAILED:
+            raise LookupFailed(f"{emm11_num}: shared lookup failed")
+        if result is not _RETRY:
+            return result
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[emm11_num] = future
+    try:
+        result = await lookup_emm11(playwright, emm11_num, log=log)
+    except LookupFailed:
+        future.set_result(_FAILED)
+        raise
+    except BaseException:
+        future.set_result(_RETRY)
+        raise
     finally:
-        await browser.close()
+        _inflight.pop(emm11_num, None)
+    if not future.done():
+        future.set_result(result)
+    return result
+
+def _in_district(record, district) -> bool:
+    return bool(record) and record["destination_district"].upper() == district.strip().upper()
 
-    return None
+async def fetch_single_emm11(playwright, emm11_num, district, log=print):
+    """Look up one number and keep it only if it is bound for `district`."""
+    record = await lookup_shared(playwright, emm11_num, log=log)
+    return record if _in_district(record, district) else None
 
-async def fetch_emm11_data(start_num, end_num, district, data_callback=None, log=print):
+async def fetch_emm11_data(start_num, end_num, district, data_callback=None, log=print, concurrency=CONCURRENCY_LIMIT,
+                           on_issued=None):
+    """Scan start_num..end_num for `district`. on_issued(num) is called for every issued number, any district."""
     results = []
     async with async_playwright() as playwright:
-        semaphore = asyncio.Semaphore(CONCURRENCY_LIMIT)
+        # One browser per in-flight number; callers pass their scheduler grant here
+        semaphore = asyncio.Semaphore(max(1, min(concurrency, CONCURRENCY_LIMIT)))
 
         async def limited_fetch(num):
             async with semaphore:
-                result = await fetch_single_emm11(playwright, num, district, log=log)
+                record = await lookup_shared(playwright, num, log=log)
+                if record and on_issued:
+                    on_issued(num)
+                result = record if _in_district(record, district) else None
                 if result:
                     if data_callback:
                         await data_callback(result)
@@ -59,3 +162,36 @@ async def fetch_emm11_data(start_num, end_num, district, data_callback=None, log
             return results
 
     return []
+
+async def fetch_emm11_since(after_num, district, data_callback=None, log=print, concurrency=CONCURRENCY_LIMIT,
+                            chunk_size=FORWARD_CHUNK, max_numbers=FORWARD_MAX):
+    """
+    Scan numbers issued after `after_num`, chunk by chunk, until a whole chunk
+    has no issued numbers (we have caught up with the portal).
+    Returns the highest issued number seen (the new high-water mark).
+    """
+    high_water = after_num
+    async with async_playwright() as playwright:
+        semaphore = asyncio.Semaphore(max(1, min(concurrency, CONCURRENCY_LIMIT)))
+
+        async def one(num):
+            nonlocal high_water
+            async with semaphore:
+                record = await lookup_shared(playwright, num, log=log)
+            if not record:
+                return False
+            high_water = max(high_water, num)
+            if _in_district(record, district) and data_callback:
+                await data_callback(record)
+            return True
+
+        start = after_num + 1
+        limit = after_num + max_numbers
+        while start <= limit:
+            end = min(start + chunk_size - 1, limit)
+            issued = await asyncio.gather(*(one(n) for n in range(start, end + 1)))
+            if not any(issued):
+                break
+            start = end + 1
+
+    return high_water
@@ -0,0 +1,221 @@
+# http_server.py
+# Minimal asyncio HTTP/1.1 server used for the webhook, /metrics and the
+# local stand-in servers. Standard library only, so it runs anywhere the bot does.
+
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger("up-mines-bot.http")
+
+MAX_BODY_BYTES = 20 * 1024 * 1024
+REASONS = {
+    200: "OK", 202: "Accepted", 204: "No Content", 206: "Partial Content", 302: "Found",
+    400: "Bad Request", 401: "Unauthorized", 403: "Forbidden", 404: "Not Found",
+    405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large",
+    416: "Range Not Satisfiable", 429: "Too Many Requests",
+    500: "Internal Server Error", 503: "Service Unavailable",
+}
+
+
+class Request:
+    def __init__(self, method: str, target: str, headers: Dict[str, str], body: bytes, remote):
+        parts = urlsplit(target)
+        self.method = method
+        self.path = parts.path
+        self.query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        self.headers = headers
+        self.body = body
+        self.remote = remote
+        self.match: Optional[str] = None  # path remainder for prefix routes
+
+    def json(self):
+        return json.loads(self.body or b"null")
+
+    def form(self) -> Dict[str, str]:
+        return {k: v[-1] for k, v in parse_qs(self.body.decode("utf-8", "replace")).items()}
+
+
+class Response:
+    """A response; `body` may be bytes/str or an async iterator of bytes (sent chunked)."""
+
+    def __init__(
+        self,
+        body: Union[bytes, str, AsyncIterator[bytes]] = b"",
+        status: int = 200,
+        content_type: str = "text/plain; charset=utf-8",
+        headers: Optional[Dict[str, str]] = None,
+    ):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.body = body
+        self.status = status
+        self.headers = {"Content-Type": content_type}
+        self.headers.update(headers or {})
+
+    @classmethod
+    def json(cls, payload, status: int = 200, headers: Optional[Dict[str, str]] = None):
+        return cls(json.dumps(payload), status, "application/json", headers)
+
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+class HTTPServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 8080):
+        self.host = host
+        self.port = port
+        self._routes: List[Tuple[str, str, bool, Handler]] = []
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._inflight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._connections = set()
+        self._draining = False
+
+    def route(self, method: str, path: str, handler: Handler, prefix: bool = False):
+        """Register a handler; with prefix=True, `request.match` holds the rest of the path."""
+        self._routes.append((method.upper(), path, prefix, handler))
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        # Port 0 means "pick a free one"; expose the real port for tests and benchmarks
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("HTTP server listening on %s:%s", self.host, self.port)
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """Stop accepting connections and wait for in-flight requests to finish."""
+        self._draining = True
+        if self._server:
+            self._server.close()
+        try:
+            await asyncio.wait_for(self._idle.wait(), drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("HTTP drain timed out with %s request(s) in flight", self._inflight)
+        for writer in list(self._connections):
+            writer.close()
+        if self._server:
+            await self._server.wait_closed()
+            self._server = None
+
+    # ---------- Internals ----------
+    def _resolve(self, method: str, path: str):
+        allowed = False
+        for r_method, r_path, prefix, handler in self._routes:
+            if path == r_path or (prefix and path.startswith(r_path)):
+                if r_method == method or (method == "HEAD" and r_method == "GET"):
+                    return handler, path[len(r_path):] if prefix else None
+                allowed = True
+        return (None, "405") if allowed else (None, None)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections.add(writer)
+        remote = writer.get_extra_info("peername")
+        try:
+            while not self._draining:
+                try:
+                    request_line = await reader.readline()
+                except (ConnectionError, asyncio.LimitOverrunError):
+                    break
+                if not request_line or not request_line.strip():
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._write(writer, "HEAD", Response("bad request line", 400), close=True)
+                    break
+
+                headers: Dict[str, str] = {}
+                while True:
+                    line = await reader.readline()
+                    if not line or line in (b"\r\n", b"\n"):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    length = int(headers.get("content-length") or 0)
+                    if length < 0:
+                        raise ValueError(length)
+                except ValueError:
+                    await self._write(writer, method, Response("bad content-length", 400), close=True)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self._write(writer, method, Response("body too large", 413), close=True)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                close = (
+                    headers.get("connection", "").lower() == "close"
+                    or version == "HTTP/1.0"
+                    or self._draining
+                )
+
+                self._begin()
+                try:
+                    response = await self._handle(Request(method.upper(), target, headers, body, remote))
+                    await self._write(writer, method.upper(), response, close=close)
+                finally:
+                    self._end()
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _handle(self, request: Request) -> Response:
+        handler, match = self._resolve(request.method, request.path)
+        if handler is None:
+            return Response("method not allowed", 405) if match == "405" else Response("not found", 404)
+        request.match = match
+        try:
+            return await handler(request)
+        except Exception as e:
+            logger.exception("Handler for %s %s failed: %s", request.method, request.path, e)
+            return Response("internal error", 500)
+
+    async def _write(self, writer: asyncio.StreamWriter, method: str, response: Response, close: bool):
+        headers = dict(response.headers)
+        streaming = not isinstance(response.body, (bytes, bytearray))
+        if streaming:
+            headers["Transfer-Encoding"] = "chunked"
+        else:
+            headers["Content-Length"] = str(len(response.body))
+        headers["Connection"] = "close" if close else "keep-alive"
+        head = f"HTTP/1.1 {response.status} {REASONS.get(response.status, 'Unknown')}\r\n"
+        head += "".join(f"{k}: {v}\r\n" for k, v in headers.items()) + "\r\n"
+        writer.write(head.encode("latin-1"))
+
+        if method == "HEAD":
+            if streaming:
+                await _aclose(response.body)
+        elif streaming:
+            try:
+                async for chunk in response.body:
+                    if chunk:
+                        writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                        await writer.drain()
+            finally:
+                await _aclose(response.body)
+            writer.write(b"0\r\n\r\n")
+        else:
+            writer.write(response.body)
+        await writer.drain()
+
+    def _begin(self):
+        self._inflight += 1
+        self._idle.clear()
+
+    def _end(self):
+        self._inflight -= 1
+        if self._inflight == 0:
+            self._idle.set()
+
+
+async def _aclose(iterator):
+    close = getattr(iterator, "aclose", None)
+    if close:
+        await close()
@@ -0,0 +1,97 @@
+# jobs.py
+# Registry of the bot's background jobs (fetch, login & process, PDF, pipeline).
+#
+# Every job is started through `jobs.start()` and tracked per user until it
+# finishes, so /cancel and "Exit" can stop it for real: the job task is
+# cancelled, which cancels its pending lookups, runs the `finally` blocks that
+# close browsers, and leaves the scheduler slot and session lock. Cancellation
+# waits at most CANCEL_TIMEOUT seconds and reports what was stopped.
+
+import asyncio
+import itertools
+import logging
+import os
+import time
+from typing import Coroutine, Dict, List, Optional
+
+from metrics import Counter, Gauge
+
+logger = logging.getLogger("up-mines-bot.jobs")
+
+CANCEL_TIMEOUT = float(os.getenv("CANCEL_TIMEOUT", "15"))  # seconds to wait for cancelled jobs to clean up
+
+JOBS_CANCELLED = Counter("upmines_jobs_cancelled_total", "Background jobs cancelled by their user")
+
+
+class Job:
+    """One running background job."""
+
+    def __init__(self, job_id: int, user_id: int, kind: str, label: str, task: asyncio.Task, key: str = None):
+        self.id = job_id
+        self.user_id = user_id
+        self.kind = kind
+        self.label = label
+        self.task = task
+        self.key = key  # idempotency key: a second request with the same key attaches instead of starting
+        self.started_at = time.monotonic()
+
+    def describe(self) -> str:
+        return f"{self.kind} ({self.label}), running {time.monotonic() - self.started_at:.0f}s"
+
+
+class JobRegistry:
+    def __init__(self):
+        self._jobs: Dict[int, Job] = {}
+        self._ids = itertools.count(1)
+
+    def start(self, user_id: int, kind: str, label: str, coro: Coroutine, key: str = None) -> Job:
+        """Run `coro` as a tracked task; it is forgotten once it finishes."""
+        job_id = next(self._ids)
+        job = self._jobs[job_id] = Job(job_id, user_id, kind, label, asyncio.create_task(coro), key)
+        job.task.add_done_callback(lambda _: self._jobs.pop(job_id, None))
+        return job
+
+    def for_user(self, user_id: int) -> List[Job]:
+        return [job for job in self._jobs.values() if job.user_id == user_id and not job.task.done()]
+
+    def find(self, user_id: int, key: str) -> Optional[Job]:
+        """The user's running job with this idempotency key, if any."""
+        return next((job for job in self.for_user(user_id) if job.key == key), None)
+
+    def running(self) -> int:
+        return sum(1 for job in list(self._jobs.values()) if not job.task.done())
+
+    async def cancel(self, job: Job, timeout: float = CANCEL_TIMEOUT) -> bool:
+        """Cancel one job and wait (bounded) until it has cleaned up. False if it is still stopping."""
+        if job.task.done():
+            return True
+        pending = await self._cancel([job], timeout)
+        logger.info("Cancelled job %s for user %s: %s", job.id, job.user_id, job.describe())
+        return not pending
+
+    async def cancel_user(self, user_id: int, timeout: float = CANCEL_TIMEOUT) -> List[Job]:
+        """Cancel the user's jobs and wait (bounded) until they have cleaned up. Returns the cancelled jobs."""
+        current = asyncio.current_task()
+        cancelled = [job for job in self.for_user(user_id) if job.task is not current]
+        if not cancelled:
+            return []
+        pending = await self._cancel(cancelled, timeout)
+        if pending:
+            # Still unwinding (e.g. a browser that will not close); it keeps going in the background
+            logger.warning("%d job(s) for user %s still stopping after %.0fs", len(pending), user_id, timeout)
+        for job in cancelled:
+            logger.info("Cancelled job %s for user %s: %s", job.id, user_id, job.describe())
+        return cancelled
+
+    @staticmethod
+    async def _cancel(to_cancel: List[Job], timeout: float):
+        """Cancel the jobs' tasks; returns the ones still running after `timeout` seconds."""
+        for job in to_cancel:
+            job.task.cancel()
+        JOBS_CANCELLED.inc(len(to_cancel))
+        _, pending = await asyncio.wait([job.task for job in to_cancel], timeout=timeout)
+        return pending
+
+
+jobs = JobRegistry()
+Gauge("upmines_background_jobs", "Background jobs currently running", callback=jobs.running)
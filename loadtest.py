@@ -0,0 +1,265 @@
+# loadtest.py
+# Simulated-user load test: runs the real bot (webhook mode, in this process)
+# against the local fake Bot API and mock portal, drives hundreds of users
+# through /start -> start/end/district -> Login & Process -> Generate PDF ->
+# download, and reports end-to-end latency percentiles, event-loop lag and
+# peak RSS.
+#
+#   python loadtest.py --users 200 --ramp 20 --count 10
+#   python loadtest.py --users 500 --flow fetch --json
+
+import os
+import tempfile
+
+# Must be set before the bot modules read their configuration
+os.environ.setdefault("BOT_TOKEN", "123:FAKE")
+os.environ.setdefault("METRICS_PORT", "0")
+os.environ.setdefault("WARMUP", "none")
+os.environ.setdefault("STATE_DIR", tempfile.mkdtemp(prefix="upmines-loadtest-state-"))
+
+import argparse
+import asyncio
+import json
+import resource
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+import portal
+from bench_pipeline import START_NUM, percentile
+from bench_startup import rss_mb
+from fake_bot_api import FakeBotAPI, free_port
+from http_server import HTTPServer
+from mock_portal import MockPortal, MockPortalConfig
+
+FLOWS = ("fetch", "process", "pdf", "download")
+FIRST_USER_ID = 700000
+
+
+def tree_rss_mb(root_pid: int) -> float:
+    """RSS of a process plus all its descendants (the bot and its Chromium instances)."""
+    children = defaultdict(list)
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children[ppid].append(int(name))
+    total, stack = 0.0, [root_pid]
+    while stack:
+        pid = stack.pop()
+        total += rss_mb(pid)
+        stack.extend(children.get(pid, ()))
+    return total
+
+
+class Monitor:
+    """Samples event-loop lag and process-tree RSS while the test runs."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.lags: List[float] = []
+        self.peak_tree_rss = 0.0
+        self._tasks: List[asyncio.Task] = []
+
+    async def _lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - started - self.interval))
+
+    async def _rss(self):
+        while True:
+            rss = await asyncio.to_thread(tree_rss_mb, os.getpid())
+            self.peak_tree_rss = max(self.peak_tree_rss, rss)
+            await asyncio.sleep(0.5)
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._lag()), asyncio.create_task(self._rss())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+# ---------- One simulated user ----------
+def _text(*needles):
+    return lambda m: any(n in m.get("text", "") for n in needles)
+
+
+def _buttons(message: dict) -> List[str]:
+    markup = message.get("reply_markup") or {}
+    if isinstance(markup, str):
+        markup = json.loads(markup)
+    return [b.get("callback_data", "") for row in markup.get("inline_keyboard", []) for b in row]
+
+
+async def simulate_user(api: FakeBotAPI, user_id: int, start: int, end: int, district: str,
+                        flow: str, timeout: float) -> Dict[str, object]:
+    steps: Dict[str, float] = {}
+    result = {"user_id": user_id, "steps": steps, "ok": False, "failed_at": None}
+
+    async def step(name: str, update: dict, predicate, ok=lambda m: True):
+        mark = len(api.sent[user_id])
+        started = time.perf_counter()
+        await api.push(update)
+        try:
+            message = await api.wait_for(user_id, predicate, timeout=timeout, since=mark)
+        except asyncio.TimeoutError:
+            result["failed_at"] = f"{name}: timeout"
+            return None
+        steps[name] = time.perf_counter() - started
+        if not ok(message):
+            result["failed_at"] = f"{name}: {message.get('text', '')[:60]}"
+            return None
+        return message
+
+    started = time.perf_counter()
+    try:
+        if not await step("start", api.make_message(user_id, "/start"), _text("start number")):
+            return result
+        if not await step("start_num", api.make_message(user_id, str(start)), _text("end number")):
+            return result
+        if not await step("end_num", api.make_message(user_id, str(end)), _text("district")):
+            return result
+        fetched = await step(
+            "fetch", api.make_message(user_id, district),
+            _text("Data fetched", "No data found", "Error while fetching"), _text("Data fetched"),
+        )
+        if not fetched or flow == "fetch":
+            result["ok"] = bool(fetched)
+            return result
+        # Job buttons carry the session's data key, so tap the button the bot actually sent
+        login = next((b for b in _buttons(fetched) if b.startswith("login_process")), "login_process")
+        processed = await step(
+            "process", api.make_callback(user_id, login, fetched),
+            _text("generate PDF", "Error during process"), _text("generate PDF"),
+        )
+        if not processed or flow == "process":
+            result["ok"] = bool(processed)
+            return result
+        generate = next((b for b in _buttons(processed) if b.startswith("generate_pdf")), "generate_pdf")
+        pdfs = await step(
+            "pdf", api.make_callback(user_id, generate, processed),
+            _text("download your PDFs", "No PDFs", "Error during PDF"), _text("download your PDFs"),
+        )
+        if not pdfs or flow == "pdf":
+            result["ok"] = bool(pdfs)
+            return result
+        first_pdf = next((b for b in _buttons(pdfs) if b.startswith("pdf_")), None)
+        if not first_pdf:
+            result["failed_at"] = "download: no PDF buttons"
+            return result
+        document = await step(
+            "download", api.make_callback(user_id, first_pdf, pdfs),
+            lambda m: "document" in m or "PDF" in m.get("text", ""), lambda m: "document" in m,
+        )
+        result["ok"] = bool(document)
+        return result
+    finally:
+        result["total"] = time.perf_counter() - started
+
+
+# ---------- Runner ----------
+async def run(args) -> dict:
+    import bot
+    import webhook
+
+    mock = MockPortal(MockPortalConfig(latency=args.latency, jitter=args.latency / 3, missing_density=args.missing))
+    await mock.start()
+    portal.PORTAL_ROOT = mock.url
+    api = FakeBotAPI(latency=args.api_latency)
+    await api.start()
+
+    webhook.WEBHOOK_SECRET = "loadtest"
+    port = free_port()
+    app = bot.build_application(bot_token="123:FAKE", base_url=api.base_url, webhook=True)
+    stop = asyncio.Event()
+    runner = asyncio.create_task(webhook.run_webhook(
+        app, stop_event=stop, server=HTTPServer("127.0.0.1", port), webhook_url=f"http://127.0.0.1:{port}",
+    ))
+    for _ in range(200):
+        if api.webhook:
+            break
+        await asyncio.sleep(0.05)
+
+    monitor = Monitor()
+    monitor.start()
+    users = []
+    started = time.perf_counter()
+    try:
+        async def launch(i: int):
+            await asyncio.sleep(args.ramp * i / max(1, args.users))
+            first = args.start + i * args.count
+            district = mock.district_of(first)
+            return await simulate_user(api, FIRST_USER_ID + i, first, first + args.count - 1,
+                                       district, args.flow, args.timeout)
+
+        users = await asyncio.gather(*(launch(i) for i in range(args.users)))
+    finally:
+        wall = time.perf_counter() - started
+        await monitor.stop()
+        for user in users:
+            bot.cleanup_user(user["user_id"])
+        stop.set()
+        await runner
+        await api.stop()
+        await mock.stop()
+
+    totals = [u["total"] for u in users if u["ok"]]
+    failures = defaultdict(int)
+    for user in users:
+        if not user["ok"]:
+            failures[(user["failed_at"] or "unknown").split(":")[0]] += 1
+    step_names = ["start", "start_num", "end_num", "fetch", "process", "pdf", "download"]
+    return {
+        "users": args.users,
+        "flow": args.flow,
+        "completed": len(totals),
+        "failed": dict(failures),
+        "wall_s": round(wall, 2),
+        "e2e_p50_s": round(percentile(totals, 50), 3),
+        "e2e_p95_s": round(percentile(totals, 95), 3),
+        "e2e_p99_s": round(percentile(totals, 99), 3),
+        "steps_p95_s": {
+            name: round(percentile([u["steps"][name] for u in users if name in u["steps"]], 95), 3)
+            for name in step_names if any(name in u["steps"] for u in users)
+        },
+        "loop_lag_p99_ms": round(percentile(monitor.lags, 99) * 1000, 1),
+        "loop_lag_max_ms": round(max(monitor.lags, default=0) * 1000, 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "peak_tree_rss_mb": round(monitor.peak_tree_rss, 1),
+        "portal_requests": mock.requests,
+        "api_calls": len(api.calls),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated-user load test against the fake Bot API")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--ramp", type=float, default=10, help="seconds over which users arrive")
+    parser.add_argument("--flow", default="download", choices=FLOWS, help="how far each user goes")
+    parser.add_argument("--start", type=int, default=START_NUM)
+    parser.add_argument("--count", type=int, default=10, help="eMM11 numbers per user scan")
+    parser.add_argument("--latency", type=float, default=0.1, help="mock portal latency (s)")
+    parser.add_argument("--missing", type=float, default=0.1)
+    parser.add_argument("--api-latency", type=float, default=0.0, help="fake Bot API latency (s)")
+    parser.add_argument("--timeout", type=float, default=600, help="per-step timeout (s)")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for key, value in report.items():
+        print(f"{key:<18} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,53 @@
 import asyncio
+import threading
 from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
-import easyocr
 
 from emm11_processor import process_emm11
+from metrics import ACTIVE_BROWSERS, CAPTCHA_SECONDS
+from portal import PortalUnavailable, login_url, navigate
+from tracing import span
 
-# Initialize OCR once
-reader = easyocr.Reader(['en'], gpu=False)
+AADHAR_NUMBER = "855095518363"   # Replace with secure handling later
+PASSWORD = "Nic@1616"
 
-async def login_to_website(data, log_callback):
-    """
-    Login and process eMM11 data for a single user session.
-    data: list of dicts containing at least 'eMM11_num' keys
-    log_callback: async function(message: str) to send logs to user
-    """
-
-    aadhar_number = "855095518363"   # Replace with secure handling later
-    password = "Nic@1616"
-    max_attempts = 5
-
-    await log_callback("🔄 Starting login process...")
-
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(
-            headless=True,
-            args=["--no-sandbox", "--disable-setuid-sandbox"]
-        )
-        context_browser = await browser.new_context()
-        page = await context_browser.new_page()
+# Initialize OCR once, on first use: importing easyocr pulls in torch and the
+# model weights, which should not delay bot startup for users who never log in.
+_reader = None
+_reader_lock = threading.Lock()
 
-        # Load login page
-        try:
-            await page.goto("https://upmines.upsdc.gov.in/DefaultLicense.aspx", timeout=20000)
-        except PlaywrightTimeoutError:
-            await log_callback("❌ Failed to load login page. Server may be down.")
-            await browser.close()
-            return
 
-        await page.wait_for_timeout(2000)
-        login_success = False
+def get_reader():
+    """Return the shared EasyOCR reader, building it on the first call (blocking)."""
+    global _reader
+    with _reader_lock:
+        if _reader is None:
+            import easyocr
+            _reader = easyocr.Reader(['en'], gpu=False)
+    return _reader
 
-        # Try login with captcha
-        for attempt in range(1, max_attempts + 1):
-            # await log_callback(f"Attempt {attempt} of {max_attempts}...")
 
+async def portal_login(page, log_callback, aadhar_number, password, max_attempts=5):
+    """
+    Open the login page on `page` and sign in, solving the captcha with OCR.
+    Returns True once the licensee menu is visible.
+    """
+    # Load login page
+    try:
+        await navigate(lambda: page.goto(login_url(), timeout=20000))
+    except PlaywrightTimeoutError:
+        await log_callback("❌ Failed to load login page. Server may be down.")
+        return False
+
+    await page.wait_for_timeout(2000)
+    # Model loading and OCR are CPU-bound; keep them off the event loop
+    reader = await asyncio.to_thread(get_reader)
+
+    # Try login with captcha
+    for attempt in range(1, max_attempts + 1):
+        # await log_callback(f"Attempt {attempt} of {max_attempts}...")
+
+        with span("captcha_attempt", attempt=attempt) as args, \
+                CAPTCHA_SECONDS.time(outcome="rejected") as timer:
             try:
                 await page.fill("#ContentPlaceHolder1_txtAadharNumber", aadhar_number)
                 await page.fill("#ContentPlaceHolder1_txtPassword", password)
@@ -50,12 +55,13 @@ async def login_to_website(data, log_callback):
                 # Read captcha
                 captcha_elem = await page.query_selector("#Captcha")
                 captcha_bytes = await captcha_elem.screenshot()
-                result = reader.readtext(captcha_bytes, detail=0)
+                result = await asyncio.to_thread(reader.readtext, captcha_bytes, detail=0)
 
                 captcha_text = result[0].strip() if result else ""
                 if not captcha_text.isdigit():
+                    timer.outcome = "unreadable"
                     await log_callback("⚠️ Captcha not recognized, retrying...")
-                    await page.reload()
+                    await navigate(page.reload)
                     await page.wait_for_timeout(1500)
                     continue
 
@@ -65,7 +71,7 @@ async def login_to_website(data, log_callback):
 
                 try:
                     await page.wait_for_selector('#pnlMenuEng', timeout=5000)
-                    login_success = True
+                    timer.outcome = "success"
 
                     async def handle_dialog(dialog):
                         await dialog.accept()
@@ -73,29 +79,60 @@ async def login_to_website(data, log_callback):
                     page.once("dialog", handle_dialog)
                     # await log_callback("✅ Login successful!")
                     await page.wait_for_timeout(1500)
-                    break
+                    return True
 
                 except PlaywrightTimeoutError:
                     # await log_callback("⚠️ Login failed, retrying...")
-                    await page.reload()
+                    await navigate(page.reload)
                     await page.wait_for_timeout(2000)
 
+            except PortalUnavailable:
+                # Portal is down: stop burning captcha attempts
+                timer.outcome = "unavailable"
+                raise
             except Exception as e:
                 # await log_callback(f"⚠️ Error: {e}, retrying...")
-                await page.reload()
+                timer.outcome = "error"
+                await navigate(page.reload)
                 await page.wait_for_timeout(2000)
+            finally:
+                args["outcome"] = timer.outcome
 
-        if not login_success:
-            # await log_callback("❌ Could not log in after multiple attempts.")
-            await browser.close()
-            return
+    # await log_callback("❌ Could not log in after multiple attempts.")
+    return False
 
-        # Process eMM11 data
+
+async def login_to_website(data, log_callback):
+    """
+    Login and process eMM11 data for a single user session.
+    data: iterable of records (dicts or Emm11Record) with at least an 'eMM11_num' key
+    log_callback: async function(message: str) to send logs to user
+    """
+
+    max_attempts = 5
+
+    await log_callback("🔄 Starting login process...")
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(
+            headless=True,
+            args=["--no-sandbox", "--disable-setuid-sandbox"]
+        )
+        ACTIVE_BROWSERS.inc()
         try:
-            emm11_numbers_list = [record["eMM11_num"] for record in data if "eMM11_num" in record]
-            await process_emm11(page, emm11_numbers_list, log_callback)
-        except Exception as e:
-            await log_callback(f"❌ Error during eMM11 processing: {e}")
+            context_browser = await browser.new_context()
+            page = await context_browser.new_page()
+
+            if not await portal_login(page, log_callback, AADHAR_NUMBER, PASSWORD, max_attempts):
+                return
 
-        await browser.close()
-        # await log_callback("✅ Process completed.")
+            # Process eMM11 data
+            try:
+                emm11_numbers_list = (record["eMM11_num"] for record in data if "eMM11_num" in record)
+                await process_emm11(page, emm11_numbers_list, log_callback)
+            except Exception as e:
+                await log_callback(f"❌ Error during eMM11 processing: {e}")
+        finally:
+            await browser.close()
+            ACTIVE_BROWSERS.dec()
+            # await log_callback("✅ Process completed.")
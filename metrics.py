@@ -0,0 +1,192 @@
+# metrics.py
+# Tiny Prometheus-style metrics: counters, gauges and latency histograms with
+# labels, rendered in the text exposition format on GET /metrics.
+
+import asyncio
+import bisect
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from http_server import HTTPServer, Request, Response
+
+logger = logging.getLogger("up-mines-bot.metrics")
+
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))  # 0 disables the endpoint
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    inner = ",".join('%s="%s"' % (k, v.replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + inner + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()  # PDF rendering may run in worker threads
+        REGISTRY.append(self)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            return [f"{self.name}{_format_labels(k)} {v}" for k, v in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """A gauge set directly, or computed at scrape time from `callback`."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation)
+        self._values: Dict[LabelKey, float] = {}
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def _samples(self):
+        if self.callback is not None:
+            try:
+                self.set(self.callback())
+            except Exception as e:
+                logger.warning("Gauge %s callback failed: %s", self.name, e)
+        with self._lock:
+            return [f"{self.name}{_format_labels(k)} {v}" for k, v in sorted(self._values.items())]
+
+
+class _Timer:
+    """Times a block; set `.outcome` inside it. Exceptions are recorded as outcome="error"."""
+
+    def __init__(self, histogram: "Histogram", outcome: str, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.outcome = outcome
+        self.labels = labels
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        outcome = self.outcome
+        if exc_type is not None:
+            outcome = "cancelled" if issubclass(exc_type, asyncio.CancelledError) else "error"
+        self.histogram.observe(time.perf_counter() - self.started, outcome=outcome, **self.labels)
+        return False
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets))
+        self._data: Dict[LabelKey, List[float]] = {}  # bucket counts..., +Inf count, sum
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            data = self._data.get(key)
+            if data is None:
+                data = self._data[key] = [0.0] * (len(self.buckets) + 2)
+            data[bisect.bisect_left(self.buckets, value)] += 1
+            data[-1] += value
+
+    def time(self, outcome: str = "ok", **labels) -> _Timer:
+        return _Timer(self, outcome, labels)
+
+    def _samples(self):
+        lines = []
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._data.items())
+        for key, data in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), data[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(key, (('le', le),))} {cumulative}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {data[-1]}")
+        return lines
+
+
+REGISTRY: List[_Metric] = []
+
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+# ---------- Pipeline metrics ----------
+FETCH_SECONDS = Histogram("upmines_fetch_seconds", "Time to look up one eMM11 number")
+FETCH_COALESCED = Counter("upmines_fetch_coalesced_total", "Lookups served by an identical in-flight lookup")
+CAPTCHA_SECONDS = Histogram("upmines_captcha_attempt_seconds", "Time per portal login/captcha attempt")
+TP_CHECK_SECONDS = Histogram("upmines_tp_check_seconds", "Time per eFormC TP eligibility check")
+PDF_SCRAPE_SECONDS = Histogram("upmines_pdf_scrape_seconds", "Time to scrape one TP's print page")
+PDF_RENDER_SECONDS = Histogram("upmines_pdf_render_seconds", "Time to render one TP's PDF")
+TELEGRAM_SEND_SECONDS = Histogram(
+    "upmines_telegram_send_seconds", "Time per Telegram API send/edit",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30),
+)
+ACTIVE_BROWSERS = Gauge("upmines_active_browsers", "Chromium instances currently open")
+
+
+# ---------- Endpoint ----------
+async def _metrics_handler(request: Request) -> Response:
+    return Response(render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+async def start_metrics_server(host: str = METRICS_LISTEN, port: int = METRICS_PORT) -> Optional[HTTPServer]:
+    if not port:
+        return None
+    server = HTTPServer(host, port)
+    server.route("GET", "/metrics", _metrics_handler)
+    await server.start()
+    return server
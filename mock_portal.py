@@ -0,0 +1,282 @@
+# mock_portal.py
+# Local stand-in for upmines.upsdc.gov.in, for offline benchmarks and
+# development. It serves the pages the bot drives:
+#   - PrintRegistrationFormVehicleCheckValidOrNot.aspx?eId=N  (print page)
+#   - DefaultLicense.aspx                                     (login + captcha)
+#   - eFormC postback page                                    (TP eligibility)
+# with configurable latency, error rate and missing-number density.
+#
+#   python mock_portal.py --port 8090 --latency 0.2 --error-rate 0.02 --missing 0.1
+#   UPMINES_PORTAL_URL=http://127.0.0.1:8090 python bot.py
+
+import argparse
+import asyncio
+import hashlib
+import html
+import logging
+import random
+import secrets
+from dataclasses import dataclass
+from typing import Dict, Tuple
+
+from http_server import HTTPServer, Request, Response
+
+logger = logging.getLogger("up-mines-bot.mock-portal")
+
+PRINT_PATH = "/Registration/PrintRegistrationFormVehicleCheckValidOrNot.aspx"
+LOGIN_PATH = "/DefaultLicense.aspx"
+HOME_PATH = "/Licensee/Home.aspx"
+EFORMC_PATH = "/Licensee/ApplyEFormCByTransitPass.aspx"
+
+DISTRICTS = (
+    "LUCKNOW", "KANPUR NAGAR", "PRAYAGRAJ", "VARANASI", "AGRA",
+    "GORAKHPUR", "MEERUT", "BAREILLY", "JHANSI", "HAMIRPUR",
+)
+
+
+@dataclass
+class MockPortalConfig:
+    latency: float = 0.15          # mean seconds added to every page
+    jitter: float = 0.05           # +/- uniform jitter on latency
+    error_rate: float = 0.0        # fraction of requests answered with HTTP 500
+    missing_density: float = 0.1   # fraction of eMM11 numbers that do not exist
+    unused_rate: float = 0.5       # fraction of existing TPs eligible for eFormC
+    districts: Tuple[str, ...] = DISTRICTS
+    seed: int = 7
+    # Numbers above this are "not issued yet" (for crawler/delta scans); 0 = unlimited
+    max_issued: int = 0
+
+
+@dataclass
+class _Session:
+    captcha: str = ""
+    logged_in: bool = False
+
+
+def _digest(num: int, salt: str) -> float:
+    """Deterministic pseudo-random value in [0, 1) per number, stable across runs."""
+    h = hashlib.blake2b(f"{salt}:{num}".encode(), digest_size=8).digest()
+    return int.from_bytes(h, "big") / 2 ** 64
+
+
+class MockPortal:
+    def __init__(self, config: MockPortalConfig = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or MockPortalConfig()
+        self.server = HTTPServer(host, port)
+        self.server.route("GET", PRINT_PATH, self._print_page)
+        self.server.route("GET", LOGIN_PATH, self._login_page)
+        self.server.route("POST", LOGIN_PATH, self._login_submit)
+        self.server.route("GET", HOME_PATH, self._home_page)
+        self.server.route("GET", EFORMC_PATH, self._eformc_page)
+        self.server.route("POST", EFORMC_PATH, self._eformc_submit)
+        self.server.route("GET", "/", self._root)
+        self._sessions: Dict[str, _Session] = {}
+        self._rng = random.Random(self.config.seed)
+        self.requests = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.server.host}:{self.server.port}"
+
+    async def start(self):
+        await self.server.start()
+
+    async def stop(self):
+        await self.server.stop(drain_timeout=1)
+
+    # ---------- Data model ----------
+    def exists(self, num: int) -> bool:
+        if self.config.max_issued and num > self.config.max_issued:
+            return False
+        return _digest(num, "exists") >= self.config.missing_density
+
+    def district_of(self, num: int) -> str:
+        districts = self.config.districts
+        return districts[int(_digest(num, "district") * len(districts))]
+
+    def is_unused(self, num: int) -> bool:
+        return _digest(num, "unused") < self.config.unused_rate
+
+    def record(self, num: int) -> Dict[str, str]:
+        day = 1 + int(_digest(num, "day") * 28)
+        return {
+            "lbl_etpNo": f"ETP{num}",
+            "lbl_destination_district": self.district_of(num),
+            "lbl_qty_to_Transport": f"{10 + int(_digest(num, 'qty') * 40)}.00",
+            "lbl_destination_address": f"PLOT {num % 997}, INDUSTRIAL AREA, {self.district_of(num)}",
+            "txt_etp_generated_on": f"{day:02d}-10-2026 {num % 24:02d}:{num % 60:02d}:00",
+            "txt_etp_valid_upto": f"{min(day + 1, 28):02d}-10-2026 {num % 24:02d}:{num % 60:02d}:00",
+            "lbl_distrance": f"{20 + num % 180} KM",
+            "lbl_name_of_lease": "M/S SHREE GANESH STONE CRUSHER AND MINING WORKS PVT LTD",
+            "lbl_mobile_no": f"98{num % 100000000:08d}",
+            "lbl_SerialNumber": str(num % 100000),
+            "lbl_LeaseId": f"L{num % 9000 + 1000}",
+            "lbl_leaseDetails": "GATA NO 123/4 AREA 4.05 HECTARE VILLAGE RAMPUR TEHSIL SADAR",
+            "lbl_tehsil": "SADAR",
+            "lbl_district": "HAMIRPUR",
+            "lbl_type_of_mining_mineral": "MORRUM (ORDINARY SAND)",
+            "lbl_loadingfrom": "LEASE AREA",
+            "lbl_travel_duration": f"{1 + num % 10} HOURS",
+            "pit": f"{(num % 50) * 10}",
+            "lbl_registraton_number_of_vehicle": f"UP{num % 90 + 10}AT{num % 9000 + 1000}",
+            "lbl_name_of_driver": "RAMESH KUMAR",
+            "lbl_mobile_number_of_driver": f"97{num % 100000000:08d}",
+        }
+
+    # ---------- Helpers ----------
+    async def _delay(self) -> bool:
+        """Simulate latency; returns False when this request should fail."""
+        self.requests += 1
+        cfg = self.config
+        await asyncio.sleep(max(0.0, cfg.latency + self._rng.uniform(-cfg.jitter, cfg.jitter)))
+        return self._rng.random() >= cfg.error_rate
+
+    def _session(self, request: Request) -> Tuple[str, _Session]:
+        cookies = dict(
+            part.strip().split("=", 1) for part in request.headers.get("cookie", "").split(";") if "=" in part
+        )
+        sid = cookies.get("ASP.NET_SessionId")
+        if sid not in self._sessions:
+            sid = secrets.token_hex(8)
+            self._sessions[sid] = _Session()
+        return sid, self._sessions[sid]
+
+    @staticmethod
+    def _page(title: str, body: str, sid: str = None, status: int = 200, headers=None) -> Response:
+        headers = dict(headers or {})
+        if sid:
+            headers["Set-Cookie"] = f"ASP.NET_SessionId={sid}; Path=/; HttpOnly"
+        doc = f"<!DOCTYPE html><html><head><title>{title}</title></head><body>{body}</body></html>"
+        return Response(doc, status, "text/html; charset=utf-8", headers)
+
+    # ---------- Pages ----------
+    async def _root(self, request: Request) -> Response:
+        if not await self._delay():
+            return Response("Server Error", 500)
+        return self._page("UP Mines", "<h1>Directorate of Geology and Mining</h1>")
+
+    async def _print_page(self, request: Request) -> Response:
+        if not await self._delay():
+            return Response("Server Error in '/' Application.", 500)
+        try:
+            num = int(request.query.get("eId", ""))
+        except ValueError:
+            num = -1
+        if num < 0 or not self.exists(num):
+            # The real portal renders an empty shell without the data labels
+            return self._page("Print", "<div id='divPrint'><span>Record not found</span></div>")
+        spans = "".join(
+            f"<div><span id='{key}'>{html.escape(value)}</span></div>" for key, value in self.record(num).items()
+        )
+        return self._page("Print", f"<div id='divPrint'>{spans}</div>")
+
+    async def _login_page(self, request: Request, error: str = "") -> Response:
+        if not await self._delay():
+            return Response("Server Error", 500)
+        sid, session = self._session(request)
+        session.captcha = str(self._rng.randint(10000, 99999))
+        body = f"""
+<form method="post" action="{LOGIN_PATH}">
+  <input id="ContentPlaceHolder1_txtAadharNumber" name="aadhar" type="text">
+  <input id="ContentPlaceHolder1_txtPassword" name="password" type="password">
+  <span id="Captcha" style="display:inline-block;padding:6px 12px;background:#fff;color:#000;
+        font:32px monospace;letter-spacing:4px">{session.captcha}</span>
+  <input id="ContentPlaceHolder1_txtCaptcha" name="captcha" type="text">
+  <input id="ContentPlaceHolder1_btn_captcha" type="submit" value="Login">
+  <span id="lblError">{html.escape(error)}</span>
+</form>"""
+        return self._page("Login", body, sid)
+
+    async def _login_submit(self, request: Request) -> Response:
+        if not await self._delay():
+            return Response("Server Error", 500)
+        sid, session = self._session(request)
+        form = request.form()
+        if session.captcha and form.get("captcha", "").strip() == session.captcha:
+            session.logged_in = True
+            return self._page("Redirect", "", sid, 302, {"Location": HOME_PATH})
+        return await self._login_page(request, "Invalid captcha")
+
+    async def _home_page(self, request: Request) -> Response:
+        if not await self._delay():
+            return Response("Server Error", 500)
+        sid, session = self._session(request)
+        if not session.logged_in:
+            return self._page("Redirect", "", sid, 302, {"Location": LOGIN_PATH})
+        body = f"""
+<div id="pnlMenuEng">
+  <a href="#" onclick="document.getElementById('sub').style.display='block';return false;">Master Entries</a>
+  <div id="sub" style="display:none">
+    <a href="{EFORMC_PATH}">Apply for eFormC Quantity by Transit Pass Number</a>
+  </div>
+</div>"""
+        return self._page("Home", body, sid)
+
+    def _eformc_form(self, message: str = "") -> str:
+        error = f'<span id="ContentPlaceHolder1_ErrorLbl">{html.escape(message)}</span>' if message else ""
+        return f"""
+<div id="pnlMenuEng">
+  <a href="#" onclick="document.getElementById('sub').style.display='block';return false;">Master Entries</a>
+  <div id="sub" style="display:none">
+    <a href="{EFORMC_PATH}">Apply for eFormC Quantity by Transit Pass Number</a>
+  </div>
+</div>
+<form method="post" action="{EFORMC_PATH}">
+  <select id="ContentPlaceHolder1_ddl_LicenseeID" name="licensee">
+    <option value="">--Select--</option><option value="L1001">L1001</option>
+  </select>
+  <input id="ContentPlaceHolder1_RbtWise_0" name="wise" type="radio" value="tp">
+  <input id="ContentPlaceHolder1_txt_eMM11No" name="emm11" type="text">
+  <input id="ContentPlaceHolder1_btnProceed" type="submit" value="Proceed">
+  {error}
+</form>"""
+
+    async def _eformc_page(self, request: Request) -> Response:
+        if not await self._delay():
+            return Response("Server Error", 500)
+        sid, session = self._session(request)
+        if not session.logged_in:
+            return self._page("Redirect", "", sid, 302, {"Location": LOGIN_PATH})
+        return self._page("eFormC", self._eformc_form(), sid)
+
+    async def _eformc_submit(self, request: Request) -> Response:
+        if not await self._delay():
+            return Response("Server Error", 500)
+        sid, session = self._session(request)
+        if not session.logged_in:
+            return self._page("Redirect", "", sid, 302, {"Location": LOGIN_PATH})
+        try:
+            num = int(request.form().get("emm11", ""))
+        except ValueError:
+            return self._page("eFormC", self._eformc_form("Invalid eMM11 number"), sid)
+        if not self.exists(num):
+            message = "Invalid eMM11 number"
+        elif self.is_unused(num):
+            message = "eFormC quantity not generated for storage license against this eMM11"
+        else:
+            message = ""  # already used: the portal just shows the form again
+        return self._page("eFormC", self._eformc_form(message), sid)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the UP mines portal")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.15)
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--missing", type=float, default=0.1, help="missing-number density")
+    parser.add_argument("--unused", type=float, default=0.5, help="share of TPs eligible for eFormC")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    async def serve():
+        portal = MockPortal(
+            MockPortalConfig(args.latency, args.jitter, args.error_rate, args.missing, args.unused),
+            args.host, args.port,
+        )
+        await portal.start()
+        print(f"Mock portal at {portal.url}")
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
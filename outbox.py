@@ -0,0 +1,299 @@
+# outbox.py
+# Coalescing, rate-limited Telegram outbox.
+#
+# Producers (scan entries, log lines) call `await outbox.put(chat_id, text)`.
+# Lines are buffered per chat and flushed every FLUSH_INTERVAL seconds as a
+# few large messages instead of one message per line. Progress lines can be
+# shown in a single message that is edited in place. Sends respect Telegram's
+# global and per-chat limits, and producers block when a chat's buffer is full.
+# Each chat is flushed by its own task, so one chat's per-chat interval never
+# delays another; only the global token bucket is shared. Messages that must go
+# out at once (conversation replies, keyboards, errors, documents) use
+# send_message()/send_document(), which keep their place behind the chat's
+# buffered lines and the same limits; edit_message() edits a sent message
+# (e.g. the one whose button was tapped) within the same limits. Only callback
+# query answers bypass the outbox: they are not chat messages and Telegram
+# does not count them against the send limits.
+
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Deque, Dict, Optional, Set
+
+from metrics import Gauge, TELEGRAM_SEND_SECONDS
+from tracing import span
+
+logger = logging.getLogger("up-mines-bot.outbox")
+
+FLUSH_INTERVAL = 1.5          # seconds between flushes of a chat buffer
+MAX_MESSAGE_CHARS = 4000      # Telegram hard limit is 4096
+MAX_PENDING_LINES = 500       # per chat; producers wait beyond this
+GLOBAL_RATE = 25              # messages/second across all chats (Telegram: ~30)
+PER_CHAT_INTERVAL = 1.05      # seconds between messages to one chat (Telegram: ~1/s)
+IDLE_CHAT_SECONDS = 600       # drop a chat's buffer after this long without traffic
+
+
+class _TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def take(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class _ChatBuffer:
+    def __init__(self):
+        self.lines: Deque[str] = deque()
+        self.space = asyncio.Condition()
+        self.progress_text: Optional[str] = None
+        self.progress_message_id: Optional[int] = None
+        self.progress_sent_text: Optional[str] = None
+        self.next_send_at = 0.0
+        self.sending = asyncio.Lock()
+        self.touched = time.monotonic()
+
+
+class TelegramOutbox:
+    def __init__(self, bot=None):
+        self.bot = bot
+        self._chats: Dict[int, _ChatBuffer] = {}
+        # Loop-bound primitives are created in start(), once the bot's loop is running
+        self._global: Optional[_TokenBucket] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flushing: Set[asyncio.Task] = set()
+
+    # ---------- Producer API ----------
+    async def put(self, chat_id: int, text: str):
+        """Queue a line for the chat; waits while the chat's buffer is full."""
+        buf = self._chat(chat_id)
+        buf.touched = time.monotonic()
+        with span("telegram_enqueue", cat="telegram"):
+            async with buf.space:
+                await buf.space.wait_for(lambda: len(buf.lines) < MAX_PENDING_LINES)
+                buf.lines.append(text)
+        self._wake()
+
+    def progress(self, chat_id: int, text: str):
+        """Replace the chat's progress message text (edited in place on the next flush)."""
+        buf = self._chat(chat_id)
+        buf.touched = time.monotonic()
+        buf.progress_text = text
+        self._wake()
+
+    def end_progress(self, chat_id: int):
+        """Forget the current progress message so the next one starts fresh."""
+        buf = self._chats.get(chat_id)
+        if buf:
+            buf.progress_text = buf.progress_message_id = buf.progress_sent_text = None
+
+    async def flush(self, chat_id: int):
+        """Send everything buffered for the chat right now (e.g. before showing buttons)."""
+        buf = self._chats.get(chat_id)
+        if buf:
+            await self._flush_chat(chat_id, buf)
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        """Send one message now (e.g. with a keyboard), after the chat's buffered lines.
+
+        Returns the sent message, or None if sending failed (the error is logged).
+        """
+        buf = self._chat(chat_id)
+        buf.touched = time.monotonic()
+        async with self._holding(buf):
+            await self._flush_locked(chat_id, buf)
+            return await self._send(
+                chat_id, buf, lambda: self.bot.send_message(chat_id=chat_id, text=text, **kwargs), "send"
+            )
+
+    async def edit_message(self, chat_id: int, message_id: int, text: str, **kwargs):
+        """Edit a sent message now, within the chat's limits. Returns the result, or None on failure."""
+        buf = self._chat(chat_id)
+        buf.touched = time.monotonic()
+        async with self._holding(buf):
+            return await self._send(
+                chat_id, buf,
+                lambda: self.bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text, **kwargs),
+                "edit",
+            )
+
+    async def send_document(self, chat_id: int, document, **kwargs):
+        """Upload a file (a path, reopened on every attempt, or bytes) after the chat's buffered lines.
+
+        Raises if the upload fails, so the caller can tell the user.
+        """
+        async def upload():
+            if not isinstance(document, str):
+                return await self.bot.send_document(chat_id=chat_id, document=document, **kwargs)
+            with open(document, "rb") as f:
+                return await self.bot.send_document(chat_id=chat_id, document=f, **kwargs)
+
+        buf = self._chat(chat_id)
+        buf.touched = time.monotonic()
+        async with self._holding(buf):
+            await self._flush_locked(chat_id, buf)
+            return await self._send(chat_id, buf, upload, "document", raise_errors=True)
+
+    def discard(self, chat_id: int):
+        """Drop everything still buffered for the chat (its job was cancelled)."""
+        buf = self._chats.pop(chat_id, None)
+        if buf:
+            buf.lines.clear()
+            buf.progress_text = None
+
+    # ---------- Lifecycle ----------
+    def start(self, bot):
+        self.bot = bot
+        if self._wakeup is None:
+            self._global = _TokenBucket(GLOBAL_RATE, GLOBAL_RATE)
+            self._wakeup = asyncio.Event()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
+        for chat_id, buf in list(self._chats.items()):
+            await self._flush_chat(chat_id, buf)
+
+    def pending(self) -> int:
+        return sum(len(buf.lines) for buf in self._chats.values())
+
+    # ---------- Internals ----------
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _chat(self, chat_id: int) -> _ChatBuffer:
+        buf = self._chats.get(chat_id)
+        if buf is None:
+            buf = self._chats[chat_id] = _ChatBuffer()
+        return buf
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            await asyncio.sleep(FLUSH_INTERVAL)
+            for chat_id, buf in list(self._chats.items()):
+                if buf.sending.locked():
+                    continue  # whoever holds the chat's lock wakes us again on release (see _holding)
+                if self._has_work(buf):
+                    task = asyncio.create_task(self._flush_in_background(chat_id, buf))
+                    self._flushing.add(task)
+                    task.add_done_callback(self._flushing.discard)
+                elif time.monotonic() - buf.touched > IDLE_CHAT_SECONDS:
+                    self._chats.pop(chat_id, None)
+
+    @staticmethod
+    def _has_work(buf: _ChatBuffer) -> bool:
+        return bool(buf.lines) or (buf.progress_text is not None and buf.progress_text != buf.progress_sent_text)
+
+    @asynccontextmanager
+    async def _holding(self, buf: _ChatBuffer):
+        """Hold the chat's send lock; lines queued meanwhile (which _run skipped) are flushed after release."""
+        try:
+            async with buf.sending:
+                yield
+        finally:
+            if self._has_work(buf):
+                self._wake()
+
+    async def _flush_in_background(self, chat_id: int, buf: _ChatBuffer):
+        try:
+            await self._flush_chat(chat_id, buf)
+        except Exception as e:
+            logger.error("Outbox flush failed for chat %s: %s", chat_id, e)
+
+    async def _flush_chat(self, chat_id: int, buf: _ChatBuffer):
+        async with self._holding(buf):
+            await self._flush_locked(chat_id, buf)
+
+    async def _flush_locked(self, chat_id: int, buf: _ChatBuffer):
+        while buf.lines:
+            chunk = []
+            size = 0
+            while buf.lines and size + len(buf.lines[0]) + 2 <= MAX_MESSAGE_CHARS:
+                line = buf.lines.popleft()
+                chunk.append(line)
+                size += len(line) + 2
+            if not chunk:  # a single oversized line
+                chunk.append(buf.lines.popleft()[:MAX_MESSAGE_CHARS])
+            async with buf.space:
+                buf.space.notify_all()
+            text = "\n\n".join(chunk)
+            await self._send(chat_id, buf, lambda: self.bot.send_message(chat_id=chat_id, text=text), "send")
+
+        if buf.progress_text is not None and buf.progress_text != buf.progress_sent_text:
+            text = buf.progress_text
+            if buf.progress_message_id is None:
+                message = await self._send(
+                    chat_id, buf, lambda: self.bot.send_message(chat_id=chat_id, text=text), "send"
+                )
+                buf.progress_message_id = getattr(message, "message_id", None)
+            else:
+                message_id = buf.progress_message_id
+                await self._send(
+                    chat_id, buf,
+                    lambda: self.bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text), "edit",
+                )
+            buf.progress_sent_text = text
+
+    async def _send(self, chat_id: int, buf: _ChatBuffer, request: Callable[[], Awaitable], kind: str,
+                    raise_errors: bool = False):
+        """Run one Bot API call within the per-chat interval and the global rate, retrying flood limits."""
+        for attempt in range(3):
+            wait = buf.next_send_at - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            if self._global is not None:
+                await self._global.take()
+            buf.next_send_at = time.monotonic() + PER_CHAT_INTERVAL
+            started = time.perf_counter()
+            try:
+                with span("telegram_send", cat="telegram", kind=kind):
+                    result = await request()
+                TELEGRAM_SEND_SECONDS.observe(time.perf_counter() - started, outcome="ok", kind=kind)
+                return result
+            except Exception as e:
+                retry_after = getattr(e, "retry_after", None)
+                outcome = "error" if retry_after is None else "flood"
+                TELEGRAM_SEND_SECONDS.observe(time.perf_counter() - started, outcome=outcome, kind=kind)
+                if retry_after is None:
+                    logger.error("Outbox %s to chat %s failed: %s", kind, chat_id, e)
+                    if raise_errors:
+                        raise
+                    return None
+                # Flood control: back off this chat for as long as Telegram asks
+                delay = retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+                logger.warning("Flood limit for chat %s, retrying in %.1fs", chat_id, delay)
+                buf.next_send_at = time.monotonic() + delay
+        if raise_errors:
+            raise RuntimeError(f"Telegram kept rate-limiting chat {chat_id}")
+        return None
+
+
+outbox = TelegramOutbox()
+
+Gauge("upmines_outbox_pending_lines", "Lines waiting in Telegram outbox buffers", callback=outbox.pending)
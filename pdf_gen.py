@@ -1,4 +1,5 @@
 import os
+import asyncio
 import inspect
 import base64
 import logging
@@ -11,6 +12,10 @@ from reportlab.lib.pagesizes import A4
 from reportlab.lib.utils import ImageReader
 from PyPDF2 import PdfReader, PdfWriter
 
+from metrics import ACTIVE_BROWSERS, PDF_RENDER_SECONDS, PDF_SCRAPE_SECONDS
+from portal import PortalUnavailable, navigate, print_url
+from tracing import span
+
 # ---------- Logging Setup ----------
 logging.basicConfig(
     format='[%(asctime)s] %(levelname)s: %(message)s',
@@ -123,13 +128,18 @@ def draw_data(c, data):
         except Exception as e:
             logger.warning(f"⚠️ QR drawing failed: {e}")
 
-def generate_pdf(data, template_path, output_path):
+def draw_overlay(data):
+    """Phase 1: draw the TP's fields (and QR) onto a one-page overlay PDF in memory."""
     overlay_stream = BytesIO()
     c = canvas.Canvas(overlay_stream, pagesize=A4)
     draw_data(c, data)
     c.save()
     overlay_stream.seek(0)
+    return overlay_stream
+
 
+def merge_template(overlay_stream, template_path):
+    """Phase 2: stamp the overlay onto the form template's first page."""
     bg_reader = PdfReader(template_path)
     ov_reader = PdfReader(overlay_stream)
     writer = PdfWriter()
@@ -137,10 +147,21 @@ def generate_pdf(data, template_path, output_path):
     page = bg_reader.pages[0]
     page.merge_page(ov_reader.pages[0])
     writer.add_page(page)
+    return writer
 
-    with open(output_path, "wb") as f:
+
+def write_pdf(writer, output):
+    """Phase 3: serialize the merged PDF to a path or a binary file object."""
+    if hasattr(output, "write"):
+        writer.write(output)
+        return
+    with open(output, "wb") as f:
         writer.write(f)
 
+
+def generate_pdf(data, template_path, output_path):
+    write_pdf(merge_template(draw_overlay(data), template_path), output_path)
+
     # Now draw QR code on top
     # if "qr_code_base64" in data:
     #     draw_qr_after_merge(output_path, data["qr_code_base64"])
@@ -148,6 +169,11 @@ def generate_pdf(data, template_path, output_path):
     # logger.info(f"✅ Generated PDF at: {output_path}")
 
 async def create_qr_image_base64(tp_num, url):
+    return qr_image_base64(tp_num, url)
+
+
+def qr_image_base64(tp_num, url):
+    """The TP's QR code as a PNG data URL (blocking; call it in a thread from async code)."""
     logger.info(f"🧾 Generating QR for TP: {tp_num}")
     
     if not url or not isinstance(url, str):
@@ -173,6 +199,61 @@ async def create_qr_image_base64(tp_num, url):
         logger.exception(f"❌ Exception while generating QR for TP {tp_num}: {e}")
         raise
 
+async def scrape_tp(page, tp_num, url):
+    """Open the TP's print page and read every field the form template needs."""
+    await navigate(lambda: page.goto(url, timeout=20000))
+
+    lbl_etpNo = await page.locator("#lbl_etpNo").inner_text()
+    if tp_num not in lbl_etpNo:
+        raise ValueError(f"Mismatch: expected {tp_num}, got {lbl_etpNo}")
+
+    return {
+        "distance": await page.locator('#lbl_distrance').inner_text(),
+        "destination_state": "Uttar Pradesh",
+        "emM11": tp_num,
+        "lessee_name": await page.locator('#lbl_name_of_lease').inner_text(),
+        "lessee_mobile": await page.locator("#lbl_mobile_no").inner_text(),
+        "serial_number": await page.locator("#lbl_SerialNumber").inner_text(),
+        "lessee_id": await page.locator("#lbl_LeaseId").inner_text(),
+        "lease_details": await page.locator('#lbl_leaseDetails').inner_text(),
+        "tehsil": await page.locator("#lbl_tehsil").inner_text(),
+        "district": await page.locator("#lbl_district").inner_text(),
+        "qty": await page.locator("#lbl_qty_to_Transport").inner_text(),
+        "mineral": await page.locator("#lbl_type_of_mining_mineral").inner_text(),
+        "loading_from": await page.locator("#lbl_loadingfrom").inner_text(),
+        "destination": await page.locator("#lbl_destination_address").inner_text(),
+        "destination_district": await page.locator("#lbl_destination_district").inner_text(),
+        "generated_on": await page.locator("#txt_etp_generated_on").inner_text(),
+        "valid_upto": await page.locator("#txt_etp_valid_upto").inner_text(),
+        "travel_duration": await page.locator("#lbl_travel_duration").inner_text(),
+        "pit_value": await page.locator("#pit").inner_text(),
+        "registration_number": await page.locator("#lbl_registraton_number_of_vehicle").inner_text(),
+        "driver_name": await page.locator("#lbl_name_of_driver").inner_text(),
+        "driver_mobile": await page.locator("#lbl_mobile_number_of_driver").inner_text(),
+        "vehicle_type": "14 TYRE TRUCK",
+    }
+
+
+async def render_tp(page, tp_num, output_path, template_path="form_template.pdf"):
+    """Scrape one TP's print page and render its filled-in form to `output_path`."""
+    url = print_url(tp_num)
+    with span("scrape", cat="tp", tp=tp_num), PDF_SCRAPE_SECONDS.time():
+        data = await scrape_tp(page, tp_num, url)
+
+    with span("render", cat="tp", tp=tp_num), PDF_RENDER_SECONDS.time():
+        # QR encoding and the PDF merge are CPU-bound: keep them off the event loop
+        data["qr_code_base64"] = await asyncio.to_thread(qr_image_base64, tp_num, url)
+        await asyncio.to_thread(generate_pdf, data, template_path, output_path)
+    return output_path
+
+
+async def _call(callback, *args):
+    """Invoke a callback that may be sync or async."""
+    result = callback(*args)
+    if inspect.isawaitable(result):
+        await result
+
+
 async def pdf_gen(tp_num_list, output_dir="pdf",template_path="form_template.pdf", log_callback=None, send_pdf_callback=None):
     if not tp_num_list:
         logger.info("ℹ️ No TP numbers provided.")
@@ -183,65 +264,36 @@ async def pdf_gen(tp_num_list, output_dir="pdf",template_path="form_template.pdf
 
     async with async_playwright() as p:
         browser = await p.chromium.launch(headless=True)
+        ACTIVE_BROWSERS.inc()
         context = await browser.new_context()
 
-        for tp_num in tp_num_list:
-            tp_num = str(tp_num)
-            logger.info(f"📦 Processing TP: {tp_num}")
-            try:
-                page = await context.new_page()
-                url = f"https://upmines.upsdc.gov.in/Registration/PrintRegistrationFormVehicleCheckValidOrNot.aspx?eId={tp_num}"
-                await page.goto(url, timeout=20000)
-
-                lbl_etpNo = await page.locator("#lbl_etpNo").inner_text()
-                if tp_num not in lbl_etpNo:
-                    raise ValueError(f"Mismatch: expected {tp_num}, got {lbl_etpNo}")
-
-                data = {    
-                            "distance": await page.locator('#lbl_distrance').inner_text(),
-                            "destination_state": "Uttar Pradesh",
-                            "emM11": tp_num,
-                            "lessee_name": await page.locator('#lbl_name_of_lease').inner_text(),
-                            "lessee_mobile": await page.locator("#lbl_mobile_no").inner_text(),
-                            "serial_number": await page.locator("#lbl_SerialNumber").inner_text(),
-                            "lessee_id": await page.locator("#lbl_LeaseId").inner_text(),
-                            "lease_details": await page.locator('#lbl_leaseDetails').inner_text(),
-                            "tehsil": await page.locator("#lbl_tehsil").inner_text(),
-                            "district": await page.locator("#lbl_district").inner_text(),
-                            "qty": await page.locator("#lbl_qty_to_Transport").inner_text(),
-                            "mineral": await page.locator("#lbl_type_of_mining_mineral").inner_text(),
-                            "loading_from": await page.locator("#lbl_loadingfrom").inner_text(),
-                            "destination": await page.locator("#lbl_destination_address").inner_text(),
-                            "destination_district": await page.locator("#lbl_destination_district").inner_text(),
-                            "generated_on": await page.locator("#txt_etp_generated_on").inner_text(),
-                            "valid_upto": await page.locator("#txt_etp_valid_upto").inner_text(),
-                            "travel_duration": await page.locator("#lbl_travel_duration").inner_text(),
-                            "pit_value": await page.locator("#pit").inner_text(),
-                            "registration_number": await page.locator("#lbl_registraton_number_of_vehicle").inner_text(),
-                            "driver_name": await page.locator("#lbl_name_of_driver").inner_text(),
-                            "driver_mobile": await page.locator("#lbl_mobile_number_of_driver").inner_text(),
-                            "vehicle_type": "14 TYRE TRUCK",                       
-                        }
-
-                data["qr_code_base64"] = await create_qr_image_base64(tp_num, url)
-
-                output_path = f"pdf/{tp_num}.pdf"
-                generate_pdf(data, template_path, output_path)
-                all_pdfs.append((tp_num, output_path))
-
-                logger.info(f"✅ Successfully processed TP: {tp_num}")
-
-                if send_pdf_callback:
-                    if inspect.iscoroutinefunction(send_pdf_callback):
-                        await send_pdf_callback(output_path, tp_num)
-                    else:
-                        send_pdf_callback(output_path, tp_num)
-
-                await page.close()
-
-            except Exception as e:
-                logger.error(f"❌ Failed TP {tp_num}: {e}")
-
-        await browser.close()
+        try:
+            for tp_num in tp_num_list:
+                tp_num = str(tp_num)
+                logger.info(f"📦 Processing TP: {tp_num}")
+                try:
+                    page = await context.new_page()
+                    output_path = await render_tp(page, tp_num, f"pdf/{tp_num}.pdf", template_path)
+                    all_pdfs.append((tp_num, output_path))
+
+                    logger.info(f"✅ Successfully processed TP: {tp_num}")
+                    if log_callback:
+                        await _call(log_callback, f"📄 PDF {len(all_pdfs)}/{len(tp_num_list)} ready: {tp_num}")
+
+                    if send_pdf_callback:
+                        if inspect.iscoroutinefunction(send_pdf_callback):
+                            await send_pdf_callback(output_path, tp_num)
+                        else:
+                            send_pdf_callback(output_path, tp_num)
+
+                    await page.close()
+
+                except PortalUnavailable:
+                    raise  # the portal is down: no point trying the remaining TPs
+                except Exception as e:
+                    logger.error(f"❌ Failed TP {tp_num}: {e}")
+        finally:
+            await browser.close()
+            ACTIVE_BROWSERS.dec()
 
     return all_pdfs
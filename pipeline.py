@@ -0,0 +1,162 @@
+# pipeline.py
+# One-shot pipeline: fetch, eligibility check and PDF rendering run at once.
+#
+# Every entry the fetch stage matches goes straight into a bounded queue for
+# the eligibility check (one logged-in portal page, logged in while the fetch
+# is still running); every TP that qualifies goes into a second bounded queue
+# for the PDF stage. The first PDF is ready seconds after its entry is found,
+# and the whole job takes about as long as its slowest stage instead of the
+# sum of all three. Full queues push back on the stage before them.
+
+import asyncio
+import inspect
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Optional
+
+from playwright.async_api import async_playwright
+
+from emm11_processor import check_tp, open_eformc_page
+from fetch_emm11_data import CONCURRENCY_LIMIT, fetch_emm11_data
+from login_to_website import AADHAR_NUMBER, PASSWORD, portal_login
+from metrics import ACTIVE_BROWSERS
+from pdf_gen import render_tp
+from portal import PortalUnavailable
+from tracing import span
+
+logger = logging.getLogger("up-mines-bot.pipeline")
+
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "50"))  # entries buffered between two stages
+PIPELINE_BROWSERS = 2  # the check and PDF stages each keep one browser open
+
+_DONE = object()  # end-of-stream marker passed down the queues
+
+
+async def _call(callback, *args):
+    """Invoke a callback that may be sync or async (or None)."""
+    if callback is None:
+        return
+    result = callback(*args)
+    if inspect.isawaitable(result):
+        await result
+
+
+async def run_pipeline(
+    start_num: int,
+    end_num: int,
+    district: str,
+    output_dir: str = "pdf",
+    on_entry: Optional[Callable[[dict], Awaitable[None]]] = None,
+    on_checked: Optional[Callable[[str, str], Awaitable[None]]] = None,
+    on_pdf: Optional[Callable[[str, str], Awaitable[None]]] = None,
+    log=None,
+    concurrency: int = CONCURRENCY_LIMIT,
+    queue_size: int = PIPELINE_QUEUE_SIZE,
+    template_path: str = "form_template.pdf",
+) -> dict:
+    """
+    Scan start_num..end_num and render a PDF for every eligible (unused) TP as soon as it qualifies.
+    on_entry(entry), on_checked(tp_num, outcome) and on_pdf(tp_num, path) report each stage's output;
+    log(message) gets the user-facing notes (login retries, failed checks). All may be sync or async.
+    Returns per-stage counts, the highest issued number seen, the wall time and the time to the first PDF.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    matched: asyncio.Queue = asyncio.Queue(max(1, queue_size))
+    eligible: asyncio.Queue = asyncio.Queue(max(1, queue_size))
+    stats = {"matched": 0, "checked": 0, "eligible": 0, "pdfs": 0, "first_pdf_s": None, "high_water": 0}
+    started = time.perf_counter()
+
+    async def say(msg):
+        await _call(log, msg)
+
+    async def fetch_stage():
+        def issued(num):
+            stats["high_water"] = max(stats["high_water"], num)
+
+        async def found(entry):
+            stats["matched"] += 1
+            await _call(on_entry, entry)
+            await matched.put(entry)
+
+        with span("pipeline_fetch", cat="pipeline"):
+            await fetch_emm11_data(start_num, end_num, district, data_callback=found, log=logger.info,
+                                   concurrency=concurrency, on_issued=issued)
+        await matched.put(_DONE)
+
+    async def check_stage(playwright):
+        with span("pipeline_check", cat="pipeline"):
+            browser = await playwright.chromium.launch(headless=True, args=["--no-sandbox", "--disable-setuid-sandbox"])
+            ACTIVE_BROWSERS.inc()
+            try:
+                page = await (await browser.new_context()).new_page()
+                # Log in while the fetch stage is still finding entries
+                if not await portal_login(page, say, AADHAR_NUMBER, PASSWORD):
+                    raise RuntimeError("Could not log in to the portal")
+                await open_eformc_page(page)
+                while (entry := await matched.get()) is not _DONE:
+                    tp_num = str(entry["eMM11_num"])
+                    try:
+                        outcome = await check_tp(page, tp_num)
+                    except PortalUnavailable:
+                        raise
+                    except Exception as e:
+                        # One bad TP (timeout, unexpected page) must not stop the rest of the scan
+                        logger.warning("Check failed for TP %s: %s", tp_num, e)
+                        await say(f"⚠️ TP Number: {tp_num} - Failed to process due to: {e}")
+                        continue
+                    stats["checked"] += 1
+                    await _call(on_checked, tp_num, outcome)
+                    if outcome == "unused":
+                        stats["eligible"] += 1
+                        await eligible.put(tp_num)
+            finally:
+                await browser.close()
+                ACTIVE_BROWSERS.dec()
+        await eligible.put(_DONE)
+
+    async def pdf_stage(playwright):
+        with span("pipeline_pdf", cat="pipeline"):
+            browser = await playwright.chromium.launch(headless=True)
+            ACTIVE_BROWSERS.inc()
+            try:
+                context = await browser.new_context()
+                while (tp_num := await eligible.get()) is not _DONE:
+                    page = await context.new_page()
+                    try:
+                        path = await render_tp(page, tp_num, os.path.join(output_dir, f"{tp_num}.pdf"), template_path)
+                    except PortalUnavailable:
+                        raise
+                    except Exception as e:
+                        logger.error("❌ Failed TP %s: %s", tp_num, e)
+                        continue
+                    finally:
+                        await page.close()
+                    stats["pdfs"] += 1
+                    if stats["first_pdf_s"] is None:
+                        stats["first_pdf_s"] = round(time.perf_counter() - started, 3)
+                    await _call(on_pdf, tp_num, path)
+            finally:
+                await browser.close()
+                ACTIVE_BROWSERS.dec()
+
+    async with async_playwright() as playwright:
+        tasks = [
+            asyncio.create_task(fetch_stage()),
+            asyncio.create_task(check_stage(playwright)),
+            asyncio.create_task(pdf_stage(playwright)),
+        ]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                # A failed stage would leave its neighbours blocked on a queue forever
+                if task.exception() is not None:
+                    raise task.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    stats["wall_s"] = round(time.perf_counter() - started, 3)
+    logger.info("Pipeline %s-%s %s finished: %s", start_num, end_num, district, stats)
+    return stats
@@ -0,0 +1,204 @@
+# portal.py
+# Where the UP mines portal lives. Override UPMINES_PORTAL_URL (or set
+# portal.PORTAL_ROOT at runtime) to point the bot at a local stand-in such as
+# mock_portal.py.
+#
+# Every portal navigation goes through `breaker`. After BREAKER_FAILURES
+# consecutive failures (timeouts, network errors, HTTP 5xx) the circuit opens:
+# callers fail fast with PortalUnavailable, or -- with PORTAL_DOWN_POLICY=park
+# -- wait until the portal is back. While open, a lightweight HTTP probe (no
+# browser) checks the portal every cooldown; once it answers, the circuit goes
+# half-open and lets a single real call through, which closes it again or
+# reopens it with a doubled cooldown.
+
+import asyncio
+import logging
+import os
+import time
+import urllib.error
+import urllib.request
+from typing import Optional
+
+from metrics import Counter, Gauge
+
+logger = logging.getLogger("up-mines-bot.portal")
+
+PORTAL_ROOT = os.getenv("UPMINES_PORTAL_URL", "https://upmines.upsdc.gov.in").rstrip("/")
+
+
+def print_url(emm11_num) -> str:
+    """Public print/verification page for one eMM11 (transit pass) number."""
+    return f"{PORTAL_ROOT}/Registration/PrintRegistrationFormVehicleCheckValidOrNot.aspx?eId={emm11_num}"
+
+
+def login_url() -> str:
+    return f"{PORTAL_ROOT}/DefaultLicense.aspx"
+
+
+# ---------- Circuit breaker ----------
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))         # seconds before the first probe
+BREAKER_MAX_COOLDOWN = float(os.getenv("BREAKER_MAX_COOLDOWN", "600"))
+HEALTH_TIMEOUT = float(os.getenv("PORTAL_HEALTH_TIMEOUT", "5"))
+PORTAL_DOWN_POLICY = os.getenv("PORTAL_DOWN_POLICY", "park")          # "park" or "fail"
+PARK_TIMEOUT = float(os.getenv("PORTAL_PARK_TIMEOUT", "1800"))        # longest a parked call waits
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+PORTAL_REJECTED = Counter("upmines_portal_rejected_total", "Portal calls failed fast by the open circuit")
+
+
+class PortalUnavailable(Exception):
+    """The mines portal is down (circuit open); the call was not attempted."""
+
+
+def health_check(timeout: float = HEALTH_TIMEOUT) -> bool:
+    """One plain HTTP GET of the portal root (blocking). Healthy if it answers below 500."""
+    try:
+        with urllib.request.urlopen(PORTAL_ROOT + "/", timeout=timeout) as response:
+            return response.status < 500
+    except urllib.error.HTTPError as e:
+        return e.code < 500
+    except Exception:
+        return False
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN,
+                 max_cooldown: float = BREAKER_MAX_COOLDOWN, probe=health_check):
+        self.failure_threshold = max(1, failure_threshold)
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.probe = probe
+        self.state = CLOSED
+        self.failures = 0
+        self.cooldown = cooldown
+        self.opened_at = 0.0
+        self._trial = False  # a half-open trial call is in flight
+        self._changed: Optional[asyncio.Event] = None
+        self._prober: Optional[asyncio.Task] = None
+
+    # ---------- State changes ----------
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning("Portal circuit %s -> %s", self.state, state)
+        self.state = state
+        if self._changed is not None:
+            self._changed.set()  # wake parked callers so they re-check
+            self._changed = asyncio.Event()
+
+    def record_success(self):
+        self.failures = 0
+        self._trial = False
+        self.cooldown = self.base_cooldown
+        if self.state != CLOSED:
+            self._set_state(CLOSED)
+
+    def record_failure(self, reason: str = ""):
+        self.failures += 1
+        if self.state == HALF_OPEN:
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+            self._open(reason)
+        elif self.state == CLOSED and self.failures >= self.failure_threshold:
+            self._open(reason)
+
+    def release_trial(self):
+        """A half-open trial call ended without a verdict (e.g. cancelled)."""
+        self._trial = False
+
+    def _open(self, reason: str):
+        logger.warning("Portal unhealthy after %d failure(s) (%s); next probe in %.0fs",
+                       self.failures, reason or "no detail", self.cooldown)
+        self._trial = False
+        self.opened_at = time.monotonic()
+        self._set_state(OPEN)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._prober is None or self._prober.done():
+            self._prober = asyncio.create_task(self._probe_loop())
+
+    async def _probe_loop(self):
+        while self.state == OPEN:
+            await asyncio.sleep(max(0.0, self.opened_at + self.cooldown - time.monotonic()))
+            if self.state != OPEN:
+                return
+            if await asyncio.to_thread(self.probe):
+                self._set_state(HALF_OPEN)
+                return
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+            self.opened_at = time.monotonic()
+
+    # ---------- Admission ----------
+    async def admit(self, park: bool = None, timeout: float = PARK_TIMEOUT) -> bool:
+        """Return when a portal call may proceed; raise PortalUnavailable otherwise.
+
+        With `park` (default from PORTAL_DOWN_POLICY) the caller waits up to
+        `timeout` seconds for the portal to recover instead of failing fast.
+        Returns True if the call is the half-open trial: the caller must then
+        record its verdict or call release_trial(), whatever happens.
+        """
+        park = PORTAL_DOWN_POLICY == "park" if park is None else park
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.state == CLOSED:
+                return False
+            if self.state == HALF_OPEN and not self._trial:
+                self._trial = True
+                return True
+            await self._wait_change(park, deadline)
+
+    async def wait_ready(self, park: bool = None, timeout: float = PARK_TIMEOUT):
+        """Like admit(), but only waits for the circuit to leave OPEN (takes no trial call).
+
+        Jobs call this before reserving browsers, so a parked job holds no capacity.
+        """
+        park = PORTAL_DOWN_POLICY == "park" if park is None else park
+        deadline = time.monotonic() + timeout
+        while self.state == OPEN:
+            await self._wait_change(park, deadline)
+
+    async def _wait_change(self, park: bool, deadline: float):
+        remaining = deadline - time.monotonic()
+        if not park or remaining <= 0:
+            PORTAL_REJECTED.inc()
+            raise PortalUnavailable("The mines portal is not responding; try again later.")
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._changed.wait(), remaining)
+        except asyncio.TimeoutError:
+            pass
+
+    def snapshot(self) -> dict:
+        return {"state": self.state, "failures": self.failures, "cooldown": self.cooldown}
+
+
+breaker = CircuitBreaker()
+Gauge("upmines_portal_circuit_state", "Portal circuit: 0 closed, 1 half-open, 2 open",
+      callback=lambda: {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}[breaker.state])
+
+
+async def navigate(call, *, park: bool = None, admitted: bool = None):
+    """Run one portal navigation (e.g. `lambda: page.goto(url)`) through the breaker.
+
+    A caller that already called breaker.admit() (to admit before launching a
+    browser) passes its result as `admitted`; the trial, if any, is then ours.
+    """
+    trial = await breaker.admit(park) if admitted is None else admitted
+    try:
+        try:
+            response = await call()
+        except Exception as e:
+            breaker.record_failure(type(e).__name__)
+            raise
+        status = getattr(response, "status", None)
+        if status is not None and status >= 500:
+            breaker.record_failure(f"HTTP {status}")
+            raise PortalUnavailable(f"The mines portal answered HTTP {status}.")
+        breaker.record_success()
+        return response
+    finally:
+        if trial:
+            breaker.release_trial()  # no-op after a verdict; frees the trial if the call was cancelled
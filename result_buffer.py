@@ -0,0 +1,129 @@
+# result_buffer.py
+# Compact storage for a session's scan results.
+#
+# Each entry is an Emm11Record (__slots__, integer eMM11 number, interned
+# district name) instead of a dict of five strings. Once a session holds more
+# than RESULTS_SPILL_THRESHOLD records in memory they are appended to a
+# per-session JSONL file, so a huge scan costs disk, not heap. Consumers
+# iterate the buffer lazily: spilled records first, then the in-memory tail.
+
+import json
+import logging
+import os
+import sys
+from typing import Any, Iterable, Iterator, List
+
+logger = logging.getLogger("up-mines-bot.results")
+
+RESULTS_SPILL_THRESHOLD = int(os.getenv("RESULTS_SPILL_THRESHOLD", "5000"))
+
+
+class Emm11Record:
+    """One scan result. Reads like the dict it replaces (`r["eMM11_num"]`, `r.get(...)`, `dict(r)`)."""
+
+    __slots__ = ("eMM11_num", "destination_district", "destination_address", "quantity_to_transport", "generated_on")
+
+    def __init__(self, eMM11_num, destination_district="", destination_address="",
+                 quantity_to_transport="", generated_on=""):
+        self.eMM11_num = int(eMM11_num)
+        self.destination_district = sys.intern(destination_district or "")
+        self.destination_address = destination_address or ""
+        self.quantity_to_transport = quantity_to_transport or ""
+        self.generated_on = generated_on or ""
+
+    @classmethod
+    def from_entry(cls, entry) -> "Emm11Record":
+        if isinstance(entry, cls):
+            return entry
+        return cls(**{k: entry.get(k, "") for k in cls.__slots__})
+
+    def keys(self):
+        return self.__slots__
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.__slots__
+
+    def as_dict(self) -> dict:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def __repr__(self):
+        return f"Emm11Record({self.as_dict()!r})"
+
+
+class ResultBuffer:
+    """Append-only list of Emm11Records that spills to `spill_path` above a threshold.
+
+    Not safe to iterate while another task appends or clears; the bot only
+    does either while holding the session lock.
+    """
+
+    def __init__(self, spill_path: str, spill_threshold: int = RESULTS_SPILL_THRESHOLD):
+        self.spill_path = spill_path
+        self.spill_threshold = max(1, spill_threshold)
+        self.spilled = 0
+        self._memory: List[Emm11Record] = []
+
+    def append(self, entry):
+        self._memory.append(Emm11Record.from_entry(entry))
+        if len(self._memory) >= self.spill_threshold:
+            self._spill()
+
+    def extend(self, entries: Iterable):
+        for entry in entries:
+            self.append(entry)
+
+    def _spill(self):
+        os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+        with open(self.spill_path, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(r.as_dict(), ensure_ascii=False) + "\n" for r in self._memory)
+        self.spilled += len(self._memory)
+        self._memory.clear()
+
+    def __len__(self) -> int:
+        return self.spilled + len(self._memory)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __iter__(self) -> Iterator[Emm11Record]:
+        if self.spilled:
+            with open(self.spill_path, encoding="utf-8") as f:
+                for line in f:
+                    yield Emm11Record(**json.loads(line))
+        yield from list(self._memory)
+
+    def numbers(self) -> "NumbersView":
+        return NumbersView(self)
+
+    def clear(self):
+        self._memory.clear()
+        self.spilled = 0
+        try:
+            os.remove(self.spill_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning("Could not remove spilled results %s: %s", self.spill_path, e)
+
+
+class NumbersView:
+    """Lazy, sized view of a buffer's eMM11 numbers (what the TP/PDF stages consume)."""
+
+    __slots__ = ("_buffer",)
+
+    def __init__(self, buffer: ResultBuffer):
+        self._buffer = buffer
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def __iter__(self) -> Iterator[int]:
+        return (r.eMM11_num for r in self._buffer)
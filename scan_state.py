@@ -0,0 +1,65 @@
+# scan_state.py
+# Per-user, per-district scan history for incremental ("continue") scans.
+#
+# For every district a user scans we keep the high-water mark (highest eMM11
+# number known to be covered) and the matched entries, in
+# state/scans/<user_id>.json. A continue scan then only fetches numbers issued
+# after the mark and merges them into the stored results.
+
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger("up-mines-bot.scan-state")
+
+STATE_DIR = os.getenv("STATE_DIR", "state")
+MAX_STORED_RESULTS = int(os.getenv("SCAN_STATE_MAX_RESULTS", "5000"))  # per district, newest kept
+
+
+def _path(user_id: int) -> str:
+    return os.path.join(STATE_DIR, "scans", f"{user_id}.json")
+
+
+def load_marks(user_id: int) -> Dict[str, Dict[str, Any]]:
+    """All districts this user has scanned: {DISTRICT: {high_water, results, updated_at}}."""
+    try:
+        with open(_path(user_id), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning("Unreadable scan state for user %s: %s", user_id, e)
+        return {}
+
+
+def get_mark(user_id: int, district: str) -> Optional[Dict[str, Any]]:
+    return load_marks(user_id).get(district.strip().upper())
+
+
+def record_scan(user_id: int, district: str, high_water: int, results: Iterable[dict]) -> Dict[str, Any]:
+    """Merge a finished scan into the stored state and raise the high-water mark."""
+    marks = load_marks(user_id)
+    key = district.strip().upper()
+    mark = marks.get(key) or {"high_water": 0, "results": []}
+
+    merged: Dict[int, dict] = {int(e["eMM11_num"]): e for e in mark["results"]}
+    for entry in results:
+        merged[int(entry["eMM11_num"])] = dict(entry)
+    ordered: List[dict] = [merged[n] for n in sorted(merged)][-MAX_STORED_RESULTS:]
+
+    mark = {
+        "high_water": max(int(mark["high_water"]), int(high_water)),
+        "results": ordered,
+        "updated_at": time.time(),
+    }
+    marks[key] = mark
+
+    path = _path(user_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(marks, f)
+    os.replace(tmp, path)  # atomic: a crash never leaves a half-written file
+    return mark
@@ -0,0 +1,243 @@
+# scheduler.py
+# Global admission control for the heavy jobs (fetch / login & process / PDF).
+#
+# Every job asks for a number of browser slots and OCR/CPU slots. Jobs wait in
+# per-user FIFO queues; whenever capacity frees up, the dispatcher picks the
+# next user fairly (fewest running jobs first), preferring small jobs, with
+# aging so big jobs are never starved.
+
+import asyncio
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+from metrics import Gauge
+from tracing import span
+
+logger = logging.getLogger("up-mines-bot.scheduler")
+
+MAX_BROWSERS = int(os.getenv("MAX_BROWSERS", "12"))
+MAX_CPU_SLOTS = int(os.getenv("MAX_CPU_SLOTS", str(os.cpu_count() or 2)))
+AGING_SECONDS = 30  # every AGING_SECONDS of waiting halves a job's effective size again
+
+# Rough seconds per unit of work, refined with an EWMA as jobs complete
+DEFAULT_UNIT_SECONDS = {"fetch": 1.5, "login": 6.0, "pdf": 3.0, "crawl": 0.5, "pipeline": 1.5}
+
+QueueCallback = Callable[[int, float], Awaitable[None]]
+
+
+class Grant:
+    """Capacity handed to a running job."""
+
+    def __init__(self, browsers: int, cpu: int):
+        self.browsers = browsers
+        self.cpu = cpu
+
+
+class _Ticket:
+    def __init__(self, seq, user_id, kind, size, browsers, min_browsers, cpu, on_queued):
+        self.seq = seq
+        self.user_id = user_id
+        self.kind = kind
+        self.size = max(1, size)
+        self.browsers = browsers
+        self.min_browsers = min_browsers
+        self.cpu = cpu
+        self.on_queued = on_queued
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.grant: Optional[Grant] = None
+        self.ready = asyncio.get_running_loop().create_future()
+        self.last_position: Optional[int] = None
+
+
+class JobScheduler:
+    def __init__(self, max_browsers: int = MAX_BROWSERS, max_cpu: int = MAX_CPU_SLOTS):
+        self.max_browsers = max(1, max_browsers)
+        self.max_cpu = max(1, max_cpu)
+        self.free_browsers = self.max_browsers
+        self.free_cpu = self.max_cpu
+        self._queues: Dict[int, Deque[_Ticket]] = {}
+        self._running: List[_Ticket] = []
+        self._seq = itertools.count()
+        self._unit_seconds = dict(DEFAULT_UNIT_SECONDS)
+
+    # ---------- Public API ----------
+    @asynccontextmanager
+    async def slot(
+        self,
+        user_id: int,
+        kind: str,
+        size: int = 1,
+        browsers: int = 0,
+        cpu: int = 0,
+        on_queued: Optional[QueueCallback] = None,
+        min_browsers: int = 1,
+    ):
+        """Wait for capacity, yield a Grant and release it on exit.
+
+        `browsers` is the most the job can use; it may be granted fewer (at
+        least `min_browsers`) when the host is busy. `cpu` slots are granted
+        exactly. A job needing more browsers than the pool has raises ValueError.
+        """
+        if browsers and min_browsers > self.max_browsers:
+            raise ValueError(f"{kind} needs {min_browsers} browsers, but the pool only has {self.max_browsers}")
+        browsers = min(browsers, self.max_browsers)
+        ticket = _Ticket(
+            next(self._seq), user_id, kind, size,
+            browsers, min(max(1, min_browsers), browsers), min(cpu, self.max_cpu), on_queued,
+        )
+        self._queues.setdefault(user_id, deque()).append(ticket)
+        self._dispatch()
+        try:
+            with span("queue_wait", cat="scheduler", kind=kind):
+                if not ticket.ready.done():
+                    await self._notify_positions()
+                await ticket.ready
+        except BaseException:
+            self._discard(ticket)
+            raise
+
+        try:
+            yield ticket.grant
+        finally:
+            self._release(ticket)
+
+    def reserve(self, browsers: int) -> int:
+        """Take browsers out of the pool for good (e.g. for local scan workers); keeps at least one. Returns the number taken."""
+        taken = max(0, min(browsers, self.max_browsers - 1))
+        self.max_browsers -= taken
+        self.free_browsers -= taken
+        return taken
+
+    def snapshot(self) -> dict:
+        """Current load, for /status and logs."""
+        return {
+            "running": len(self._running),
+            "queued": sum(len(q) for q in self._queues.values()),
+            "free_browsers": self.free_browsers,
+            "free_cpu": self.free_cpu,
+        }
+
+    # ---------- Internals ----------
+    def _priority(self, ticket: _Ticket, now: float):
+        running_for_user = sum(1 for t in self._running if t.user_id == ticket.user_id)
+        waited = now - ticket.enqueued_at
+        effective_size = ticket.size / (1 + waited / AGING_SECONDS)
+        return (running_for_user, effective_size, ticket.seq)
+
+    def _ordered_waiting(self) -> List[_Ticket]:
+        now = time.monotonic()
+        heads = [q[0] for q in self._queues.values() if q]
+        heads.sort(key=lambda t: self._priority(t, now))
+        # Position order: heads first, then everyone behind them in their own queues
+        ordered = list(heads)
+        depth = 1
+        while True:
+            layer = [q[depth] for q in self._queues.values() if len(q) > depth]
+            if not layer:
+                break
+            layer.sort(key=lambda t: self._priority(t, now))
+            ordered.extend(layer)
+            depth += 1
+        return ordered
+
+    def _fair_browser_share(self) -> int:
+        # Split the pool evenly between the users with running or waiting jobs; a lone user gets all of it
+        active_users = {t.user_id for t in self._running} | {u for u, q in self._queues.items() if q}
+        return max(1, self.max_browsers // max(1, len(active_users)))
+
+    def _dispatch(self):
+        while True:
+            now = time.monotonic()
+            heads = [q[0] for q in self._queues.values() if q]
+            if not heads:
+                return
+            best = min(heads, key=lambda t: self._priority(t, now))
+            need_browsers = best.min_browsers
+            if self.free_browsers < need_browsers or self.free_cpu < best.cpu:
+                # Strict order: keep capacity for the best job rather than starving it
+                return
+
+            browsers = 0
+            if best.browsers:
+                browsers = max(best.min_browsers, min(best.browsers, self._fair_browser_share(), self.free_browsers))
+            self._queues[best.user_id].popleft()
+            if not self._queues[best.user_id]:
+                del self._queues[best.user_id]
+
+            self.free_browsers -= browsers
+            self.free_cpu -= best.cpu
+            best.grant = Grant(browsers, best.cpu)
+            best.started_at = now
+            self._running.append(best)
+            if not best.ready.done():
+                best.ready.set_result(None)
+            logger.info(
+                "Started %s job for user %s (browsers=%s cpu=%s, waited %.1fs)",
+                best.kind, best.user_id, browsers, best.cpu, now - best.enqueued_at,
+            )
+
+    def _discard(self, ticket: _Ticket):
+        queue = self._queues.get(ticket.user_id)
+        if queue and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[ticket.user_id]
+        elif ticket in self._running:
+            self._release(ticket)
+            return
+        self._dispatch()
+
+    def _release(self, ticket: _Ticket):
+        if ticket not in self._running:
+            return
+        self._running.remove(ticket)
+        self.free_browsers += ticket.grant.browsers
+        self.free_cpu += ticket.grant.cpu
+        elapsed = time.monotonic() - ticket.started_at
+        per_unit = elapsed / ticket.size
+        prev = self._unit_seconds.get(ticket.kind, per_unit)
+        self._unit_seconds[ticket.kind] = 0.8 * prev + 0.2 * per_unit
+        self._dispatch()
+        asyncio.ensure_future(self._notify_positions())
+
+    def _estimate(self, ticket: _Ticket) -> float:
+        unit = self._unit_seconds.get(ticket.kind, 5.0)
+        if ticket.kind in ("fetch", "pipeline") and ticket.browsers:
+            return unit * ticket.size / ticket.browsers
+        return unit * ticket.size
+
+    def _eta(self, ordered: List[_Ticket], index: int) -> float:
+        now = time.monotonic()
+        running_left = [
+            max(0.0, self._estimate(t) - (now - t.started_at)) for t in self._running
+        ]
+        parallel = max(1, len(self._running))
+        ahead = sum(self._estimate(t) for t in ordered[:index])
+        return (min(running_left) if running_left else 0.0) + ahead / parallel
+
+    async def _notify_positions(self):
+        ordered = self._ordered_waiting()
+        for index, ticket in enumerate(ordered):
+            position = index + 1
+            # Only report the first position and later improvements, not every reshuffle
+            if ticket.on_queued is None:
+                continue
+            if ticket.last_position is not None and position >= ticket.last_position:
+                continue
+            ticket.last_position = position
+            try:
+                await ticket.on_queued(position, self._eta(ordered, index))
+            except Exception as e:
+                logger.warning("Queue notification failed for user %s: %s", ticket.user_id, e)
+
+
+scheduler = JobScheduler()
+
+Gauge("upmines_jobs_running", "Jobs holding scheduler capacity", callback=lambda: scheduler.snapshot()["running"])
+Gauge("upmines_jobs_queued", "Jobs waiting for scheduler capacity", callback=lambda: scheduler.snapshot()["queued"])
@@ -0,0 +1,191 @@
+# session_store.py
+# Bounded session lifetime and disk use.
+#
+# SessionExpiry keeps a min-heap of (deadline, user_id) keyed by last
+# activity, so a single timer task sleeps exactly until the next session is
+# due instead of scanning every session on a fixed interval. Stale heap
+# entries (superseded by a later touch) are skipped lazily.
+#
+# enforce_disk_quota() keeps sessions/ under SESSIONS_DISK_QUOTA_MB by
+# evicting, least recently used first: orphaned folders, then generated
+# artifacts of idle sessions, then whole idle sessions. It walks the disk, so
+# the bot runs it in a worker thread; files vanishing meanwhile are skipped.
+
+import asyncio
+import heapq
+import logging
+import os
+import shutil
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger("up-mines-bot.sessions")
+
+SESSIONS_ROOT = "sessions"
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(12 * 3600)))  # seconds of inactivity
+SESSIONS_DISK_QUOTA_MB = int(os.getenv("SESSIONS_DISK_QUOTA_MB", "2048"))
+QUOTA_CHECK_INTERVAL = 300  # seconds between periodic disk checks
+
+
+class SessionExpiry:
+    def __init__(self, ttl: float = SESSION_TTL):
+        self.ttl = ttl
+        self._heap: List[Tuple[float, int, int]] = []  # (deadline, user_id, version)
+        self._version: Dict[int, int] = {}
+        self._changed: Optional[asyncio.Event] = None
+
+    def touch(self, user_id: int, now: float = None):
+        """Record activity: the session now expires `ttl` seconds from now."""
+        now = time.monotonic() if now is None else now
+        version = self._version.get(user_id, 0) + 1
+        self._version[user_id] = version
+        deadline = now + self.ttl
+        earliest = self._heap[0][0] if self._heap else None
+        heapq.heappush(self._heap, (deadline, user_id, version))
+        if len(self._heap) > 2 * len(self._version) + 64:
+            self._compact()
+        if self._changed is not None and (earliest is None or deadline < earliest):
+            self._changed.set()
+
+    def forget(self, user_id: int):
+        """Stop tracking a session that was closed explicitly."""
+        self._version.pop(user_id, None)
+
+    def pop_expired(self, now: float = None) -> List[int]:
+        now = time.monotonic() if now is None else now
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            _, user_id, version = heapq.heappop(self._heap)
+            if self._version.get(user_id) == version:
+                del self._version[user_id]
+                expired.append(user_id)
+        return expired
+
+    def next_deadline(self) -> Optional[float]:
+        while self._heap and self._version.get(self._heap[0][1]) != self._heap[0][2]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def _compact(self):
+        self._heap = [e for e in self._heap if self._version.get(e[1]) == e[2]]
+        heapq.heapify(self._heap)
+
+    async def run(self, on_expire: Callable[[int], Awaitable[None]]):
+        """Expire sessions exactly when their deadline passes."""
+        self._changed = asyncio.Event()
+        while True:
+            for user_id in self.pop_expired():
+                try:
+                    await on_expire(user_id)
+                except Exception as e:
+                    logger.warning("Expiring session for user %s failed: %s", user_id, e)
+            deadline = self.next_deadline()
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+# ---------- Disk quota ----------
+def dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _remove(path: str) -> int:
+    try:
+        size = dir_size(path) if os.path.isdir(path) else os.path.getsize(path)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+    except OSError as e:
+        logger.warning("Could not evict %s: %s", path, e)
+        return 0
+    return size
+
+
+def _mtime(path: str) -> float:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0.0
+
+
+def enforce_disk_quota(
+    sessions: Iterable[dict],
+    quota_bytes: int = SESSIONS_DISK_QUOTA_MB * 1024 * 1024,
+    root: str = SESSIONS_ROOT,
+    evict_session: Callable[[dict], None] = None,
+) -> int:
+    """Evict least-recently-used data until `root` fits in `quota_bytes`. Returns bytes freed."""
+    if not os.path.isdir(root):
+        return 0
+    sessions = list(sessions)
+    live: Set[str] = {os.path.abspath(s["user_dir"]) for s in sessions if s.get("user_dir")}
+    entries = [os.path.join(root, name) for name in os.listdir(root)]
+    sizes = {path: dir_size(path) for path in entries if os.path.isdir(path)}
+    total = sum(sizes.values())
+    if total <= quota_bytes:
+        return 0
+
+    freed = 0
+    # 1. Folders no live session owns (left over from restarts/crashes), oldest first
+    orphans = sorted((p for p in sizes if os.path.abspath(p) not in live), key=_mtime)
+    for path in orphans:
+        if total - freed <= quota_bytes:
+            return freed
+        freed += _remove(path)
+
+    # Sessions with a job running are never touched
+    idle = sorted(
+        (s for s in sessions if not (s.get("lock") and s["lock"].locked())),
+        key=lambda s: s.get("last_active", 0),
+    )
+    # 2. Generated PDFs of idle sessions (can be regenerated), LRU first
+    for session in idle:
+        pdf_dir = session.get("pdf_dir")
+        try:
+            names = os.listdir(pdf_dir) if pdf_dir else []
+        except OSError:
+            continue  # no PDFs yet, or the session was cleaned up meanwhile
+        for name in names:
+            if total - freed <= quota_bytes:
+                return freed
+            freed += _remove(os.path.join(pdf_dir, name))
+
+    # 3. Whole idle sessions, LRU first
+    for session in idle:
+        if total - freed <= quota_bytes:
+            break
+        before = dir_size(session["user_dir"]) if os.path.isdir(session.get("user_dir", "")) else 0
+        if evict_session:
+            evict_session(session)
+        freed += before
+
+    if total - freed > quota_bytes:
+        logger.warning("sessions/ still over quota after eviction (%d bytes)", total - freed)
+    return freed
+
+
+def sweep_orphans(live_dirs: Iterable[str], max_age: float = SESSION_TTL, root: str = SESSIONS_ROOT) -> int:
+    """Remove session folders not owned by a live session and untouched for `max_age` seconds."""
+    if not os.path.isdir(root):
+        return 0
+    live = {os.path.abspath(d) for d in live_dirs}
+    cutoff = time.time() - max_age
+    removed = 0
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if os.path.isdir(path) and os.path.abspath(path) not in live and _mtime(path) < cutoff:
+            _remove(path)
+            removed += 1
+    return removed
@@ -0,0 +1,191 @@
+import asyncio
+import json
+import os
+from collections import defaultdict
+
+import pytest
+
+import api
+from api import BulkAPI, serve_file
+from http_server import HTTPServer, Request
+
+KEY = "secret-key"
+
+
+# ---------- Range requests ----------
+@pytest.fixture
+def pdf(tmp_path):
+    path = tmp_path / "123.pdf"
+    path.write_bytes(bytes(range(100)))
+    return str(path)
+
+
+def _get(pdf, range_header=None):
+    headers = {"range": range_header} if range_header else {}
+    return asyncio.run(serve_file(Request("GET", "/x", headers, b"", None), pdf, "application/pdf"))
+
+
+def test_whole_file_without_range(pdf):
+    response = _get(pdf)
+    assert (response.status, len(response.body)) == (200, 100)
+    assert "Content-Range" not in response.headers
+
+
+@pytest.mark.parametrize("spec, first, last", [
+    ("bytes=10-19", 10, 19),
+    ("bytes=90-", 90, 99),
+    ("bytes=-5", 95, 99),
+    ("bytes=95-500", 95, 99),  # the end is clamped to the file
+])
+def test_satisfiable_ranges(pdf, spec, first, last):
+    response = _get(pdf, spec)
+    assert response.status == 206
+    assert response.headers["Content-Range"] == f"bytes {first}-{last}/100"
+    assert response.body == bytes(range(first, last + 1))
+
+
+@pytest.mark.parametrize("spec", ["bytes=100-", "bytes=20-10", "bytes=-", "items=0-1"])
+def test_unsatisfiable_ranges(pdf, spec):
+    response = _get(pdf, spec)
+    assert response.status == 416
+    assert response.headers["Content-Range"] == "bytes */100"
+
+
+# ---------- Over HTTP ----------
+async def _call(port, method, path, key=KEY, body=None):
+    """Send one request; returns (status, headers, reader, writer) with the body left to read."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    payload = json.dumps(body).encode() if body is not None else b""
+    head = f"{method} {path} HTTP/1.1\r\nHost: test\r\nConnection: close\r\nContent-Length: {len(payload)}\r\n"
+    if key:
+        head += f"Authorization: Bearer {key}\r\n"
+    writer.write(head.encode() + b"\r\n" + payload)
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while (line := await reader.readline()) not in (b"\r\n", b""):
+        name, _, value = line.decode().partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return status, headers, reader, writer
+
+
+async def _json(port, method, path, **kwargs):
+    status, headers, reader, writer = await _call(port, method, path, **kwargs)
+    body = await reader.readexactly(int(headers["content-length"]))
+    writer.close()
+    return status, json.loads(body)
+
+
+async def _chunk(reader) -> bytes:
+    size = int((await reader.readline()).strip(), 16)
+    data = await reader.readexactly(size + 2)
+    return data[:-2]
+
+
+@pytest.fixture
+def server(monkeypatch, tmp_path):
+    """A bulk API on a free port whose jobs emit one entry, then wait for `release` before finishing."""
+    monkeypatch.setattr(api, "API_DIR", str(tmp_path / "api"))
+    release = defaultdict(asyncio.Event)
+
+    async def run(self, job):
+        job.state = "running"
+        job.emit({"type": "entry", "eMM11_num": job.start})
+        try:
+            await release[job.id].wait()
+        except asyncio.CancelledError:
+            job.finish("cancelled")
+            raise
+        job.emit({"type": "entry", "eMM11_num": job.end})
+        job.finish("done")
+
+    monkeypatch.setattr(BulkAPI, "_run", run)
+
+    async def start(max_jobs=2):
+        http = HTTPServer("127.0.0.1", 0)
+        bulk = BulkAPI(keys={KEY: "acme"}, max_jobs=max_jobs)
+        bulk.install(http)
+        await http.start()
+        return http, bulk, release
+    return start
+
+
+SCAN = {"start": 1, "end": 5, "district": "Agra"}
+
+
+def test_missing_or_wrong_key_is_unauthorized(server):
+    async def scenario():
+        http, _, _ = await server()
+        try:
+            assert (await _json(http.port, "GET", "/api/jobs", key=None))[0] == 401
+            assert (await _json(http.port, "GET", "/api/jobs", key="nope"))[0] == 401
+            assert await _json(http.port, "GET", "/api/jobs") == (200, [])
+        finally:
+            await http.stop()
+
+    asyncio.run(scenario())
+
+
+def test_quota_answers_429_at_the_limit(server):
+    async def scenario():
+        http, bulk, release = await server(max_jobs=1)
+        try:
+            status, job = await _json(http.port, "POST", "/api/jobs", body=SCAN)
+            assert status == 202
+            status, error = await _json(http.port, "POST", "/api/jobs", body=SCAN)
+            assert status == 429 and "at most 1" in error["error"]
+
+            release[job["id"]].set()
+            await asyncio.sleep(0.05)
+            status, second = await _json(http.port, "POST", "/api/jobs", body=SCAN)
+            assert status == 202
+            release[second["id"]].set()
+        finally:
+            await asyncio.sleep(0.05)
+            await http.stop()
+
+    asyncio.run(scenario())
+
+
+def test_results_stream_before_the_job_ends(server):
+    async def scenario():
+        http, bulk, release = await server()
+        try:
+            _, job = await _json(http.port, "POST", "/api/jobs", body=SCAN)
+            status, headers, reader, writer = await _call(http.port, "GET", f"/api/jobs/{job['id']}/results")
+            assert (status, headers["content-type"]) == (200, "application/x-ndjson")
+
+            # The job is still waiting, yet its first entry has already arrived
+            first = json.loads(await asyncio.wait_for(_chunk(reader), 2))
+            assert first == {"type": "entry", "eMM11_num": 1}
+            assert bulk.jobs[job["id"]].state == "running"
+
+            release[job["id"]].set()
+            rest = b""
+            while chunk := await asyncio.wait_for(_chunk(reader), 2):
+                rest += chunk
+            events = [json.loads(line) for line in rest.splitlines()]
+            assert [e["type"] for e in events] == ["entry", "end"]
+            assert events[1]["state"] == "done"
+            writer.close()
+        finally:
+            await http.stop()
+
+    asyncio.run(scenario())
+
+
+def test_delete_cancels_then_removes_files(server):
+    async def scenario():
+        http, bulk, release = await server()
+        try:
+            _, job = await _json(http.port, "POST", "/api/jobs", body=SCAN)
+            await asyncio.sleep(0.01)
+            job_dir = bulk.jobs[job["id"]].dir
+            assert await _json(http.port, "DELETE", f"/api/jobs/{job['id']}") == (
+                200, {"id": job["id"], "state": "cancelled"}
+            )
+            assert not os.path.exists(job_dir)
+            assert (await _json(http.port, "GET", f"/api/jobs/{job['id']}"))[0] == 404
+        finally:
+            await http.stop()
+
+    asyncio.run(scenario())
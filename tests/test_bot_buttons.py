@@ -0,0 +1,125 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+import login_to_website
+import outbox as outbox_module
+from jobs import jobs
+
+USER, CHAT = 4242, 4242
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(text)
+        return type("Message", (), {"message_id": len(self.sent)})()
+
+    async def edit_message_text(self, chat_id, message_id, text, **kwargs):
+        self.sent.append(text)
+
+
+class FakeQuery:
+    def __init__(self, data):
+        self.data = data
+        self.from_user = type("User", (), {"id": USER})()
+        self.message = type("Message", (), {"chat": type("Chat", (), {"id": CHAT})(), "message_id": 1})()
+        self.answers = []
+
+    async def answer(self, text=None, show_alert=False):
+        self.answers.append((text, show_alert))
+
+
+async def tap(data):
+    query = FakeQuery(data)
+    await bot.button_handler(type("Update", (), {"callback_query": query})(), None)
+    return query
+
+
+@pytest.fixture
+def env(monkeypatch, tmp_path):
+    """A session with one result, a fake Telegram bot, and a login step that waits for `env.release`."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(outbox_module, "PER_CHAT_INTERVAL", 0)
+    fake = FakeBot()
+    monkeypatch.setattr(bot.outbox, "bot", fake)
+    env = SimpleNamespace(sent=fake.sent, logins=[], release=None)
+
+    async def login(data, log_callback):
+        env.logins.append(len(data))
+        await env.release.wait()
+
+    def session():
+        env.release = asyncio.Event()
+        session = bot.get_session(USER)
+        session["data"].append({"eMM11_num": 31422307030112345, "destination_district": "AGRA"})
+        return session
+
+    monkeypatch.setattr(login_to_website, "login_to_website", login)
+    env.session = session
+    yield env
+    bot.user_sessions.pop(USER, None)
+
+
+def _job():
+    return next(iter(jobs.for_user(USER)), None)
+
+
+def test_stale_key_only_gets_an_alert(env):
+    async def scenario():
+        env.session()
+        query = await tap("login_process:0ldkey00")
+        assert query.answers == [("⌛ This button is out of date. Use the latest message, or /start.", True)]
+        assert _job() is None
+
+    asyncio.run(scenario())
+
+
+def test_duplicate_tap_attaches_and_completed_job_reshows_results(env):
+    async def scenario():
+        session = env.session()
+        data = f"login_process:{session['data_key']}"
+        first = await tap(data)
+        job = _job()
+        assert job is not None and job.key == data
+        assert first.answers == [(None, False)]
+
+        # A second tap while the job runs attaches to it
+        second = await tap(data)
+        assert second.answers == [("⏳ Already running. Progress and results will appear here.", False)]
+        assert _job() is job
+
+        env.release.set()
+        await asyncio.wait_for(job.task, 2)
+        assert session["processed"] and data in session["completed"]
+        assert env.logins == [1]
+
+        # Tapping a finished job's button shows its results again instead of running it twice
+        prompts = env.sent.count("Click below to generate PDF.")
+        third = await tap(data)
+        assert third.answers == [(None, False)]
+        assert _job() is None
+        assert env.logins == [1]
+        assert env.sent.count("Click below to generate PDF.") == prompts + 1
+
+    asyncio.run(scenario())
+
+
+def test_job_made_stale_while_waiting_for_the_lock_stops(env):
+    async def scenario():
+        session = env.session()
+        async with session["lock"]:
+            await tap(f"login_process:{session['data_key']}")
+            job = _job()
+            # A new search replaces the results while the job is still queued on the lock
+            bot.reset_results(session)
+        await asyncio.wait_for(job.task, 2)
+        assert env.logins == []
+        assert not session["processed"] and not session["completed"]
+        assert bot.STALE_JOB_TEXT in env.sent
+
+    asyncio.run(scenario())
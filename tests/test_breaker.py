@@ -0,0 +1,143 @@
+import asyncio
+
+import pytest
+
+import emm11_processor
+import portal
+from portal import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, PortalUnavailable, navigate
+
+
+async def _until(predicate, timeout=2.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        assert loop.time() < deadline, "condition not reached"
+        await asyncio.sleep(0.005)
+
+
+def _breaker(probe_results):
+    results = iter(probe_results)
+    return CircuitBreaker(failure_threshold=2, cooldown=0.01, max_cooldown=0.05, probe=lambda: next(results))
+
+
+def test_closed_open_half_open_closed():
+    async def scenario():
+        breaker = _breaker([False, True])
+        assert await breaker.admit() is False
+        breaker.record_failure("timeout")
+        assert breaker.state == CLOSED
+        breaker.record_failure("timeout")
+        assert breaker.state == OPEN
+
+        # Open: callers fail fast, or park until the circuit changes
+        with pytest.raises(PortalUnavailable):
+            await breaker.admit(park=False)
+        parked = asyncio.create_task(breaker.admit(park=True, timeout=5))
+
+        # The first probe fails (cooldown doubles), the second one lets a single trial through
+        await _until(lambda: breaker.state == HALF_OPEN)
+        assert breaker.cooldown == 0.02
+        assert await parked is True
+        second = asyncio.create_task(breaker.admit(park=True, timeout=5))
+        await asyncio.sleep(0.02)
+        assert not second.done()
+
+        breaker.record_success()
+        assert breaker.state == CLOSED
+        assert await second is False
+        assert breaker.snapshot() == {"state": CLOSED, "failures": 0, "cooldown": 0.01}
+
+    asyncio.run(scenario())
+
+
+def test_failed_trial_reopens():
+    async def scenario():
+        breaker = _breaker([True])
+        breaker.record_failure()
+        breaker.record_failure()
+        await _until(lambda: breaker.state == HALF_OPEN)
+        assert await breaker.admit() is True
+        breaker.record_failure("still down")
+        assert breaker.state == OPEN
+        assert breaker.cooldown == 0.02
+
+    asyncio.run(scenario())
+
+
+def _half_open(monkeypatch, module):
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=60)
+    breaker.state = HALF_OPEN
+    monkeypatch.setattr(module, "breaker", breaker)
+    return breaker
+
+
+def test_cancelled_navigation_releases_the_trial(monkeypatch):
+    breaker = _half_open(monkeypatch, portal)
+
+    async def scenario():
+        call = asyncio.create_task(navigate(lambda: asyncio.sleep(10)))
+        await asyncio.sleep(0)
+        assert breaker._trial
+        call.cancel()
+        await asyncio.gather(call, return_exceptions=True)
+        # The next caller gets the trial instead of waiting forever
+        assert await asyncio.wait_for(breaker.admit(), 1) is True
+
+    asyncio.run(scenario())
+
+
+def test_tp_check_error_releases_the_trial(monkeypatch):
+    breaker = _half_open(monkeypatch, emm11_processor)
+
+    class BrokenPage:
+        async def fill(self, *args):
+            raise RuntimeError("Target page, context or browser has been closed")
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await emm11_processor.check_tp(BrokenPage(), "123")
+        assert breaker.state == HALF_OPEN
+        assert not breaker._trial
+
+    asyncio.run(scenario())
+
+
+def test_lookups_waiting_for_the_trial_hold_no_browser(monkeypatch):
+    import fetch_emm11_data
+    from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+    breaker = _half_open(monkeypatch, portal)
+    monkeypatch.setattr(fetch_emm11_data, "breaker", breaker)
+    launched = []
+
+    class Page:
+        async def goto(self, url, timeout):
+            return None
+
+        async def wait_for_selector(self, selector, timeout):
+            raise PlaywrightTimeoutError("no record")
+
+    class Browser:
+        async def new_page(self):
+            return Page()
+
+        async def close(self):
+            pass
+
+    class Chromium:
+        async def launch(self, **kwargs):
+            launched.append(1)
+            return Browser()
+
+    playwright = type("Playwright", (), {"chromium": Chromium()})()
+
+    async def scenario():
+        assert await breaker.admit() is True  # someone else's trial call is in flight
+        lookups = [asyncio.create_task(fetch_emm11_data.lookup_emm11(playwright, n)) for n in (1, 2, 3)]
+        await asyncio.sleep(0.05)
+        assert launched == []
+        breaker.record_success()
+        assert await asyncio.gather(*lookups) == [None, None, None]
+        assert len(launched) == 3
+
+    asyncio.run(scenario())
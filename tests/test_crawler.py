@@ -0,0 +1,49 @@
+import asyncio
+
+import crawler
+import fetch_emm11_data
+from crawler import Emm11Index, crawl_chunk
+from fetch_emm11_data import LookupFailed
+
+ISSUED = {100, 101, 103, 105}  # 102 and 104 are not issued; 106+ not yet
+
+
+def _record(num):
+    return {"eMM11_num": num, "destination_district": "AGRA", "generated_on": "01-10-2026 10:00:00"}
+
+
+def _run_chunk(monkeypatch, index, cursor, failing):
+    async def lookup(playwright, num, log=print):
+        if num in failing:
+            raise LookupFailed(str(num))
+        return _record(num) if num in ISSUED else None
+
+    monkeypatch.setattr(fetch_emm11_data, "lookup_emm11", lookup)
+    monkeypatch.setattr(crawler, "CRAWL_CHUNK", 8)
+    monkeypatch.setattr(crawler, "CRAWL_RATE", 0)
+    return asyncio.run(crawl_chunk(None, index, 100, cursor))
+
+
+def test_failed_lookups_stay_live_until_retried(monkeypatch, tmp_path):
+    index = Emm11Index(str(tmp_path / "index.sqlite3"))
+    # 101 timed out: the cursor still moves past the last issued number, but 101 is a gap
+    assert _run_chunk(monkeypatch, index, 100, failing={101}) == 106
+    assert index.gaps() == [101]
+    covered, live = index.split_range(95, 110)
+    assert covered == (100, 105)
+    assert live == [(95, 99), (101, 101), (106, 110)]
+    assert [r["eMM11_num"] for r in index.by_numbers("AGRA", *covered)] == [100, 103, 105]
+
+    # The next chunk retries the gap along with the new numbers
+    assert _run_chunk(monkeypatch, index, 106, failing=set()) == 106
+    assert index.gaps() == []
+    assert index.split_range(95, 110)[1] == [(95, 99), (106, 110)]
+    assert [r["eMM11_num"] for r in index.by_numbers("AGRA", 100, 105)] == [100, 101, 103, 105]
+    index.close()
+
+
+def test_failure_above_last_issued_number_is_not_covered(monkeypatch, tmp_path):
+    index = Emm11Index(str(tmp_path / "index.sqlite3"))
+    assert _run_chunk(monkeypatch, index, 100, failing={106}) == 106
+    assert index.gaps() == []
+    index.close()
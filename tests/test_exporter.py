@@ -0,0 +1,50 @@
+import csv
+import gzip
+import json
+import os
+import random
+
+from exporter import ResultExporter
+
+PART_BYTES = 256 * 1024
+
+
+def _entries(count):
+    rng = random.Random(7)
+    for num in range(count):
+        # Incompressible addresses so the parts really fill up
+        address = "".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789") for _ in range(200))
+        yield {"eMM11_num": num, "destination_district": "AGRA", "destination_address": address,
+               "quantity_to_transport": "10", "generated_on": "01-10-2026"}
+
+
+def test_csv_rolls_over_into_self_contained_parts(tmp_path):
+    exporter = ResultExporter(str(tmp_path), "csv", part_bytes=PART_BYTES)
+    exporter.write_all(_entries(5000))
+    paths = exporter.close()
+
+    assert len(paths) > 1
+    numbers = []
+    for path in paths:
+        assert os.path.getsize(path) <= PART_BYTES
+        with gzip.open(path, "rt", encoding="utf-8", newline="") as f:
+            rows = list(csv.DictReader(f))  # every part starts with the header
+        numbers += [int(r["eMM11_num"]) for r in rows]
+    assert numbers == list(range(5000))
+    assert exporter.rows == 5000
+
+
+def test_jsonl_part_and_discard(tmp_path):
+    exporter = ResultExporter(str(tmp_path), "jsonl", name="scan", part_bytes=PART_BYTES)
+    exporter.write_all(_entries(3))
+    [path] = exporter.close()
+    assert os.path.basename(path) == "scan.part1.jsonl.gz"
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        assert [json.loads(line)["eMM11_num"] for line in f] == [0, 1, 2]
+
+    exporter.discard()
+    assert os.listdir(tmp_path) == []
+
+
+def test_nothing_written_means_no_parts(tmp_path):
+    assert ResultExporter(str(tmp_path)).close() == []
@@ -0,0 +1,36 @@
+import asyncio
+
+import pytest
+
+from http_server import HTTPServer, Response
+
+
+async def _raw(port, request: bytes) -> bytes:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(request)
+    response = await asyncio.wait_for(reader.read(), 2)
+    writer.close()
+    return response
+
+
+@pytest.mark.parametrize("length", ["abc", "-5", "1e3"])
+def test_bad_content_length_is_rejected(length):
+    async def scenario():
+        server = HTTPServer("127.0.0.1", 0)
+
+        async def echo(request):
+            return Response(request.body)
+
+        server.route("POST", "/echo", echo)
+        await server.start()
+        try:
+            bad = await _raw(server.port, f"POST /echo HTTP/1.1\r\nContent-Length: {length}\r\n\r\nhello".encode())
+            good = await _raw(server.port, b"POST /echo HTTP/1.1\r\nContent-Length: 5\r\nConnection: close\r\n\r\nhello")
+        finally:
+            await server.stop()
+        return bad, good
+
+    bad, good = asyncio.run(scenario())
+    assert bad.startswith(b"HTTP/1.1 400 ")
+    assert b"Connection: close" in bad
+    assert good.startswith(b"HTTP/1.1 200 ") and good.endswith(b"hello")
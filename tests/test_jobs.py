@@ -0,0 +1,78 @@
+import asyncio
+
+from jobs import JOBS_CANCELLED, JobRegistry
+
+
+async def _forever():
+    await asyncio.sleep(3600)
+
+
+def test_find_and_forget_finished_jobs():
+    async def scenario():
+        registry = JobRegistry()
+        done = asyncio.Event()
+
+        async def job():
+            await done.wait()
+
+        scan = registry.start(1, "fetch", "1-10 AGRA", job(), key="scan:abc")
+        other = registry.start(2, "pdf", "3 TPs", _forever())
+        assert registry.find(1, "scan:abc") is scan
+        assert registry.find(2, "scan:abc") is None
+        assert registry.running() == 2
+
+        done.set()
+        await scan.task
+        await asyncio.sleep(0)  # done callbacks run on the next loop iteration
+        assert registry.find(1, "scan:abc") is None
+        assert registry.for_user(1) == []
+        assert scan.id not in registry._jobs
+
+        other.task.cancel()
+        await asyncio.gather(other.task, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+
+def test_cancel_user_stops_their_jobs_only():
+    async def scenario():
+        registry = JobRegistry()
+        mine = [registry.start(1, "fetch", str(i), _forever()) for i in range(2)]
+        theirs = registry.start(2, "fetch", "other", _forever())
+        before = sum(JOBS_CANCELLED._values.values())
+
+        assert await registry.cancel_user(1, timeout=1) == mine
+        assert all(job.task.cancelled() for job in mine)
+        assert not theirs.task.done()
+        assert sum(JOBS_CANCELLED._values.values()) == before + 2
+
+        theirs.task.cancel()
+        await asyncio.gather(theirs.task, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+
+def test_cancel_waits_at_most_the_timeout():
+    async def scenario():
+        registry = JobRegistry()
+        release = asyncio.Event()
+
+        async def stubborn():
+            try:
+                await _forever()
+            finally:
+                await release.wait()  # e.g. a browser that takes its time to close
+
+        job = registry.start(1, "pdf", "slow", stubborn())
+        await asyncio.sleep(0)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        assert await registry.cancel(job, timeout=0.05) is False
+        assert loop.time() - started < 1
+        assert not job.task.done()
+
+        release.set()
+        await asyncio.gather(job.task, return_exceptions=True)
+        assert await registry.cancel(job) is True
+
+    asyncio.run(scenario())
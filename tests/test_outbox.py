@@ -0,0 +1,105 @@
+import asyncio
+import time
+
+import outbox as outbox_module
+from outbox import TelegramOutbox
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+        self._ids = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self._ids += 1
+        self.sent.append((time.monotonic(), chat_id, "send", text))
+        return type("Message", (), {"message_id": self._ids})()
+
+    async def edit_message_text(self, chat_id, message_id, text):
+        self.sent.append((time.monotonic(), chat_id, "edit", text))
+
+    async def send_document(self, chat_id, document, **kwargs):
+        self.sent.append((time.monotonic(), chat_id, "document", document.read()))
+
+
+def test_chats_flush_in_parallel(monkeypatch):
+    monkeypatch.setattr(outbox_module, "FLUSH_INTERVAL", 0.01)
+    monkeypatch.setattr(outbox_module, "PER_CHAT_INTERVAL", 0.2)
+
+    async def scenario():
+        bot, box = FakeBot(), TelegramOutbox()
+        box.start(bot)
+        started = time.monotonic()
+        for chat_id in range(20):
+            await box.put(chat_id, f"entry for {chat_id}")
+            box.progress(chat_id, "progress")
+        while len(bot.sent) < 40 and time.monotonic() - started < 10:
+            await asyncio.sleep(0.01)
+        elapsed = time.monotonic() - started
+        await box.stop()
+        return bot.sent, elapsed
+
+    sent, elapsed = asyncio.run(scenario())
+    assert len(sent) == 40
+    # Two messages per chat: serially that is 20 per-chat intervals, in parallel about one
+    assert elapsed < 1.5
+    for chat_id in range(20):
+        times = [t for t, chat, _, _ in sent if chat == chat_id]
+        assert times[1] - times[0] >= 0.2 - 0.01
+
+
+def test_direct_sends_follow_buffered_lines_and_limits(monkeypatch, tmp_path):
+    monkeypatch.setattr(outbox_module, "PER_CHAT_INTERVAL", 0.1)
+    path = tmp_path / "part.csv"
+    path.write_bytes(b"a,b\n")
+
+    async def scenario():
+        bot, box = FakeBot(), TelegramOutbox()
+        box.start(bot)
+        await box.put(7, "line")
+        await box.send_message(7, "keyboard")
+        await box.send_document(7, str(path), filename="part.csv")
+        await box.stop()
+        return bot.sent
+
+    sent = asyncio.run(scenario())
+    assert [(kind, body) for _, _, kind, body in sent] == [("send", "line"), ("send", "keyboard"), ("document", b"a,b\n")]
+    assert all(b[0] - a[0] >= 0.1 - 0.01 for a, b in zip(sent, sent[1:]))
+
+
+def test_lines_queued_during_an_upload_are_sent_after_it(monkeypatch, tmp_path):
+    monkeypatch.setattr(outbox_module, "FLUSH_INTERVAL", 0.01)
+    monkeypatch.setattr(outbox_module, "PER_CHAT_INTERVAL", 0)
+    monkeypatch.setattr(outbox_module, "MAX_PENDING_LINES", 5)
+    path = tmp_path / "tp.pdf"
+    path.write_bytes(b"%PDF")
+
+    class SlowUploadBot(FakeBot):
+        async def send_document(self, chat_id, document, **kwargs):
+            await asyncio.sleep(0.3)
+            await super().send_document(chat_id, document, **kwargs)
+
+    async def scenario():
+        bot, box = SlowUploadBot(), TelegramOutbox()
+        box.start(bot)
+        upload = asyncio.create_task(box.send_document(7, str(path)))
+        await asyncio.sleep(0.01)
+
+        async def produce():
+            # Fills the buffer while the upload holds the chat's lock, then has to wait for room
+            for i in range(12):
+                await box.put(7, f"entry {i}")
+
+        await asyncio.wait_for(produce(), 3)
+        await upload
+        deadline = time.monotonic() + 3
+        while box.pending() and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        pending = box.pending()
+        await box.stop()
+        return bot.sent, pending
+
+    sent, pending = asyncio.run(scenario())
+    assert pending == 0
+    assert sent[0][2] == "document"
+    assert "\n\n".join(body for _, _, kind, body in sent[1:]) == "\n\n".join(f"entry {i}" for i in range(12))
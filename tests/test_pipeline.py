@@ -0,0 +1,70 @@
+import asyncio
+
+import pipeline
+
+
+class _FakePage:
+    async def close(self):
+        pass
+
+
+class _FakeBrowser:
+    async def new_context(self):
+        return self
+
+    async def new_page(self):
+        return _FakePage()
+
+    async def close(self):
+        pass
+
+
+class _FakePlaywright:
+    class chromium:
+        @staticmethod
+        async def launch(**kwargs):
+            return _FakeBrowser()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def test_failed_check_skips_only_that_tp(monkeypatch, tmp_path):
+    async def fetch(start, end, district, data_callback, log, concurrency, on_issued):
+        for num in range(start, end + 1):
+            on_issued(num)
+            await data_callback({"eMM11_num": num})
+        return []
+
+    async def check_tp(page, tp_num):
+        if tp_num == "2":
+            raise RuntimeError("unexpected page")
+        return "unused"
+
+    async def render_tp(page, tp_num, output_path, template_path):
+        return output_path
+
+    async def logged_in(*args):
+        return True
+
+    async def noop(*args):
+        pass
+
+    monkeypatch.setattr(pipeline, "async_playwright", _FakePlaywright)
+    monkeypatch.setattr(pipeline, "fetch_emm11_data", fetch)
+    monkeypatch.setattr(pipeline, "portal_login", logged_in)
+    monkeypatch.setattr(pipeline, "open_eformc_page", noop)
+    monkeypatch.setattr(pipeline, "check_tp", check_tp)
+    monkeypatch.setattr(pipeline, "render_tp", render_tp)
+
+    notes, pdfs = [], []
+    stats = asyncio.run(pipeline.run_pipeline(
+        1, 3, "AGRA", output_dir=str(tmp_path), log=notes.append,
+        on_pdf=lambda tp_num, path: pdfs.append(tp_num),
+    ))
+    assert (stats["matched"], stats["checked"], stats["pdfs"], stats["high_water"]) == (3, 2, 2, 3)
+    assert pdfs == ["1", "3"]
+    assert any("2" in note and "unexpected page" in note for note in notes)
@@ -0,0 +1,43 @@
+import os
+
+from result_buffer import Emm11Record, ResultBuffer
+
+
+def _entry(num):
+    return {"eMM11_num": str(num), "destination_district": "AGRA", "destination_address": f"Site {num}",
+            "quantity_to_transport": "10", "generated_on": "01-10-2026"}
+
+
+def test_spills_to_disk_and_iterates_in_order(tmp_path):
+    path = str(tmp_path / "results.jsonl")
+    buffer = ResultBuffer(path, spill_threshold=4)
+    buffer.extend(_entry(n) for n in range(10))
+
+    assert buffer.spilled == 8
+    assert os.path.exists(path)
+    assert len(buffer) == 10
+    assert list(buffer.numbers()) == list(range(10))
+    record = list(buffer)[9]
+    assert isinstance(record, Emm11Record)
+    assert record["destination_address"] == "Site 9"
+    assert dict(record) == record.as_dict()
+
+
+def test_clear_removes_spill_file(tmp_path):
+    path = str(tmp_path / "results.jsonl")
+    buffer = ResultBuffer(path, spill_threshold=2)
+    buffer.extend(_entry(n) for n in range(3))
+    buffer.clear()
+
+    assert not buffer
+    assert not os.path.exists(path)
+    buffer.append(_entry(42))
+    assert list(buffer.numbers()) == [42]
+
+
+def test_record_reads_like_a_dict():
+    record = Emm11Record.from_entry(_entry(7))
+    assert record["eMM11_num"] == 7
+    assert record.get("missing", "x") == "x"
+    assert "generated_on" in record
+    assert Emm11Record.from_entry(record) is record
@@ -0,0 +1,170 @@
+import asyncio
+
+import pytest
+
+from scheduler import JobScheduler
+
+
+async def _hold(sched, started, release, name, user_id, **kwargs):
+    async with sched.slot(user_id, "fetch", **kwargs) as grant:
+        started.append((name, grant.browsers, grant.cpu))
+        await release[name].wait()
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_user_with_fewest_running_jobs_goes_first():
+    async def scenario():
+        sched = JobScheduler(max_browsers=4, max_cpu=2)
+        started, release = [], {n: asyncio.Event() for n in ("a1", "a2", "a3", "b1")}
+        tasks = [asyncio.create_task(_hold(sched, started, release, n, 1, cpu=1)) for n in ("a1", "a2", "a3")]
+        await _settle()
+        tasks.append(asyncio.create_task(_hold(sched, started, release, "b1", 2, cpu=1)))
+        await _settle()
+        assert [s[0] for s in started] == ["a1", "a2"]
+
+        # User 1 still runs a2, user 2 runs nothing: b1 jumps ahead of the older a3
+        release["a1"].set()
+        await _settle()
+        assert [s[0] for s in started] == ["a1", "a2", "b1"]
+
+        for event in release.values():
+            event.set()
+        await asyncio.gather(*tasks)
+        assert [s[0] for s in started] == ["a1", "a2", "b1", "a3"]
+
+    asyncio.run(scenario())
+
+
+def test_smaller_job_preferred_between_equal_users():
+    async def scenario():
+        sched = JobScheduler(max_browsers=4, max_cpu=1)
+        started, release = [], {n: asyncio.Event() for n in ("first", "big", "small")}
+
+        async def job(name, user_id, size):
+            async with sched.slot(user_id, "fetch", size=size, cpu=1):
+                started.append(name)
+                await release[name].wait()
+
+        tasks = [asyncio.create_task(job("first", 1, 1))]
+        await _settle()
+        tasks.append(asyncio.create_task(job("big", 2, 1000)))
+        tasks.append(asyncio.create_task(job("small", 3, 10)))
+        await _settle()
+        for event in release.values():
+            event.set()
+        await asyncio.gather(*tasks)
+        assert started == ["first", "small", "big"]
+
+    asyncio.run(scenario())
+
+
+def test_lone_user_gets_the_whole_pool():
+    async def scenario():
+        sched = JobScheduler(max_browsers=8, max_cpu=2)
+        started, release = [], {"a": asyncio.Event()}
+        task = asyncio.create_task(_hold(sched, started, release, "a", 1, browsers=12))
+        await _settle()
+        assert started == [("a", 8, 0)]
+        release["a"].set()
+        await task
+        assert sched.free_browsers == 8
+
+    asyncio.run(scenario())
+
+
+def test_browsers_capped_at_fair_share():
+    async def scenario():
+        sched = JobScheduler(max_browsers=8, max_cpu=2)
+        started, release = [], {n: asyncio.Event() for n in ("first", "a", "b")}
+        tasks = [asyncio.create_task(_hold(sched, started, release, "first", 1, browsers=2))]
+        await _settle()
+        tasks.append(asyncio.create_task(_hold(sched, started, release, "a", 2, browsers=8)))
+        tasks.append(asyncio.create_task(_hold(sched, started, release, "b", 3, browsers=8)))
+        await _settle()
+        # Each newcomer gets its share of the users active when it starts: 8 // 2, then 8 // 3
+        assert started == [("first", 2, 0), ("a", 4, 0), ("b", 2, 0)]
+        assert sched.free_browsers == 0
+        for event in release.values():
+            event.set()
+        await asyncio.gather(*tasks)
+        assert sched.free_browsers == 8
+
+    asyncio.run(scenario())
+
+
+def test_capacity_released_on_error_and_cancel():
+    async def scenario():
+        sched = JobScheduler(max_browsers=2, max_cpu=1)
+
+        with pytest.raises(RuntimeError):
+            async with sched.slot(1, "pdf", browsers=1, cpu=1):
+                raise RuntimeError("boom")
+        assert (sched.free_browsers, sched.free_cpu) == (2, 1)
+
+        started, release = [], {n: asyncio.Event() for n in ("running", "queued")}
+        running = asyncio.create_task(_hold(sched, started, release, "running", 1, browsers=1, cpu=1))
+        await _settle()
+        queued = asyncio.create_task(_hold(sched, started, release, "queued", 2, browsers=1, cpu=1))
+        await _settle()
+        assert sched.snapshot()["queued"] == 1
+
+        # A cancelled waiter leaves the queue without ever taking capacity
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        assert sched.snapshot()["queued"] == 0
+
+        # A cancelled running job gives its capacity back
+        running.cancel()
+        await asyncio.gather(running, return_exceptions=True)
+        assert sched.snapshot() == {"running": 0, "queued": 0, "free_browsers": 2, "free_cpu": 1}
+        assert [s[0] for s in started] == ["running"]
+
+    asyncio.run(scenario())
+
+
+def test_reserved_browsers_leave_the_pool():
+    sched = JobScheduler(max_browsers=8, max_cpu=2)
+    assert sched.reserve(4) == 4
+    assert (sched.max_browsers, sched.free_browsers) == (4, 4)
+    # The bot always keeps one browser for itself
+    assert sched.reserve(10) == 3
+    assert sched.snapshot()["free_browsers"] == 1
+
+
+def test_min_browsers_waits_for_enough_capacity():
+    async def scenario():
+        sched = JobScheduler(max_browsers=4, max_cpu=2)
+        started, release = [], {n: asyncio.Event() for n in ("a", "pipeline")}
+        tasks = [asyncio.create_task(_hold(sched, started, release, "a", 1, browsers=2))]
+        await _settle()
+        tasks.append(asyncio.create_task(_hold(sched, started, release, "pipeline", 2, browsers=6, min_browsers=3)))
+        await _settle()
+        # Two browsers are free, but the pipeline needs three: it waits rather than overrunning its grant
+        assert [s[0] for s in started] == ["a"]
+        release["a"].set()
+        await _settle()
+        assert started[1] == ("pipeline", 4, 0)
+        release["pipeline"].set()
+        await asyncio.gather(*tasks)
+
+        # Two users would get two browsers each, but the pipeline's minimum wins
+        started.clear()
+        release = {n: asyncio.Event() for n in ("a", "pipeline")}
+        tasks = [asyncio.create_task(_hold(sched, started, release, "a", 1, browsers=1))]
+        await _settle()
+        tasks.append(asyncio.create_task(_hold(sched, started, release, "pipeline", 2, browsers=6, min_browsers=3)))
+        await _settle()
+        assert started == [("a", 1, 0), ("pipeline", 3, 0)]
+        for event in release.values():
+            event.set()
+        await asyncio.gather(*tasks)
+
+        with pytest.raises(ValueError):
+            async with sched.slot(1, "pipeline", browsers=6, min_browsers=5):
+                pass
+
+    asyncio.run(scenario())
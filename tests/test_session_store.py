@@ -0,0 +1,52 @@
+import os
+
+import session_store
+from session_store import SessionExpiry, enforce_disk_quota
+
+
+def test_expiry_follows_last_activity():
+    expiry = SessionExpiry(ttl=10)
+    expiry.touch(1, now=0)
+    expiry.touch(2, now=5)
+    expiry.touch(1, now=8)  # activity pushes user 1's deadline to 18
+
+    assert expiry.next_deadline() == 15
+    assert expiry.pop_expired(now=16) == [2]
+    assert expiry.pop_expired(now=17) == []
+    assert expiry.pop_expired(now=18) == [1]
+    assert expiry.next_deadline() is None
+
+
+def test_forgotten_session_never_expires():
+    expiry = SessionExpiry(ttl=10)
+    expiry.touch(1, now=0)
+    expiry.forget(1)
+    assert expiry.pop_expired(now=100) == []
+
+
+def _write(path, size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+
+
+def test_quota_evicts_orphans_then_idle_pdfs(tmp_path):
+    root = tmp_path / "sessions"
+    _write(str(root / "orphan" / "data.jsonl"), 1000)
+    live_dir = root / "live"
+    _write(str(live_dir / "pdf" / "1.pdf"), 1000)
+    _write(str(live_dir / "pdf" / "2.pdf"), 1000)
+    session = {"user_dir": str(live_dir), "pdf_dir": str(live_dir / "pdf"), "last_active": 0}
+
+    freed = enforce_disk_quota([session], quota_bytes=1500, root=str(root))
+    assert freed == 2000
+    assert not (root / "orphan").exists()
+    assert len(os.listdir(live_dir / "pdf")) == 1
+
+
+def test_vanished_paths_are_skipped(tmp_path):
+    # A job may delete a PDF (or a whole session) while the quota check runs in its thread
+    assert session_store._remove(str(tmp_path / "missing.pdf")) == 0
+    session = {"user_dir": str(tmp_path / "gone"), "pdf_dir": str(tmp_path / "gone" / "pdf"), "last_active": 0}
+    _write(str(tmp_path / "sessions" / "orphan" / "a"), 10)
+    assert enforce_disk_quota([session], quota_bytes=0, root=str(tmp_path / "sessions")) == 10
@@ -0,0 +1,69 @@
+import asyncio
+
+import fetch_emm11_data
+from fetch_emm11_data import lookup_shared
+
+
+def _fake_lookup(calls, gate):
+    async def lookup(playwright, emm11_num, log=print):
+        calls.append(emm11_num)
+        await gate.wait()
+        return {"eMM11_num": emm11_num, "destination_district": "AGRA"}
+    return lookup
+
+
+def test_concurrent_lookups_share_one_visit(monkeypatch):
+    async def scenario():
+        calls, gate = [], asyncio.Event()
+        monkeypatch.setattr(fetch_emm11_data, "lookup_emm11", _fake_lookup(calls, gate))
+        waiters = [asyncio.create_task(lookup_shared(None, 42)) for _ in range(3)]
+        await asyncio.sleep(0)
+        gate.set()
+        results = await asyncio.gather(*waiters)
+        return calls, results
+
+    calls, results = asyncio.run(scenario())
+    assert calls == [42]
+    assert all(r == {"eMM11_num": 42, "destination_district": "AGRA"} for r in results)
+    # Every caller gets its own copy to mutate
+    assert len({id(r) for r in results}) == 3
+    assert fetch_emm11_data._inflight == {}
+
+
+def test_waiter_retries_when_leader_is_cancelled(monkeypatch):
+    async def scenario():
+        calls, gate = [], asyncio.Event()
+        monkeypatch.setattr(fetch_emm11_data, "lookup_emm11", _fake_lookup(calls, gate))
+        leader = asyncio.create_task(lookup_shared(None, 7))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(lookup_shared(None, 7))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        gate.set()
+        return calls, await waiter, leader.cancelled()
+
+    calls, result, leader_cancelled = asyncio.run(scenario())
+    assert leader_cancelled
+    assert calls == [7, 7]
+    assert result["eMM11_num"] == 7
+
+
+def test_failed_lookup_is_shared_and_only_strict_callers_see_it(monkeypatch):
+    calls = []
+
+    async def failing(playwright, emm11_num, log=print):
+        calls.append(emm11_num)
+        await asyncio.sleep(0)
+        raise fetch_emm11_data.LookupFailed(str(emm11_num))
+
+    async def scenario():
+        monkeypatch.setattr(fetch_emm11_data, "lookup_emm11", failing)
+        return await asyncio.gather(
+            lookup_shared(None, 9), lookup_shared(None, 9, strict=True), return_exceptions=True
+        )
+
+    lenient, strict = asyncio.run(scenario())
+    assert calls == [9]
+    assert lenient is None
+    assert isinstance(strict, fetch_emm11_data.LookupFailed)
@@ -0,0 +1,36 @@
+import tracing
+from tracing import TRACES, job_trace, span
+
+
+def test_total_span_cap_evicts_oldest_finished_traces(monkeypatch):
+    monkeypatch.setattr(tracing, "TRACE_MAX_TOTAL_SPANS", 10)
+    TRACES.clear()
+    monkeypatch.setattr(tracing, "_stored_spans", 0)
+
+    with job_trace("fetch", 1) as first:
+        for _ in range(5):
+            with span("lookup"):
+                pass
+    with job_trace("fetch", 2) as second:
+        for _ in range(5):
+            with span("lookup"):
+                pass
+        # No room left: the finished first trace is evicted, not this running one
+        assert first.id not in TRACES
+        assert second.id in TRACES
+    assert tracing._stored_spans == sum(len(t.events) for t in TRACES.values())
+    assert tracing._stored_spans <= 10
+
+
+def test_spans_dropped_when_only_running_traces_are_left(monkeypatch):
+    monkeypatch.setattr(tracing, "TRACE_MAX_TOTAL_SPANS", 3)
+    TRACES.clear()
+    monkeypatch.setattr(tracing, "_stored_spans", 0)
+
+    with job_trace("pdf", 1) as trace:
+        for _ in range(5):
+            with span("render"):
+                pass
+        assert len(trace.events) == 3
+        assert trace.dropped == 2
+    TRACES.clear()
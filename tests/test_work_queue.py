@@ -0,0 +1,54 @@
+from work_queue import WorkQueue
+
+
+def test_progress_reports_highest_issued_number(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite3"))
+    job_id = queue.submit("AGRA", [(1, 20)], shard_size=10)
+    first, second = queue.claim("w1"), queue.claim("w1")
+    assert queue.complete(first, "w1", [{"eMM11_num": 4}], high_water=9)
+    # A shard where nothing was issued reports no high-water mark
+    assert queue.complete(second, "w1", [], high_water=None)
+
+    progress = queue.progress(job_id)
+    assert (progress["done"], progress["total"], progress["high_water"]) == (2, 2, 9)
+    queue.close()
+
+
+def test_claims_take_turns_between_jobs(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite3"))
+    big = queue.submit("AGRA", [(1, 100)], shard_size=10)
+    small = queue.submit("MATHURA", [(1, 20)], shard_size=10)
+
+    claimed = [queue.claim(f"w{i}").job_id for i in range(4)]
+    assert claimed == [big, small, big, small]
+    queue.close()
+
+
+def test_expired_lease_is_requeued_and_late_results_dropped(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite3"))
+    job_id = queue.submit("AGRA", [(1, 10)], shard_size=10)
+    lost = queue.claim("w1", lease_seconds=-1)
+
+    # w1's lease has already run out: the next claim re-queues the shard and hands it to w2
+    retry = queue.claim("w2")
+    assert (retry.id, retry.attempts) == (lost.id, 1)
+    assert not queue.heartbeat(lost, "w1")
+    assert not queue.complete(lost, "w1", [{"eMM11_num": 1}])
+    assert queue.heartbeat(retry, "w2")
+    assert queue.complete(retry, "w2", [{"eMM11_num": 2}])
+
+    assert [record for _, record in queue.results(job_id)] == [{"eMM11_num": 2}]
+    queue.close()
+
+
+def test_shard_fails_after_max_attempts(tmp_path, monkeypatch):
+    monkeypatch.setattr("work_queue.MAX_ATTEMPTS", 2)
+    queue = WorkQueue(str(tmp_path / "queue.sqlite3"))
+    job_id = queue.submit("AGRA", [(1, 10)], shard_size=10)
+
+    queue.fail(queue.claim("w1"), "w1", "boom")
+    assert queue.progress(job_id)["queued"] == 1
+    queue.fail(queue.claim("w1"), "w1", "boom again")
+    assert queue.claim("w1") is None
+    assert queue.progress(job_id)["failed"] == 1
+    queue.close()
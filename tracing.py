@@ -0,0 +1,209 @@
+# tracing.py
+# Per-job span timelines, exportable as Chrome trace / Perfetto JSON.
+#
+# A job (fetch, login & process, PDF) opens a trace with `job_trace(...)`;
+# any `span(...)` opened while it runs -- including inside tasks it spawns --
+# is recorded with wall time and loop-thread CPU time, so waiting (network,
+# browser, queue) can be told apart from work. Traces are kept for
+# TRACE_RETENTION seconds and downloaded with the admin /trace command.
+# Stored spans are capped in total (TRACE_MAX_TOTAL_SPANS): the oldest finished
+# traces are evicted to make room, and spans are dropped once only running
+# traces are left.
+
+import asyncio
+import contextvars
+import itertools
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+TRACE_RETENTION = int(os.getenv("TRACE_RETENTION", str(24 * 3600)))
+TRACE_MAX = int(os.getenv("TRACE_MAX", "200"))          # traces kept at most
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "50000"))  # per trace
+TRACE_MAX_TOTAL_SPANS = int(os.getenv("TRACE_MAX_TOTAL_SPANS", "200000"))  # across all stored traces
+
+_current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("trace", default=None)
+_current_span: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("span", default=None)
+
+
+class Trace:
+    def __init__(self, kind: str, user_id: int, label: str = ""):
+        self.id = f"{kind}-{uuid.uuid4().hex[:8]}"
+        self.kind = kind
+        self.user_id = user_id
+        self.label = label
+        self.started_wall = time.time()
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.outcome = "running"
+        self.events: List[dict] = []
+        self.dropped = 0
+        self.stored = True  # still in TRACES, so its spans count towards TRACE_MAX_TOTAL_SPANS
+        self._lanes: Dict[int, int] = {}
+        self._lane_ids = itertools.count(1)
+
+    def lane(self) -> int:
+        """Chrome 'thread' id: one lane per asyncio task so concurrent spans don't overlap."""
+        task = asyncio.current_task() if _loop_running() else None
+        key = id(task)
+        if key not in self._lanes:
+            self._lanes[key] = next(self._lane_ids)
+        return self._lanes[key]
+
+    def add(self, event: dict):
+        global _stored_spans
+        if len(self.events) >= TRACE_MAX_SPANS or (self.stored and not _make_room(self)):
+            self.dropped += 1
+            return
+        self.events.append(event)
+        if self.stored:
+            _stored_spans += 1
+
+    @property
+    def duration(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    def to_chrome(self) -> dict:
+        """Chrome trace event format (load in chrome://tracing or ui.perfetto.dev)."""
+        meta = [{"name": "process_name", "ph": "M", "pid": 1, "tid": 0,
+                 "args": {"name": f"{self.kind} job {self.id} (user {self.user_id})"}}]
+        meta += [{"name": "thread_name", "ph": "M", "pid": 1, "tid": lane, "args": {"name": f"task {lane}"}}
+                 for lane in sorted(self._lanes.values())]
+        return {
+            "traceEvents": meta + self.events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "job_id": self.id, "kind": self.kind, "user_id": self.user_id, "label": self.label,
+                "started_at": self.started_wall, "duration_s": round(self.duration, 3),
+                "outcome": self.outcome, "dropped_spans": self.dropped,
+            },
+        }
+
+
+def _loop_running() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+# ---------- Store ----------
+TRACES: "OrderedDict[str, Trace]" = OrderedDict()
+_stored_spans = 0  # events held by the traces in TRACES
+
+
+def _evict(trace_id: str):
+    global _stored_spans
+    trace = TRACES.pop(trace_id)
+    trace.stored = False
+    _stored_spans -= len(trace.events)
+
+
+def _prune():
+    cutoff = time.time() - TRACE_RETENTION
+    while TRACES:
+        oldest = next(iter(TRACES.values()))
+        if len(TRACES) > TRACE_MAX or oldest.started_wall < cutoff:
+            _evict(oldest.id)
+        else:
+            break
+
+
+def _make_room(adding: Trace) -> bool:
+    """Evict the oldest finished traces until one more span fits; False if only running traces are left."""
+    while _stored_spans >= TRACE_MAX_TOTAL_SPANS:
+        victim = next((t for t in TRACES.values() if t.finished is not None and t is not adding), None)
+        if victim is None:
+            return False
+        _evict(victim.id)
+    return True
+
+
+def get_trace(trace_id: str) -> Optional[Trace]:
+    _prune()
+    return TRACES.get(trace_id)
+
+
+def recent_traces(limit: int = 10, user_id: int = None) -> List[Trace]:
+    _prune()
+    traces = [t for t in reversed(TRACES.values()) if user_id is None or t.user_id == user_id]
+    return traces[:limit]
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+# ---------- Recording ----------
+@contextmanager
+def job_trace(kind: str, user_id: int, label: str = ""):
+    """Start a trace for one job and make it current for everything the job runs."""
+    trace = Trace(kind, user_id, label)
+    TRACES[trace.id] = trace
+    _prune()
+    token = _current_trace.set(trace)
+    try:
+        with span(kind, cat="job", user_id=user_id, label=label):
+            yield trace
+        trace.outcome = "ok"
+    except asyncio.CancelledError:
+        trace.outcome = "cancelled"
+        raise
+    except Exception:
+        trace.outcome = "error"
+        raise
+    finally:
+        trace.finished = time.perf_counter()
+        _current_trace.reset(token)
+
+
+@contextmanager
+def span(name: str, cat: str = "stage", **args):
+    """Record a nested span in the current job trace (no-op outside a job).
+
+    Yields the span's args dict; set e.g. `args["outcome"]` inside the block.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield args
+        return
+    parent = _current_span.get()
+    token = _current_span.set(name)
+    started = time.perf_counter()
+    cpu_started = time.thread_time()
+    outcome = "ok"
+    try:
+        yield args
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    except Exception as e:
+        outcome = f"error: {type(e).__name__}"
+        raise
+    finally:
+        _current_span.reset(token)
+        wall = time.perf_counter() - started
+        # CPU spent on the event-loop thread while the span was open; the rest is waiting
+        cpu = min(wall, time.thread_time() - cpu_started)
+        event_args = {k: str(v) for k, v in args.items()}
+        event_args.update({
+            "outcome": event_args.get("outcome", outcome),
+            "parent": parent or "",
+            "cpu_ms": round(cpu * 1000, 3),
+            "wait_ms": round((wall - cpu) * 1000, 3),
+        })
+        trace.add({
+            "name": name, "cat": cat, "ph": "X", "pid": 1, "tid": trace.lane(),
+            "ts": round((started - trace.started) * 1e6, 1),
+            "dur": round(wall * 1e6, 1),
+            "args": event_args,
+        })
+
+
+def export_chrome_json(trace: Trace) -> bytes:
+    return json.dumps(trace.to_chrome()).encode("utf-8")
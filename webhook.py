@@ -0,0 +1,99 @@
+# webhook.py
+# Webhook ingestion: Telegram POSTs updates to our embedded HTTP server and
+# they go straight onto the application's update queue. Polling (bot.py's
+# default) stays available for local development.
+#
+# Every update must carry WEBHOOK_SECRET in Telegram's secret-token header;
+# webhook mode refuses to start without one, since anyone who can reach the
+# listener could otherwise post forged updates (admin commands included). The
+# listener binds to localhost by default, behind a TLS-terminating proxy.
+
+import asyncio
+import hmac
+import logging
+import os
+import signal
+
+from telegram import Update
+
+from http_server import HTTPServer, Request, Response
+
+logger = logging.getLogger("up-mines-bot.webhook")
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")            # public https URL Telegram should call
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")  # set 0.0.0.0 only when nothing fronts the bot
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")        # required in webhook mode
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "32"))  # concurrent update handlers
+DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "30"))
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+
+def webhook_handler(app, secret: str = None):
+    """Build the HTTP handler that validates and enqueues incoming updates."""
+    secret = WEBHOOK_SECRET if secret is None else secret
+
+    async def handle(request: Request) -> Response:
+        if not secret or not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), secret):
+            logger.warning("Rejected webhook call with bad secret from %s", request.remote)
+            return Response("forbidden", 403)
+        try:
+            update = Update.de_json(request.json(), app.bot)
+        except Exception as e:
+            logger.warning("Malformed webhook payload: %s", e)
+            return Response("bad update", 400)
+        await app.update_queue.put(update)
+        return Response("ok")
+    return handle
+
+
+async def _wait_for_queue_drain(app, timeout: float):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while app.update_queue.qsize() and loop.time() < deadline:
+        await asyncio.sleep(0.1)
+
+
+async def run_webhook(app, stop_event: asyncio.Event = None, server: HTTPServer = None, webhook_url: str = None):
+    """Serve updates over a webhook until stop_event is set (or SIGINT/SIGTERM), then drain."""
+    if not WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_SECRET must be set in webhook mode, otherwise anyone can post forged updates")
+    webhook_url = WEBHOOK_URL if webhook_url is None else webhook_url
+    stop_event = stop_event or asyncio.Event()
+    server = server or HTTPServer(WEBHOOK_LISTEN, WEBHOOK_PORT)
+    server.route("POST", WEBHOOK_PATH, webhook_handler(app))
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # not supported on this platform / not the main thread
+
+    await app.initialize()
+    await app.start()
+    await server.start()
+    if app.post_init:
+        await app.post_init(app)
+    if webhook_url:
+        await app.bot.set_webhook(
+            url=webhook_url.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            max_connections=min(100, max(1, WEBHOOK_WORKERS)),
+            drop_pending_updates=False,
+        )
+    logger.info("🤖 Bot is serving webhook on %s:%s%s", server.host, server.port, WEBHOOK_PATH)
+
+    try:
+        await stop_event.wait()
+    finally:
+        # Graceful drain: stop taking requests, let queued updates run, then stop handlers
+        logger.info("Draining webhook...")
+        await server.stop(DRAIN_TIMEOUT)
+        await _wait_for_queue_drain(app, DRAIN_TIMEOUT)
+        await app.stop()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+        await app.shutdown()
+        logger.info("Webhook stopped.")
@@ -0,0 +1,258 @@
+# work_queue.py
+# Durable local work queue for sharded scans (SQLite with leases).
+#
+# The bot splits a scan into number-range shards and submits them here;
+# worker processes (worker.py) claim a shard under a time-limited lease, fetch
+# it and write the matches back. Claims take turns between jobs, so one big
+# scan does not hold up the others. A worker that dies stops renewing its lease, and the shard is
+# re-queued for someone else; results from a lease that was lost are
+# discarded, so every shard is reported exactly once.
+#
+# SQLite's WAL mode needs shared memory, so the queue file must sit on a local
+# disk and every worker must run on the same host as the bot. It does not work
+# over NFS/SMB; spreading workers across hosts needs a networked queue instead.
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import namedtuple
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from scan_state import STATE_DIR
+
+logger = logging.getLogger("up-mines-bot.work-queue")
+
+WORK_QUEUE_PATH = os.getenv("WORK_QUEUE_PATH", os.path.join(STATE_DIR, "work_queue.sqlite3"))
+SCAN_BACKEND = os.getenv("SCAN_BACKEND", "inprocess")     # "inprocess" or "queue"
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", "0"))        # local worker processes the bot starts (queue backend)
+WORKER_BROWSERS = int(os.getenv("WORKER_BROWSERS", "0"))  # browsers those workers share in total (0 = half of MAX_BROWSERS)
+SHARD_SIZE = int(os.getenv("SHARD_SIZE", "100"))          # numbers per shard
+LEASE_SECONDS = float(os.getenv("LEASE_SECONDS", "60"))
+MAX_ATTEMPTS = int(os.getenv("SHARD_MAX_ATTEMPTS", "3"))
+POLL_INTERVAL = 0.5                                       # seconds between result polls
+JOB_RETENTION = 24 * 3600                                 # abandoned jobs are purged after this
+
+Shard = namedtuple("Shard", "id job_id district start end attempts")
+
+
+class WorkQueue:
+    def __init__(self, path: str = WORK_QUEUE_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        # isolation_level=None: transactions are explicit (BEGIN IMMEDIATE takes the write lock up front)
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY, district TEXT NOT NULL, created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS shards (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL, start_num INTEGER NOT NULL, end_num INTEGER NOT NULL,
+                state TEXT NOT NULL DEFAULT 'queued',          -- queued | leased | done | failed
+                owner TEXT, lease_expires REAL, attempts INTEGER NOT NULL DEFAULT 0, error TEXT,
+                high_water INTEGER                             -- highest issued number the shard saw
+            );
+            CREATE INDEX IF NOT EXISTS shards_by_state ON shards (state, id);
+            CREATE INDEX IF NOT EXISTS shards_by_job ON shards (job_id, state, id);
+            CREATE TABLE IF NOT EXISTS results (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT NOT NULL, record TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS results_by_job ON results (job_id, id);
+        """)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(shards)")}
+        if "high_water" not in columns:  # queue file from before high-water tracking
+            self._db.execute("ALTER TABLE shards ADD COLUMN high_water INTEGER")
+
+    def _tx(self, fn):
+        """Run fn(db) in one write transaction."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+    # ---------- Producer (bot) ----------
+    def submit(self, district: str, ranges: Iterable[Tuple[int, int]], shard_size: int = SHARD_SIZE) -> str:
+        job_id = uuid.uuid4().hex[:12]
+        shards = [
+            (job_id, lo, min(lo + shard_size - 1, end))
+            for start, end in ranges
+            for lo in range(start, end + 1, shard_size)
+        ]
+
+        def insert(db):
+            db.execute("INSERT INTO jobs VALUES (?, ?, ?)", (job_id, district, time.time()))
+            db.executemany("INSERT INTO shards (job_id, start_num, end_num) VALUES (?, ?, ?)", shards)
+        self._tx(insert)
+        return job_id
+
+    def results(self, job_id: str, after_id: int = 0, limit: int = 1000) -> List[Tuple[int, dict]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, record FROM results WHERE job_id = ? AND id > ? ORDER BY id LIMIT ?",
+                (job_id, after_id, limit),
+            ).fetchall()
+        return [(rid, json.loads(record)) for rid, record in rows]
+
+    def progress(self, job_id: str) -> Dict[str, int]:
+        """Shard counts by state, their total, and the highest issued number seen so far (0 if none)."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT state, COUNT(*) FROM shards WHERE job_id = ? GROUP BY state", (job_id,)
+            ).fetchall()
+            high_water = self._db.execute(
+                "SELECT MAX(high_water) FROM shards WHERE job_id = ? AND state = 'done'", (job_id,)
+            ).fetchone()[0]
+        counts = {"queued": 0, "leased": 0, "done": 0, "failed": 0}
+        counts.update(dict(rows))
+        counts["total"] = sum(counts.values())
+        counts["high_water"] = high_water or 0
+        return counts
+
+    def purge(self, job_id: str):
+        """Drop a job with everything it produced (also stops unclaimed shards)."""
+        def delete(db):
+            for table, column in (("results", "job_id"), ("shards", "job_id"), ("jobs", "id")):
+                db.execute(f"DELETE FROM {table} WHERE {column} = ?", (job_id,))
+        self._tx(delete)
+
+    def purge_older(self, age: float = JOB_RETENTION) -> int:
+        """Remove jobs left behind by a bot that crashed mid-scan."""
+        with self._lock:
+            stale = [row[0] for row in self._db.execute(
+                "SELECT id FROM jobs WHERE created_at < ?", (time.time() - age,))]
+        for job_id in stale:
+            self.purge(job_id)
+        return len(stale)
+
+    # ---------- Consumer (worker) ----------
+    def claim(self, owner: str, lease_seconds: float = LEASE_SECONDS) -> Optional[Shard]:
+        """Lease a queued shard (re-queuing expired leases first), or None.
+
+        The shard comes from the job with the fewest shards in flight, oldest job
+        first on ties, so concurrent scans share the workers instead of queuing
+        behind each other.
+        """
+        def take(db):
+            now = time.time()
+            self._requeue_expired(db, now)
+            job = db.execute(
+                "SELECT job_id FROM shards WHERE state IN ('queued', 'leased') GROUP BY job_id "
+                "HAVING SUM(state = 'queued') > 0 ORDER BY SUM(state = 'leased'), MIN(id) LIMIT 1"
+            ).fetchone()
+            if job is None:
+                return None
+            row = db.execute(
+                "SELECT s.id, s.job_id, j.district, s.start_num, s.end_num, s.attempts FROM shards s "
+                "JOIN jobs j ON j.id = s.job_id WHERE s.job_id = ? AND s.state = 'queued' ORDER BY s.id LIMIT 1",
+                (job[0],),
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE shards SET state = 'leased', owner = ?, lease_expires = ? WHERE id = ?",
+                (owner, now + lease_seconds, row[0]),
+            )
+            return Shard(*row)
+        return self._tx(take)
+
+    def heartbeat(self, shard: Shard, owner: str, lease_seconds: float = LEASE_SECONDS) -> bool:
+        """Extend the lease. False if it was lost (expired and re-queued, or job purged)."""
+        def extend(db):
+            cur = db.execute(
+                "UPDATE shards SET lease_expires = ? WHERE id = ? AND owner = ? AND state = 'leased'",
+                (time.time() + lease_seconds, shard.id, owner),
+            )
+            return cur.rowcount == 1
+        return self._tx(extend)
+
+    def complete(self, shard: Shard, owner: str, records: Iterable[dict], high_water: int = None) -> bool:
+        """Store the shard's matches and mark it done, only if the lease is still ours."""
+        rows = [(shard.job_id, json.dumps(dict(r), ensure_ascii=False)) for r in records]
+
+        def finish(db):
+            cur = db.execute(
+                "UPDATE shards SET state = 'done', lease_expires = NULL, high_water = ? "
+                "WHERE id = ? AND owner = ? AND state = 'leased'",
+                (high_water, shard.id, owner),
+            )
+            if cur.rowcount != 1:
+                return False
+            db.executemany("INSERT INTO results (job_id, record) VALUES (?, ?)", rows)
+            return True
+        return self._tx(finish)
+
+    def fail(self, shard: Shard, owner: str, error: str):
+        """Give the shard back for another attempt (or mark it failed after MAX_ATTEMPTS)."""
+        def release(db):
+            db.execute(
+                "UPDATE shards SET state = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'queued' END, "
+                "attempts = attempts + 1, owner = NULL, lease_expires = NULL, error = ? "
+                "WHERE id = ? AND owner = ? AND state = 'leased'",
+                (MAX_ATTEMPTS, error[:500], shard.id, owner),
+            )
+        self._tx(release)
+
+    @staticmethod
+    def _requeue_expired(db, now: float):
+        cur = db.execute(
+            "UPDATE shards SET state = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'queued' END, "
+            "attempts = attempts + 1, owner = NULL, lease_expires = NULL, error = 'lease expired' "
+            "WHERE state = 'leased' AND lease_expires < ?",
+            (MAX_ATTEMPTS, now),
+        )
+        if cur.rowcount:
+            logger.warning("Re-queued %d shard(s) with expired leases", cur.rowcount)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_queue: Optional[WorkQueue] = None
+
+
+def get_work_queue() -> WorkQueue:
+    global _queue
+    if _queue is None:
+        _queue = WorkQueue()
+    return _queue
+
+
+async def run_sharded_scan(
+    ranges: List[Tuple[int, int]],
+    district: str,
+    on_result: Callable[[dict], Awaitable[None]],
+    on_progress: Callable[[Dict[str, int]], None] = None,
+    queue: WorkQueue = None,
+) -> Dict[str, int]:
+    """Submit a scan to the workers and stream its matches back until every shard is settled."""
+    queue = queue or get_work_queue()
+    job_id = await asyncio.to_thread(queue.submit, district, ranges)
+    last_id = 0
+    try:
+        while True:
+            # Read progress before results so nothing written in between is missed
+            progress = await asyncio.to_thread(queue.progress, job_id)
+            rows = await asyncio.to_thread(queue.results, job_id, last_id)
+            for last_id, record in rows:
+                await on_result(record)
+            if on_progress:
+                on_progress(progress)
+            if progress["done"] + progress["failed"] == progress["total"] and not rows:
+                return progress
+            if not rows:
+                await asyncio.sleep(POLL_INTERVAL)
+    finally:
+        await asyncio.to_thread(queue.purge, job_id)
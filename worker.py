@@ -0,0 +1,131 @@
+# worker.py
+# Scan worker: claims number-range shards from the shared work queue
+# (work_queue.py), fetches them and writes the matches back for the bot.
+#
+#   python worker.py --processes 4 --browsers 8   # 4 processes sharing 8 browsers
+#   SCAN_BACKEND=queue python bot.py              # bot submits scans to the queue
+#
+# Run it on the bot's host (the queue is SQLite on a local disk). --browsers
+# is the budget for all processes together, so the workers stay within the
+# host's MAX_BROWSERS alongside the bot. Each process keeps its lease alive
+# while fetching, and a shard whose worker dies is re-queued.
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+
+from work_queue import LEASE_SECONDS, WORK_QUEUE_PATH, WORKER_BROWSERS, WorkQueue
+
+logger = logging.getLogger("up-mines-bot.worker")
+
+IDLE_POLL = 1.0  # seconds between claims when the queue is empty
+
+
+async def keep_lease(queue: WorkQueue, shard, owner: str):
+    """Renew the shard's lease until cancelled; returns if the lease was lost."""
+    while True:
+        await asyncio.sleep(LEASE_SECONDS / 3)
+        if not await asyncio.to_thread(queue.heartbeat, shard, owner):
+            return
+
+
+async def process_shard(queue: WorkQueue, shard, owner: str, concurrency: int):
+    from fetch_emm11_data import fetch_emm11_data
+
+    logger.info("%s: shard %s (%s-%s, %s)", owner, shard.id, shard.start, shard.end, shard.district)
+    issued = []
+    fetch = asyncio.create_task(fetch_emm11_data(
+        shard.start, shard.end, shard.district,
+        log=lambda msg: logger.debug(msg), concurrency=concurrency, on_issued=issued.append,
+    ))
+    lease = asyncio.create_task(keep_lease(queue, shard, owner))
+    try:
+        await asyncio.wait({fetch, lease}, return_when=asyncio.FIRST_COMPLETED)
+        if not fetch.done():
+            logger.warning("%s: lost the lease on shard %s; abandoning it", owner, shard.id)
+            fetch.cancel()
+            return
+        records = fetch.result()
+        if not await asyncio.to_thread(queue.complete, shard, owner, records, max(issued, default=None)):
+            logger.warning("%s: shard %s was re-queued before it finished; results dropped", owner, shard.id)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.warning("%s: shard %s failed: %s", owner, shard.id, e)
+        await asyncio.to_thread(queue.fail, shard, owner, f"{type(e).__name__}: {e}")
+    finally:
+        lease.cancel()
+        if not fetch.done():
+            fetch.cancel()
+
+
+async def run_worker(concurrency: int):
+    queue = WorkQueue()
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    logger.info("Worker %s polling %s", owner, WORK_QUEUE_PATH)
+    while True:
+        shard = await asyncio.to_thread(queue.claim, owner)
+        if shard is None:
+            await asyncio.sleep(IDLE_POLL)
+            continue
+        await process_shard(queue, shard, owner, concurrency)
+
+
+def _process_main(concurrency: int):
+    logging.basicConfig(format="%(asctime)s | %(levelname)s | %(name)s | %(message)s", level=logging.INFO)
+    try:
+        asyncio.run(run_worker(concurrency))
+    except KeyboardInterrupt:
+        pass
+
+
+def split_browsers(budget: int, processes: int, concurrency: int):
+    """(processes, browsers per process) that keep all processes within `budget` browsers."""
+    budget = max(1, budget)
+    processes = max(1, min(processes, budget))
+    return processes, max(1, min(concurrency, budget // processes))
+
+
+def main():
+    from fetch_emm11_data import CONCURRENCY_LIMIT
+    from scheduler import MAX_BROWSERS
+
+    parser = argparse.ArgumentParser(description="Sharded eMM11 scan worker")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--browsers", type=int, default=WORKER_BROWSERS or max(1, MAX_BROWSERS // 2),
+                        help="browsers all processes share")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY_LIMIT, help="most browsers per process")
+    args = parser.parse_args()
+
+    processes, concurrency = split_browsers(args.browsers, args.processes, args.concurrency)
+    if processes < args.processes:
+        logger.warning("Only %d browser(s) to share; running %d process(es)", args.browsers, processes)
+
+    if processes <= 1:
+        _process_main(concurrency)
+        return
+
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=_process_main, args=(concurrency,), daemon=True) for _ in range(processes)]
+    for proc in procs:
+        proc.start()
+    # SIGTERM (e.g. from the bot shutting down) should take the children with us
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        for proc in procs:
+            proc.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for proc in procs:
+            if proc.is_alive():
+                proc.terminate()
+
+
+if __name__ == "__main__":
+    main()